@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Пропускная способность и точность прогноза многих рядов (src/forecasting.py).
+
+Генерируются синтетические месячные количества заявок (пуассоновские, с
+уровнем, трендом и годовой сезонностью, как у рядов по регионам) для
+нескольких чисел рядов. Для каждого числа рядов измеряется время прогноза
+с автоматическим выбором модели и число рядов в секунду, а для первого -
+ошибка (MAE) и доля попаданий в интервал по каждой модели на скользящей
+проверке.
+
+Запуск из папки Pet911_build:
+
+python3 benchmarks/forecasting.py
+python3 benchmarks/forecasting.py --series 1000 100000 --periods 24 --horizon 6
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import forecasting  # noqa: E402
+from src.deps import np  # noqa: E402
+
+DEFAULT_SERIES = [100, 1000, 10000, 100000]
+
+
+def synthetic_series(count, periods, seed=0):
+    """Месячные количества заявок: уровень, тренд и годовая сезонность с пуассоновским шумом"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(periods)
+    level = rng.lognormal(mean=2.0, sigma=1.0, size=(count, 1))
+    trend = 1 + rng.uniform(-0.01, 0.02, size=(count, 1)) * t
+    season = 1 + rng.uniform(0, 0.4, size=(count, 1)) * np.sin(2 * np.pi * (t + rng.integers(0, 12, (count, 1))) / 12)
+    return rng.poisson(level * trend * season).astype(float)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пропускная способность и точность прогноза многих рядов')
+    parser.add_argument('--series', type=int, nargs='+', default=DEFAULT_SERIES, help='числа рядов')
+    parser.add_argument('--periods', type=int, default=36, help='длина рядов (месяцев)')
+    parser.add_argument('--horizon', type=int, default=3, help='горизонт прогноза')
+    args = parser.parse_args()
+
+    print(f"📈 Прогноз на {args.horizon} мес. по рядам длины {args.periods}")
+    print(f"   {'рядов':>10}{'время, с':>12}{'рядов/с':>12}")
+    for count in args.series:
+        values = synthetic_series(count, args.periods)
+        result = forecasting.forecast(values, args.horizon)
+        print(f"   {count:>10}{result['elapsed']:>12.2f}{result['series_per_second']:>12.0f}")
+
+    values = synthetic_series(args.series[0], args.periods)
+    report = forecasting.backtest(values, horizon=args.horizon)
+    print(f"\n🎯 Проверка на {args.series[0]} рядах ({report['origins']} точек, интервал "
+          f"{forecasting.DEFAULT_LEVEL:.0%}):")
+    print(f"   {'модель':<32}{'MAE':>8}{'покрытие':>10}")
+    for name, scores in report['scores'].items():
+        print(f"   {forecasting.MODEL_TITLES[name]:<32}{np.mean(scores['mae']):>8.2f}{np.mean(scores['coverage']):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Время отрисовки и размер файлов диаграмм в каждом профиле вывода.
+
+Шаги конвейера (кроме интерактивного step_3_2) выполняются один раз во
+временной папке, описания их диаграмм собираются без отрисовки. Затем
+каждая диаграмма рисуется в каждом профиле в текущем процессе: измеряется
+время отрисовки с сохранением и размер записанных файлов.
+
+Запуск из папки Pet911_build:
+
+python3 benchmarks/render_profiles.py
+python3 benchmarks/render_profiles.py --charts --profiles preview publication
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.config import results_dir  # noqa: E402
+from src.pipeline import STEPS, run_step  # noqa: E402
+from src.rendering import DEFAULT_PROFILE, PROFILES, capture_charts, render_chart  # noqa: E402
+
+
+def output_files(directory):
+    """Файлы папки результатов и время их изменения"""
+    files = {}
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(folder, name)
+            files[path] = os.stat(path).st_mtime_ns
+    return files
+
+
+def collect_charts():
+    """Выполняет шаги с диаграммами и возвращает описания диаграмм [(шаг, подпись, описание)]"""
+    charts = []
+    for step in STEPS:
+        if step.get('interactive'):
+            continue
+        with capture_charts() as captured, contextlib.redirect_stdout(io.StringIO()):
+            run_step(step)
+        charts.extend((step['name'], label, payload) for label, payload in captured)
+    return charts
+
+
+def render_profile(charts, profile):
+    """Рисует все диаграммы в профиле; возвращает [(шаг, подпись, время, байты)]"""
+    rows = []
+    for step_name, label, payload in charts:
+        before = output_files(results_dir())
+        duration = render_chart(payload, profile)
+        after = output_files(results_dir())
+        written = [path for path, mtime in after.items() if before.get(path) != mtime]
+        rows.append((step_name, label, duration, sum(os.path.getsize(path) for path in written)))
+    return rows
+
+
+def run_benchmark(profiles):
+    """Результаты по профилям {профиль: строки render_profile}"""
+    workdir = tempfile.mkdtemp(prefix='pet911_profiles_')
+    cwd = os.getcwd()
+    try:
+        os.symlink(os.path.join(ROOT, 'data'), os.path.join(workdir, 'data'))
+        os.chdir(workdir)
+        print("📊 Сбор диаграмм шагов конвейера...")
+        charts = collect_charts()
+        print(f"✅ Собрано диаграмм: {len(charts)}")
+        return {profile: render_profile(charts, profile) for profile in profiles}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(results, show_charts=False):
+    baseline = results.get(DEFAULT_PROFILE)
+    base_time = sum(row[2] for row in baseline) if baseline else None
+    base_bytes = sum(row[3] for row in baseline) if baseline else None
+
+    if show_charts:
+        for profile, rows in results.items():
+            print(f"\n🖼 {profile}")
+            for step_name, label, duration, size in rows:
+                print(f"   {step_name:<10} {label:<50} {duration:7.2f} с {size / 1024:10.1f} КБ")
+
+    print(f"\n{'Профиль':<12} {'диаграмм':>9} {'время, с':>10} {'размер, МБ':>11} {'время':>8} {'размер':>8}")
+    for profile, rows in results.items():
+        total_time = sum(row[2] for row in rows)
+        total_bytes = sum(row[3] for row in rows)
+        line = f"{profile:<12} {len(rows):>9} {total_time:>10.2f} {total_bytes / 1024 ** 2:>11.2f}"
+        if base_time:
+            line += f" {total_time / base_time:>7.0%} {total_bytes / base_bytes:>7.0%}"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Время отрисовки и размер диаграмм по профилям вывода')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES),
+                        help='профили для сравнения')
+    parser.add_argument('--charts', action='store_true', help='показать время и размер каждой диаграммы')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print_results(run_benchmark(args.profiles), args.charts)
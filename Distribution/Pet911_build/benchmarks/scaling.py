@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Масштабирование шагов конвейера на синтетических датасетах.
+
+Для каждого масштаба (по умолчанию 1×, 10×, 100× и 1000× от исходных
+датасетов) генерируются синтетические lost/found (src/synthetic.py,
+сгенерированные файлы переиспользуются), и каждый шаг запускается в
+отдельном процессе main.py без параллельных процессов. Измеряются время
+процесса, пиковая память (max RSS) и время этапов шага: загрузка,
+подготовка, вычисления, диаграммы, сохранение (src/phases.py).
+
+Результаты дописываются в историю benchmarks/results/scaling.jsonl, а в
+таблице рядом со временем показано изменение относительно предыдущего
+запуска с тем же шагом и масштабом.
+
+Запуск из папки Pet911_build:
+
+python3 benchmarks/scaling.py
+python3 benchmarks/scaling.py --scales 1 10 --steps step_1_1 step_5 --timeout 600
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import phases, synthetic  # noqa: E402
+from src.deps import pd  # noqa: E402
+from src.pipeline import STEPS  # noqa: E402
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+DEFAULT_STEPS = [step['name'] for step in STEPS if not step.get('interactive')]
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'pet911_synthetic')
+DEFAULT_HISTORY = os.path.join(ROOT, 'benchmarks', 'results', 'scaling.jsonl')
+
+# ru_maxrss: килобайты в Linux, байты в macOS
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def synthetic_data(data_dir, scale, seed):
+    """Синтетические датасеты масштаба scale; готовые файлы переиспользуются"""
+    directory = os.path.join(data_dir, f'x{scale:g}')
+    marker = os.path.join(directory, '.complete')
+    expected = {'scale': scale, 'seed': seed}
+
+    if os.path.exists(marker):
+        with open(marker, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if {key: info.get(key) for key in expected} == expected:
+            return info['paths'], info['rows']
+
+    print(f"🧪 Генерация датасетов {scale:g}×")
+    paths = synthetic.generate(directory, scale, seed)
+    rows = {ad_type: count_rows(path) for ad_type, path in paths.items()}
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump(dict(expected, paths=paths, rows=rows), f, ensure_ascii=False)
+    return paths, rows
+
+
+def count_rows(path):
+    """Число объявлений в CSV (описания могут содержать переводы строк, поэтому читаем парсером)"""
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=1_000_000))
+
+
+def run_step_process(step, paths, output_dir, timeout=None, chunksize=None):
+    """
+    Запускает шаг в отдельном процессе main.py.
+    Возвращает (статус, время, пиковая память в МБ, этапы {этап: секунды}).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    phase_log = os.path.join(output_dir, 'phases.jsonl')
+    command = [sys.executable, os.path.join(ROOT, 'main.py'), '--only', step, '--non-interactive',
+               '--lost', paths['lost'], '--found', paths['found'],
+               '--output-dir', os.path.join(output_dir, 'results'),
+               '--partitions', os.path.join(output_dir, 'partitioned'),
+               '--workers', '1', '--render-workers', '0']
+    if chunksize:
+        command += ['--chunksize', str(chunksize)]
+
+    with open(os.path.join(output_dir, 'run.log'), 'w', encoding='utf-8') as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=ROOT, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                                   env=dict(os.environ, **{phases.ENV_VAR: phase_log}))
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        # wait4 возвращает ресурсы именно этого процесса, в том числе max RSS
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if timer:
+            timer.cancel()
+
+    if process.returncode == 0:
+        result = 'ok'
+    elif timed_out.is_set():
+        result = 'timeout'
+    else:
+        result = 'failed'
+
+    records = [record for record in phases.read_log(phase_log) if record['step'] == step]
+    step_phases = {name: entry['wall'] for name, entry in records[-1]['phases'].items()} if records else {}
+    return result, wall, usage.ru_maxrss * RSS_UNIT / 1024 ** 2, step_phases
+
+
+def run_benchmark(scales, steps, data_dir, seed=0, timeout=None, chunksize=None):
+    """Запускает шаги на всех масштабах, возвращает строки результатов"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='pet911_scaling_') as workdir:
+        for scale in scales:
+            paths, rows = synthetic_data(data_dir, scale, seed)
+            for step in steps:
+                output_dir = os.path.join(workdir, f'x{scale:g}', step)
+                print(f"⏱ {step} на {scale:g}× ({rows['lost']} + {rows['found']} объявлений)...")
+                status, wall, rss, step_phases = run_step_process(step, paths, output_dir, timeout, chunksize)
+                if status != 'ok':
+                    print(f"❌ {step} на {scale:g}×: {status}, журнал:")
+                    with open(os.path.join(output_dir, 'run.log'), 'r', encoding='utf-8') as f:
+                        print(f.read()[-2000:].rstrip())
+                results.append({
+                    'scale': scale,
+                    'step': step,
+                    'rows': rows,
+                    'status': status,
+                    'wall': round(wall, 3),
+                    'max_rss_mb': round(rss, 1),
+                    'phases': step_phases,
+                })
+    return results
+
+
+# ----------------------------- История запусков -----------------------------
+def git_commit():
+    """Короткий хэш текущего коммита или None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_results(history):
+    """Последний успешный результат для каждой пары (масштаб, шаг)"""
+    previous = {}
+    for run in history:
+        for row in run['results']:
+            if row['status'] == 'ok':
+                previous[(row['scale'], row['step'])] = row
+    return previous
+
+
+def save_run(path, results, seed, chunksize):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'chunksize': chunksize,
+        'results': results,
+    }
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, ensure_ascii=False) + '\n')
+
+
+def print_results(results, previous):
+    columns = ''.join(f"{name:>11}" for name in phases.PHASES)
+    print(f"\n{'Масштаб':>8} {'Шаг':<9} {'строк':>10} {'время, с':>9} {'Δ':>7} {'RSS, МБ':>9}{columns}")
+    for row in results:
+        rows = sum(row['rows'].values())
+        line = f"{row['scale']:>7g}× {row['step']:<9} {rows:>10} "
+        if row['status'] != 'ok':
+            print(line + row['status'])
+            continue
+
+        before = previous.get((row['scale'], row['step']))
+        change = f"{row['wall'] / before['wall'] - 1:+.0%}" if before and before['wall'] else ''
+        line += f"{row['wall']:>9.2f} {change:>7} {row['max_rss_mb']:>9.0f}"
+        line += ''.join(f"{row['phases'].get(name, 0.0):>11.2f}" for name in phases.PHASES)
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Масштабирование шагов конвейера на синтетических данных')
+    parser.add_argument('--scales', type=float, nargs='+', default=DEFAULT_SCALES,
+                        help='размеры датасетов относительно исходных')
+    parser.add_argument('--steps', nargs='+', choices=DEFAULT_STEPS, default=DEFAULT_STEPS)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='папка для синтетических датасетов')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=None, help='предельное время шага, с')
+    parser.add_argument('--chunksize', type=int, default=None, help='потоковая обработка частями по N строк')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='файл истории запусков (JSON Lines)')
+    parser.add_argument('--no-save', action='store_true', help='не дописывать результаты в историю')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    benchmark_results = run_benchmark(args.scales, args.steps, args.data_dir, args.seed, args.timeout,
+                                      args.chunksize)
+    print_results(benchmark_results, previous_results(load_history(args.history)))
+    if not args.no_save:
+        save_run(args.history, benchmark_results, args.seed, args.chunksize)
+        print(f"\n💾 Результаты добавлены в {args.history}")
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Задержка HTTP-сервиса прогноза (src/service.py) под параллельной нагрузкой.
+
+Сервис запускается отдельным процессом на свободном порту; несколько
+клиентов одновременно отправляют по keep-alive соединению запросы POST
+/predict со случайными объявлениями (и, если задано, POST /predict/batch).
+Выводятся задержка на стороне клиентов (p50, p99, max), число запросов в
+секунду и задержка обработки по /metrics сервиса.
+
+Статистика step_3_1 должна быть уже посчитана в папке результатов.
+
+Запуск из папки Pet911_build:
+
+python3 benchmarks/service.py
+python3 benchmarks/service.py --clients 64 --requests 500 --batch-size 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import config  # noqa: E402
+
+ANIMALS = ['собака', 'кошка', 'птица', 'другой', 'грызун']
+REGIONS = ['Moskva', 'Moskovskaya Oblast', 'Kolomna', 'Tver', '']
+
+
+def random_ad(rng):
+    return {
+        'ad_type': rng.choice(['lost', 'found']),
+        'animal_type': rng.choice(ANIMALS),
+        'has_photos': rng.choice(['да', 'нет']),
+        'photo_count': rng.randint(0, 8),
+        'has_description': rng.choice(['да', 'нет']),
+        'desc_length': rng.randint(0, 150),
+        'has_contacts': rng.choice(['да', 'нет']),
+        'region': rng.choice(REGIONS),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+                 .encode('latin1') + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = next(int(line.split(b':', 1)[1]) for line in head.split(b'\r\n')
+                  if line.lower().startswith(b'content-length'))
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(port, count, seed, latencies, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for _ in range(count):
+        started = time.perf_counter()
+        status, _ = await request(reader, writer, 'POST', '/predict', random_ad(rng))
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status != 200:
+            errors.append(status)
+    writer.close()
+
+
+async def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await request(reader, writer, 'GET', '/health')
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Сервис не запустился")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def run(args, port):
+    await wait_ready(port)
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, args.requests, seed, latencies, errors) for seed in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    print(f"🚀 POST /predict: {args.clients} клиентов × {args.requests} запросов, ошибок: {len(errors)}")
+    print(f"   клиент: p50 {percentile(latencies, 0.5):.2f} мс, p99 {percentile(latencies, 0.99):.2f} мс, "
+          f"max {max(latencies):.2f} мс, {len(latencies) / elapsed:.0f} запросов/с")
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    if args.batch_size:
+        rng = random.Random(0)
+        ads = [random_ad(rng) for _ in range(args.batch_size)]
+        started = time.perf_counter()
+        status, _ = await request(reader, writer, 'POST', '/predict/batch', {'ads': ads})
+        batch_elapsed = time.perf_counter() - started
+        print(f"📦 POST /predict/batch: {args.batch_size} объявлений за {batch_elapsed * 1000:.0f} мс "
+              f"({args.batch_size / batch_elapsed:.0f} объявлений/с, код {status})")
+
+    _, metrics = await request(reader, writer, 'GET', '/metrics')
+    writer.close()
+    latency = metrics['latency_ms']
+    print(f"   сервис: p50 {latency['p50']} мс, p90 {latency['p90']} мс, p99 {latency['p99']} мс, "
+          f"max {latency['max']} мс (последние {latency['window']} запросов)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержка HTTP-сервиса прогноза под нагрузкой')
+    parser.add_argument('--clients', type=int, default=32, help='число одновременных клиентов')
+    parser.add_argument('--requests', type=int, default=200, help='запросов на клиента')
+    parser.add_argument('--batch-size', type=int, default=1000, help='объявлений в пакетном запросе (0 - без него)')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR, help='папка результатов')
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'src.service', '--port', str(port),
+                               '--output-dir', args.output_dir],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(run(args, port))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Время холодного старта точек входа.
+
+Каждая точка входа запускается в отдельном процессе интерпретатора с
+флагом -X importtime: измеряется полное время процесса и суммарное время
+импортов, выводятся самые тяжелые модули верхнего уровня.
+
+Запуск из папки Pet911_build (для прогноза нужна статистика step_3_1
+в папке results):
+
+python3 benchmarks/startup.py
+python3 benchmarks/startup.py --repeat 5 --top 10
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    'main.py --help': ['main.py', '--help'],
+    'import src': ['-c', 'import src'],
+    'src.pipeline': ['-c', 'import src.pipeline'],
+    'src.step_1_1': ['-c', 'import src.step_1_1'],
+    'src.step_1_2': ['-c', 'import src.step_1_2'],
+    'src.step_2_1': ['-c', 'import src.step_2_1'],
+    'src.step_2_2': ['-c', 'import src.step_2_2'],
+    'src.step_3_1': ['-c', 'import src.step_3_1'],
+    'src.step_3_2': ['-c', 'import src.step_3_2'],
+    'src.step_4_1': ['-c', 'import src.step_4_1'],
+    'src.step_4_2': ['-c', 'import src.step_4_2'],
+    'src.step_5': ['-c', 'import src.step_5'],
+    'прогноз (PetSearchPredictor)': [
+        '-c', 'from src.step_3_2 import PetSearchPredictor; PetSearchPredictor()'],
+}
+
+# Строка вывода -X importtime: "import time: self | cumulative | <отступ>модуль"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """Модули верхнего уровня и их суммарное время импорта в секундах"""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        # Отступ в один пробел - импорт, выполненный непосредственно точкой входа
+        if len(indent) == 1:
+            modules[name] = modules.get(name, 0) + int(cumulative) / 1e6
+    return modules
+
+
+def measure(args):
+    """Запускает точку входа в новом процессе, возвращает (время процесса, импорты)"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args],
+                            cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Процесс завершился с кодом {result.returncode}:\n{result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def run_benchmark(repeat=3, top=5):
+    """Медианное время холодного старта каждой точки входа"""
+    # Прогрев: компиляция .pyc не должна попадать в измерения
+    subprocess.run([sys.executable, '-c', 'import src'], cwd=ROOT, capture_output=True)
+
+    results = {}
+    for label, args in ENTRY_POINTS.items():
+        runs = [measure(args) for _ in range(repeat)]
+        wall = statistics.median(elapsed for elapsed, _ in runs)
+        _, modules = runs[-1]
+        results[label] = {
+            'wall': wall,
+            'imports': sum(modules.values()),
+            'heaviest': sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top],
+        }
+    return results
+
+
+def print_results(results):
+    print(f"\n{'Точка входа':<30} {'процесс, с':>11} {'импорты, с':>11}   самые тяжелые импорты")
+    for label, entry in results.items():
+        heaviest = ', '.join(f"{name} {seconds:.3f}" for name, seconds in entry['heaviest'])
+        print(f"{label:<30} {entry['wall']:>11.3f} {entry['imports']:>11.3f}   {heaviest}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Время холодного старта точек входа')
+    parser.add_argument('--repeat', type=int, default=3, help='число запусков каждой точки входа')
+    parser.add_argument('--top', type=int, default=5, help='сколько самых тяжелых импортов показывать')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print_results(run_benchmark(args.repeat, args.top))
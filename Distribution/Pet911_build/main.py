@@ -1,20 +1,200 @@
-import shutil
+"""
+Запуск конвейера анализа объявлений Pet911.
+
+Коды завершения (для cron и CI):
+    0   - все выбранные шаги выполнены или переиспользованы;
+    1   - хотя бы один шаг завершился с ошибкой (зависимые шаги пропускаются);
+    2   - неверные аргументы или не найдены входные файлы;
+    130 - запуск прерван (Ctrl+C).
+"""
+import argparse
 import os
+import sys
+
+from src import batch, config, phases
+from src.partitions import PARTITION_KEYS, normalize_filters, selects
+from src.pipeline import STEPS, STEPS_BY_NAME, is_interactive, run_pipeline, step_params
+from src.rendering import DEFAULT_PROFILE, PROFILES
+from src.watch import DEFAULT_INTERVAL, watch
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+STEP_NAMES = [step['name'] for step in STEPS]
+
+
+def parse_filter(value):
+    """Фильтр партиций KEY=VALUE[,VALUE...] -> (ключ, список значений)"""
+    key, separator, values = value.partition('=')
+    if not separator or key not in PARTITION_KEYS or not values:
+        raise argparse.ArgumentTypeError(
+            f"ожидается KEY=VALUE[,VALUE...], где KEY - одно из: {', '.join(PARTITION_KEYS)}")
+    return key, values.split(',')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='Анализ объявлений Pet911',
+        epilog='Коды завершения: 0 - успех, 1 - ошибка шага, 2 - неверные аргументы или входные файлы, '
+               '130 - прервано.')
+
+    steps = parser.add_argument_group('шаги')
+    steps.add_argument('--only', nargs='+', choices=STEP_NAMES, metavar='STEP',
+                       help=f"выполнить только указанные шаги ({', '.join(STEP_NAMES)})")
+    steps.add_argument('--skip', nargs='+', choices=STEP_NAMES, metavar='STEP', default=[],
+                       help='не выполнять указанные шаги')
+    steps.add_argument('--force', action='store_true',
+                       help='очистить папку результатов и пересчитать все шаги')
+
+    paths = parser.add_argument_group('входные и выходные файлы')
+    paths.add_argument('--lost', default=config.DEFAULT_DATASETS['lost'],
+                       help='CSV-файл объявлений о пропаже')
+    paths.add_argument('--found', default=config.DEFAULT_DATASETS['found'],
+                       help='CSV-файл объявлений о находке')
+    paths.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR,
+                       help='папка результатов')
+    paths.add_argument('--partitions', default=None,
+                       help='корень партиционированного хранилища для --filter (по умолчанию '
+                            f'{config.DEFAULT_PARTITIONS_ROOT} для датасетов репозитория, '
+                            'иначе <файл --lost>_partitioned)')
+    paths.add_argument('--filter', dest='filters', type=parse_filter, action='append', default=[],
+                       metavar='KEY=VALUE', help='фильтр партиций, например year=2025 или region=Moskva,Kazan')
+
+    prediction = parser.add_argument_group('прогноз (step_3_2)')
+    prediction.add_argument('--non-interactive', action='store_true',
+                            help='не задавать вопросов: step_3_2 выполняется только с --ads')
+    prediction.add_argument('--ads',
+                            help='CSV/JSON с объявлениями для пакетного прогноза без диалога')
+
+    execution = parser.add_argument_group('выполнение')
+    execution.add_argument('--workers', type=int, default=None,
+                           help='число процессов для независимых шагов (по умолчанию по числу ядер, 1 - по очереди)')
+    execution.add_argument('--render-workers', type=int, default=None,
+                           help='число процессов отрисовки диаграмм в каждом шаге (0 - рисовать в процессе шага)')
+    execution.add_argument('--profile', choices=list(PROFILES), default=DEFAULT_PROFILE,
+                           help='профиль вывода диаграмм: publication - PNG 300 dpi, preview - быстрый PNG 72 dpi, '
+                                'vector - SVG')
+    execution.add_argument('--chunksize', type=int, default=None,
+                           help='читать датасеты частями по N строк (для файлов больше памяти)')
+    execution.add_argument('--instrument', nargs='*', choices=['memory', 'cprofile'], metavar='EXTRA',
+                           help='замер этапов шагов: время wall/CPU, отчет в results/profiling и таблица в консоли; '
+                                'memory - пик памяти (tracemalloc), cprofile - профиль функций (.prof)')
+
+    batching = parser.add_argument_group('пакетный запуск')
+    batching.add_argument('--batch', metavar='MANIFEST',
+                          help='JSON-манифест датасетов: все шаги для каждого датасета в своей папке внутри '
+                               f'--output-dir (по умолчанию {batch.DEFAULT_OUTPUT_ROOT}), --workers датасетов '
+                               'параллельно, и сравнение датасетов')
+
+    watching = parser.add_argument_group('наблюдение')
+    watching.add_argument('--watch', action='store_true',
+                          help='после запуска следить за data/*.csv и src/*.py и пересчитывать только затронутые '
+                               'шаги (без вопросов, шаги по очереди в одном процессе)')
+    watching.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                          help='период проверки файлов в режиме наблюдения, с')
+    return parser
+
+
+def select_steps(args, params):
+    """Шаги для запуска с учетом --only, --skip и неинтерактивного режима"""
+    names = [name for name in (args.only or STEP_NAMES) if name not in args.skip]
+    if args.non_interactive:
+        for name in list(names):
+            step = STEPS_BY_NAME[name]
+            if is_interactive(step, step_params(step, params)):
+                print(f"⏭ {name}: пропущен в неинтерактивном режиме (нет файла для пакетного запуска)")
+                names.remove(name)
+    return names
+
+
+def check_inputs(parser, step_names, params):
+    """Проверяет входные файлы выбранных шагов до запуска"""
+    filters = params.get('filters')
+    missing = []
+    for ad_type, path in config.datasets().items():
+        used = any(ad_type in STEPS_BY_NAME[name].get('datasets', []) for name in step_names)
+        if used and selects(filters, ad_type) and not os.path.exists(path):
+            missing.append(path)
+    if params.get('ads_file') and not os.path.exists(params['ads_file']):
+        missing.append(params['ads_file'])
+    if missing:
+        parser.error(f"не найдены входные файлы: {', '.join(missing)}")
+
+
+def run_batch_command(parser, args):
+    """Пакетный запуск по манифесту (--batch)"""
+    try:
+        entries = batch.load_manifest(args.batch)
+    except (OSError, ValueError) as e:
+        parser.error(f"манифест {args.batch}: {e}")
+    missing = batch.missing_inputs(entries)
+    if missing:
+        parser.error(f"не найдены входные файлы: {', '.join(missing)}")
+
+    output_root = batch.DEFAULT_OUTPUT_ROOT if args.output_dir == config.DEFAULT_RESULTS_DIR else args.output_dir
+    step_names = [name for name in (args.only or STEP_NAMES) if name not in args.skip]
+    try:
+        results = batch.run_batch(entries, output_root, workers=args.workers, step_names=step_names,
+                                  force=args.force, profile=args.profile)
+    except KeyboardInterrupt:
+        print("\n⛔ Запуск прерван")
+        return EXIT_INTERRUPTED
+    return EXIT_FAILED if any(result['status'] != 'ok' for result in results) else EXIT_OK
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.batch:
+        return run_batch_command(parser, args)
+    if args.watch:
+        args.non_interactive = True
+
+    filters = {}
+    for key, values in args.filters:
+        filters.setdefault(key, []).extend(values)
+    try:
+        normalize_filters(filters)
+    except ValueError as e:
+        parser.error(str(e))
+
+    params = {'chunksize': args.chunksize}
+    if filters:
+        params['filters'] = filters
+    if args.ads:
+        params['ads_file'] = args.ads
+
+    config.configure(datasets={'lost': args.lost, 'found': args.found}, results_dir=args.output_dir,
+                     partitions_root=args.partitions)
+
+    step_names = select_steps(args, params)
+    if not step_names:
+        parser.error('не выбрано ни одного шага')
+    check_inputs(parser, step_names, params)
+    if args.instrument is not None:
+        phases.configure(report=True, memory='memory' in args.instrument, cprofile='cprofile' in args.instrument)
+
+    if args.watch:
+        try:
+            watch(step_names, params, force=args.force, render_workers=args.render_workers, profile=args.profile,
+                  interval=args.interval)
+        except KeyboardInterrupt:
+            print("\n👋 Наблюдение остановлено")
+        return EXIT_OK
 
-from src import *
+    try:
+        run_pipeline(step_names, params, force=args.force, workers=args.workers,
+                     render_workers=args.render_workers, profile=args.profile)
+    except KeyboardInterrupt:
+        print("\n⛔ Запуск прерван")
+        return EXIT_INTERRUPTED
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return EXIT_FAILED
+    return EXIT_OK
 
-results_dir = 'results'
-if os.path.exists(results_dir):
-    shutil.rmtree(results_dir)
-    os.makedirs(results_dir, exist_ok=True)
 
 if __name__ == "__main__":
-    step_1_1()
-    step_1_2()
-    step_2_1()
-    step_2_2()
-    step_3_1()
-    step_3_2()
-    step_4_1()
-    step_4_2()
-    step_5()
\ No newline at end of file
+    sys.exit(main())
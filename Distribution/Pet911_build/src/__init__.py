@@ -2,6 +2,7 @@ from .step_1_1 import step_1_1
 from .step_1_2 import step_1_2
 from .step_2_1 import step_2_1
 from .step_2_2 import step_2_2
+from .step_2_3 import step_2_3
 from .step_3_1 import step_3_1
 from .step_3_2 import step_3_2
 from .step_4_1 import step_4_1
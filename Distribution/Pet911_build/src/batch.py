@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетный запуск: полный набор шагов для многих датасетов.
+
+Манифест (JSON) перечисляет датасеты. Для каждого задается имя и любые из
+полей: lost, found (файлы, по умолчанию из src/config.py), filters
+(фильтры партиций, см. src/partitions.py), ads (файл объявлений для
+step_3_2; без него шаг пропускается), partitions (корень партиций):
+
+{"datasets": [
+    {"name": "moskva", "filters": {"region": ["Moskva"]}},
+    {"name": "2025_q3", "filters": {"year": 2025, "month": [7, 8, 9]}},
+    {"name": "crawl_2025_10", "lost": "crawls/2025_10/lost.csv", "found": "crawls/2025_10/found.csv"}
+]}
+
+Каждый датасет обрабатывается в своей папке <папка>/<имя> со своим
+манифестом сборки, поэтому повторный запуск переиспользует результаты
+неизменившихся датасетов. Датасеты распределяются по пулу процессов (по
+умолчанию по числу ядер), шаги одного датасета выполняются по очереди в
+одном процессе, а их вывод пишется в <папка>/logs/<имя>.log. Внутри
+процесса прочитанные датасеты и разобранные даты переиспользуются между
+шагами (src/caches.py, partitions.enable_frame_cache). Кэш лемм общий: он
+хранится в <папка>/.cache/lemmas.json, загружается каждым процессом и
+дополняется словами, разобранными за запуск.
+
+После запуска сравнение датасетов (число объявлений, доля успешных
+поисков, медианная задержка публикации, статус шагов) сохраняется в
+<папка>/batch_summary.csv и печатается в консоли.
+
+python3 main.py --batch datasets.json --output-dir results_batch
+"""
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+
+from . import caches, config, partitions
+from .cube import SUCCESS_STATUSES
+from .deps import pd
+from .pipeline import STEPS, is_interactive, run_pipeline, step_params
+from .rendering import DEFAULT_PROFILE
+from .scheduler import init_worker
+from .survival import EVENT_DATE_COLUMNS, parse_days
+
+DEFAULT_OUTPUT_ROOT = 'results_batch'
+LOG_DIR = 'logs'
+LEMMA_CACHE = os.path.join('.cache', 'lemmas.json')
+SUMMARY_NAME = 'batch_summary.csv'
+
+NAME_PATTERN = re.compile(r'^[\w.-]+$')
+
+
+# ----------------------------- Манифест -----------------------------
+def load_manifest(path):
+    """
+    Читает манифест и возвращает датасеты с заполненными значениями по умолчанию:
+    [{'name', 'datasets': {'lost', 'found'}, 'filters', 'ads', 'partitions'}].
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    items = manifest.get('datasets', []) if isinstance(manifest, dict) else manifest
+    if not items:
+        raise ValueError(f"В манифесте {path} нет датасетов")
+
+    entries = []
+    for index, item in enumerate(items, 1):
+        name = str(item.get('name') or '')
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f"Датасет #{index}: имя должно состоять из букв, цифр, '_', '-' и '.': {name!r}")
+        if any(entry['name'] == name for entry in entries):
+            raise ValueError(f"Имя датасета повторяется: {name}")
+        unknown = set(item) - {'name', 'lost', 'found', 'filters', 'ads', 'partitions'}
+        if unknown:
+            raise ValueError(f"Датасет {name}: неизвестные поля {', '.join(sorted(unknown))}")
+
+        datasets = {ad_type: item.get(ad_type) or path for ad_type, path in config.DEFAULT_DATASETS.items()}
+        filters = item.get('filters') or None
+        partitions.normalize_filters(filters)
+        # Партиции строятся из исходных файлов, поэтому у другой пары файлов свой корень
+        default_root = config.default_partitions_root(datasets)
+        entries.append({
+            'name': name,
+            'datasets': datasets,
+            'filters': filters,
+            'ads': item.get('ads'),
+            'partitions': item.get('partitions') or default_root,
+        })
+    return entries
+
+
+def missing_inputs(entries):
+    """Входные файлы манифеста, которых нет на диске"""
+    paths = {path for entry in entries for path in entry['datasets'].values()}
+    paths.update(entry['ads'] for entry in entries if entry['ads'])
+    return sorted(path for path in paths if not os.path.exists(path))
+
+
+def prepare_partitions(entries):
+    """
+    Строит партиции для датасетов с фильтрами до запуска пула, чтобы
+    процессы не создавали одни и те же файлы одновременно.
+    """
+    for entry in entries:
+        if entry['filters']:
+            for ad_type, path in entry['datasets'].items():
+                if partitions.selects(entry['filters'], ad_type):
+                    partitions.ensure_partitions(path, ad_type, entry['partitions'])
+
+
+# ----------------------------- Один датасет -----------------------------
+def init_batch_worker(lemma_path):
+    """Инициализация процесса пула: графики только в файлы, общий кэш лемм"""
+    init_worker()
+    caches.load_lemmas(lemma_path)
+
+
+def dataset_params(entry):
+    params = {}
+    if entry['filters']:
+        params['filters'] = entry['filters']
+    if entry['ads']:
+        params['ads_file'] = entry['ads']
+    return params
+
+
+def dataset_summary(filters):
+    """Показатели датасета для сравнения: объявления, доля успешных, медианная задержка публикации"""
+    summary = {}
+    for ad_type, status in SUCCESS_STATUSES.items():
+        if not partitions.selects(filters, ad_type):
+            continue
+        df = partitions.read_dataset(config.dataset_path(ad_type), ad_type, filters)
+        delay = parse_days(df['дата_публикации']) - parse_days(df[EVENT_DATE_COLUMNS[ad_type]])
+        summary[f'{ad_type}_ads'] = len(df)
+        summary[f'{ad_type}_success_rate'] = round(float((df['статус'] == status).mean()), 4) if len(df) else None
+        summary[f'{ad_type}_median_delay_days'] = float(delay.median()) if delay.notna().any() else None
+    return summary
+
+
+def run_dataset(entry, output_root, step_names=None, force=False, profile=DEFAULT_PROFILE):
+    """
+    Выполняет шаги для одного датасета в текущем процессе; вывод пишется в
+    журнал датасета. Возвращает итог запуска и леммы, разобранные за запуск.
+    """
+    config.configure(datasets=entry['datasets'], results_dir=os.path.join(output_root, entry['name']),
+                     partitions_root=entry['partitions'])
+    partitions.enable_frame_cache()
+    known_lemmas = set(caches.lemma_cache())
+
+    params = dataset_params(entry)
+    names = [step['name'] for step in STEPS
+             if (step_names is None or step['name'] in step_names)
+             and not is_interactive(step, step_params(step, params))]
+
+    log_path = os.path.join(output_root, LOG_DIR, f"{entry['name']}.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    result = {'name': entry['name'], 'status': 'ok', 'rebuilt': [], 'reused': [], 'error': None}
+    started = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            result['rebuilt'], result['reused'] = run_pipeline(names, params, force=force, workers=1,
+                                                               render_workers=0, profile=profile)
+        except Exception as e:
+            traceback.print_exc()
+            result.update(status='failed', error=str(e))
+        try:
+            result['summary'] = dataset_summary(entry['filters'])
+        except Exception:
+            traceback.print_exc()
+            result['summary'] = {}
+    result['duration'] = time.perf_counter() - started
+    result['log'] = log_path
+    result['lemmas'] = {word: lemma for word, lemma in caches.lemma_cache().items() if word not in known_lemmas}
+    partitions.enable_frame_cache(False)
+    return result
+
+
+# ----------------------------- Пакет -----------------------------
+def run_batch(entries, output_root=DEFAULT_OUTPUT_ROOT, workers=None, step_names=None, force=False,
+              profile=DEFAULT_PROFILE):
+    """
+    Обрабатывает датасеты манифеста в пуле процессов (workers - число
+    процессов, по умолчанию по числу ядер). Возвращает итоги в порядке манифеста.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    lemma_path = os.path.join(output_root, LEMMA_CACHE)
+    loaded = caches.load_lemmas(lemma_path)
+    prepare_partitions(entries)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(entries)))
+    print(f"📦 Датасетов: {len(entries)}, процессов: {workers}, кэш лемм: {loaded} слов")
+    started = time.perf_counter()
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                             initargs=(lemma_path,)) as executor:
+        futures = {executor.submit(run_dataset, entry, output_root, step_names, force, profile): entry['name']
+                   for entry in entries}
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            caches.add_lemmas(result.pop('lemmas'))
+            results[result['name']] = result
+            if result['status'] == 'ok':
+                print(f"✅ [{done}/{len(entries)}] {result['name']}: пересчитано шагов {len(result['rebuilt'])}, "
+                      f"переиспользовано {len(result['reused'])} ({result['duration']:.1f} с)")
+            else:
+                print(f"❌ [{done}/{len(entries)}] {result['name']}: {result['error']} (журнал: {result['log']})")
+
+    caches.save_lemmas(lemma_path)
+    ordered = [results[entry['name']] for entry in entries]
+    summary_path = save_summary(ordered, output_root)
+    print_summary(ordered)
+    print(f"⏱ Общее время: {time.perf_counter() - started:.1f} с")
+    print(f"💾 Сравнение датасетов: {summary_path}")
+    return ordered
+
+
+def summary_frame(results):
+    rows = []
+    for result in results:
+        row = {
+            'dataset': result['name'],
+            'status': result['status'],
+            'rebuilt_steps': len(result['rebuilt']),
+            'reused_steps': len(result['reused']),
+            'duration_sec': round(result['duration'], 1),
+        }
+        row.update(result.get('summary', {}))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def save_summary(results, output_root):
+    path = os.path.join(output_root, SUMMARY_NAME)
+    summary_frame(results).to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def print_summary(results):
+    """Таблица сравнения датасетов"""
+    def cell(summary, key, template):
+        value = summary.get(key)
+        return template.format(value) if value is not None else '-'
+
+    print("\n📊 Сравнение датасетов:")
+    print(f"   {'датасет':<20}{'статус':>8}{'пропажи':>10}{'успех':>8}{'задержка':>10}"
+          f"{'находки':>10}{'успех':>8}{'задержка':>10}")
+    for result in results:
+        summary = result.get('summary', {})
+        line = f"   {result['name']:<20}{result['status']:>8}"
+        for ad_type in ('lost', 'found'):
+            line += (f"{cell(summary, f'{ad_type}_ads', '{:d}'):>10}"
+                     f"{cell(summary, f'{ad_type}_success_rate', '{:.1%}'):>8}"
+                     f"{cell(summary, f'{ad_type}_median_delay_days', '{:.1f} дн'):>10}")
+        print(line)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Отпечатки входов шагов и манифест выполненных шагов.
+
+Отпечаток шага - хэш SHA-256 от содержимого входных датасетов (или
+отобранных фильтрами партиций), дополнительных входных файлов, параметров
+вызова и исходного кода шага вместе с общими модулями. Манифест хранится
+в results/.build_manifest.json и для каждого шага содержит отпечаток
+последнего запуска и список созданных файлов.
+"""
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from . import config
+from .partitions import dataset_files
+
+MANIFEST_NAME = '.build_manifest.json'
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Общие модули, от которых зависят все шаги
+SHARED_SOURCES = ['deps.py', 'config.py', 'partitions.py', 'chunked.py', 'rendering.py', 'caches.py', 'cube.py',
+                  'time_counters.py', 'forecasting.py', 'prediction_table.py', 'success_model.py', 'factor_stats.py']
+
+# Хэши файлов: {путь: (размер, mtime, хэш)} - только последнее состояние каждого файла,
+# поэтому в долгоживущем процессе кэш не растет при перезаписи файлов
+_digest_cache = {}
+
+
+def file_digest(path):
+    """
+    Хэш содержимого файла. Результат кэшируется по пути вместе с размером и
+    mtime, поэтому повторный запуск без изменений не перечитывает большие
+    файлы, а измененный файл хэшируется заново.
+    """
+    if not os.path.exists(path):
+        return 'missing'
+
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    state = (stat.st_size, stat.st_mtime_ns)
+    cached = _digest_cache.get(key)
+    if cached is None or cached[:2] != state:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        cached = _digest_cache[key] = state + (sha.hexdigest(),)
+    return cached[2]
+
+
+def step_sources(step):
+    """
+    Исходные файлы, изменение которых делает результаты шага устаревшими:
+    модуль шага, модули, которые он использует (ключ 'sources' в STEPS), и общие модули
+    """
+    return [os.path.join(SRC_DIR, f"{step['name']}.py")] + [
+        os.path.join(SRC_DIR, name) for name in step.get('sources', []) + SHARED_SOURCES
+    ]
+
+
+def step_inputs(step, kwargs, datasets):
+    """
+    Список входных файлов шага с учетом фильтров партиций: датасеты,
+    дополнительные файлы из папки результатов и файл пакетного режима.
+    """
+    filters = kwargs.get('filters')
+    files = []
+    for ad_type in step.get('datasets', []):
+        files.extend(dataset_files(datasets[ad_type], ad_type, filters))
+    files.extend(config.results_path(path) for path in step.get('inputs', []))
+    if kwargs.get(step.get('batch_input')):
+        files.append(kwargs[step['batch_input']])
+    return files
+
+
+def step_fingerprint(step, kwargs, datasets):
+    """Вычисляет отпечаток шага: входные файлы, параметры и исходный код"""
+    sha = hashlib.sha256()
+    sha.update(step['name'].encode('utf-8'))
+
+    for path in step_inputs(step, kwargs, datasets):
+        sha.update(f'input:{path}:{file_digest(path)}'.encode('utf-8'))
+
+    for path in step_sources(step):
+        sha.update(f'source:{os.path.basename(path)}:{file_digest(path)}'.encode('utf-8'))
+
+    params = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    sha.update(f'params:{params}'.encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+# ----------------------------- Манифест -----------------------------
+def load_manifest(results_dir):
+    """Загружает манифест; при отсутствии или повреждении возвращает пустой"""
+    path = os.path.join(results_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print("⚠️ Манифест результатов поврежден, все шаги будут пересчитаны")
+        return {}
+
+
+def save_manifest(manifest, results_dir):
+    """Атомарно сохраняет манифест"""
+    path = os.path.join(results_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def collect_outputs(step, results_dir):
+    """Находит файлы, созданные шагом, по шаблонам из описания шага"""
+    outputs = set()
+    for pattern in step.get('outputs', []):
+        for path in glob.glob(os.path.join(results_dir, pattern)):
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    outputs.update(os.path.join(root, name) for name in names)
+            else:
+                outputs.add(path)
+    return sorted(os.path.relpath(path, results_dir) for path in outputs)
+
+
+def is_up_to_date(manifest, name, fingerprint, results_dir):
+    """Шаг актуален, если отпечаток совпадает и все его файлы на месте"""
+    entry = manifest.get(name)
+    if not entry or entry.get('fingerprint') != fingerprint:
+        return False
+    return all(os.path.exists(os.path.join(results_dir, path)) for path in entry.get('outputs', []))
+
+
+def remove_outputs(manifest, name, results_dir):
+    """Удаляет файлы предыдущего запуска шага перед пересчетом"""
+    entry = manifest.pop(name, None)
+    if not entry:
+        return
+    for path in entry.get('outputs', []):
+        full_path = os.path.join(results_dir, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+
+def record_step(manifest, step, fingerprint, results_dir, duration):
+    """Записывает в манифест результат успешного выполнения шага"""
+    manifest[step['name']] = {
+        'fingerprint': fingerprint,
+        'outputs': collect_outputs(step, results_dir),
+        'duration_sec': round(duration, 3),
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+    }
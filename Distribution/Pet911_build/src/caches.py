@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Кэши значений, общие для шагов одного процесса.
+
+    - леммы слов (pymorphy3): одно и то же слово встречается в тысячах
+      описаний, а разбор слова - самая дорогая часть подготовки текстов;
+    - разобранные строки (даты вида "пт, 26.09.2025" и т.п.): функция
+      разбора применяется к уникальным значениям колонки, а не к каждой строке.
+
+Кэши живут в процессе и переиспользуются всеми шагами и датасетами,
+которые он обрабатывает. Кэш лемм можно сохранить в файл и загрузить в
+других процессах (см. src/batch.py).
+"""
+import json
+import os
+
+_lemmas = {}  # {слово: лемма}
+_parsed = {}  # {имя функции разбора: {значение: результат}}
+
+
+# ----------------------------- Леммы -----------------------------
+def lemmatize(word, morph_analyzer):
+    """Нормальная форма слова (первый вариант разбора pymorphy3)"""
+    lemma = _lemmas.get(word)
+    if lemma is None:
+        lemma = _lemmas[word] = morph_analyzer.parse(word)[0].normal_form
+    return lemma
+
+
+def lemma_cache():
+    return _lemmas
+
+
+def add_lemmas(entries):
+    _lemmas.update(entries)
+
+
+def load_lemmas(path):
+    """Дополняет кэш лемм из файла JSON; возвращает число загруженных слов"""
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️ Кэш лемм {path} поврежден и будет создан заново")
+        return 0
+    _lemmas.update(entries)
+    return len(entries)
+
+
+def save_lemmas(path):
+    """Атомарно сохраняет кэш лемм в файл JSON"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_lemmas, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# ----------------------------- Разбор значений -----------------------------
+def clear_parsed():
+    """Сбрасывает результаты разбора (например, после перезагрузки модуля шага)"""
+    _parsed.clear()
+
+
+def map_cached(values, func, name=None):
+    """
+    То же, что values.apply(func), но func вызывается один раз для каждого
+    уникального значения, а результаты запоминаются под именем name (по
+    умолчанию - полное имя функции) для следующих вызовов в этом процессе.
+    """
+    cache = _parsed.setdefault(name or f'{func.__module__}.{func.__qualname__}', {})
+    mapping = {}
+    for value in values.unique():
+        if value in cache:
+            mapping[value] = cache[value]
+        else:
+            mapping[value] = cache[value] = func(value)
+    return values.map(mapping)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковая (out-of-core) обработка датасетов.
+
+Файл читается частями ограниченного размера, для каждой части считаются
+частичные агрегаты, которые затем объединяются: количества и суммы по
+ключам группировки, суммы квадратов и произведений для средних,
+стандартных отклонений и корреляций, гистограммы значений для медиан и
+квартилей. Пиковая память определяется размером части и числом различных
+значений ключей, а не размером датасета.
+"""
+from .deps import np, pd
+from .partitions import dataset_files
+from .phases import phase
+
+DEFAULT_CHUNKSIZE = 50_000
+
+
+def iter_chunks(file_path, ad_type, filters=None, chunksize=DEFAULT_CHUNKSIZE, **read_csv_kwargs):
+    """
+    Последовательно возвращает части датасета (исходного файла или
+    отобранных фильтрами партиций) размером не более chunksize строк.
+    """
+    for path in dataset_files(file_path, ad_type, filters):
+        reader = iter(pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs))
+        while True:
+            # Время чтения части относится к этапу загрузки, обработка части - к этапам шага
+            with phase('load'):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            yield chunk
+
+
+def merge_counts(total, partial):
+    """
+    Объединяет частичные количества/суммы, проиндексированные ключами группировки.
+    Целочисленные типы сохраняются, пустые (NaN) ключи не теряются.
+    """
+    if total is None:
+        return partial
+    combined = pd.concat([total, partial])
+    levels = list(range(combined.index.nlevels))
+    return combined.groupby(level=levels, dropna=False, observed=False).sum()
+
+
+def weighted_rate(successes, counts):
+    """Доля успехов по группам; для пустых групп - NaN, как у groupby().mean()"""
+    counts = counts.astype(float)
+    return successes / counts.where(counts > 0)
+
+
+class Moments:
+    """
+    Объединяемые моменты для пары признаков: количество, суммы, суммы
+    квадратов и произведений. Строки с пропуском в любом из признаков
+    не учитываются (как в pd.Series.corr). weights - число исходных строк
+    для каждой пары значений (например, ячейки агрегатного куба).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.sum_x = self.sum_y = 0.0
+        self.sum_xx = self.sum_yy = self.sum_xy = 0.0
+
+    def update(self, x, y, weights=None):
+        x = pd.to_numeric(pd.Series(x), errors='coerce').astype(float).to_numpy()
+        y = pd.to_numeric(pd.Series(y), errors='coerce').astype(float).to_numpy()
+        w = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=float)
+        mask = ~(np.isnan(x) | np.isnan(y))
+        x, y, w = x[mask], y[mask], w[mask]
+        self.n += int(w.sum())
+        self.sum_x += (w * x).sum()
+        self.sum_y += (w * y).sum()
+        self.sum_xx += (w * x * x).sum()
+        self.sum_yy += (w * y * y).sum()
+        self.sum_xy += (w * x * y).sum()
+        return self
+
+    def corr(self):
+        """Коэффициент корреляции Пирсона"""
+        if self.n < 2:
+            return np.nan
+        cov = self.sum_xy - self.sum_x * self.sum_y / self.n
+        var_x = self.sum_xx - self.sum_x ** 2 / self.n
+        var_y = self.sum_yy - self.sum_y ** 2 / self.n
+        if var_x <= 0 or var_y <= 0:
+            return np.nan
+        return cov / np.sqrt(var_x * var_y)
+
+
+# ----------------------------- Гистограммы -----------------------------
+def histogram(values):
+    """Частоты значений (без пропусков), отсортированные по значению"""
+    return pd.Series(values).value_counts(dropna=True).sort_index()
+
+
+def histogram_quantile(hist, q):
+    """
+    Квантиль по гистограмме с линейной интерполяцией - тот же результат,
+    что pd.Series.quantile(q) по исходным значениям.
+    """
+    hist = hist[hist > 0]
+    n = int(hist.sum())
+    if n == 0:
+        return np.nan
+
+    values = hist.index.to_numpy(dtype=float)
+    # Номер последнего элемента каждого значения в отсортированной выборке
+    last_rank = np.cumsum(hist.to_numpy()) - 1
+
+    position = (n - 1) * q
+    lower = int(np.floor(position))
+    upper = min(lower + 1, n - 1)
+    fraction = position - lower
+
+    a = values[np.searchsorted(last_rank, lower)]
+    b = values[np.searchsorted(last_rank, upper)]
+    # Интерполяция в той же форме, что в numpy (результат совпадает до бита)
+    if fraction >= 0.5:
+        return b - (b - a) * (1 - fraction)
+    return a + (b - a) * fraction
+
+
+def histogram_stats(hist):
+    """Количество, среднее, медиана и стандартное отклонение (ddof=1) по гистограмме"""
+    hist = hist[hist > 0]
+    count = int(hist.sum())
+    if count == 0:
+        return {'count': 0, 'mean': np.nan, 'median': np.nan, 'std': np.nan}
+
+    values = hist.index.to_numpy(dtype=float)
+    weights = hist.to_numpy(dtype=float)
+    mean = (values * weights).sum() / count
+    std = np.sqrt(((values - mean) ** 2 * weights).sum() / (count - 1)) if count > 1 else np.nan
+    return {'count': count, 'mean': mean, 'median': histogram_quantile(hist, 0.5), 'std': std}
+
+
+def histogram_boxplot_stats(hist, label, whis=1.5):
+    """
+    Статистики для matplotlib Axes.bxp по гистограмме: квартили, усы по
+    правилу 1.5 IQR и выбросы (каждое значение один раз).
+    """
+    hist = hist[hist > 0]
+    values = hist.index.to_numpy(dtype=float)
+    q1, med, q3 = (histogram_quantile(hist, q) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    low_limit, high_limit = q1 - whis * iqr, q3 + whis * iqr
+
+    inside = values[(values >= low_limit) & (values <= high_limit)]
+    whislo = inside.min() if len(inside) else q1
+    whishi = inside.max() if len(inside) else q3
+
+    return {
+        'label': label,
+        'med': med, 'q1': q1, 'q3': q3,
+        'whislo': min(whislo, q1), 'whishi': max(whishi, q3),
+        'fliers': values[(values < whislo) | (values > whishi)],
+    }
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Пути конвейера: исходные датасеты, папка результатов и корень партиций.
+
+Значения по умолчанию соответствуют раскладке репозитория (относительно
+рабочей папки). main.py переопределяет их аргументами командной строки
+через configure(); процессам-исполнителям шагов и процессам отрисовки
+настройки передаются явно (settings()), а шаги получают пути через
+dataset_path() и results_path() в момент выполнения.
+"""
+import os
+
+DEFAULT_DATASETS = {
+    'lost': 'data/Dataset_final_Pet911_lost.csv',
+    'found': 'data/dataset_final_Pet911_found.csv',
+}
+DEFAULT_RESULTS_DIR = 'results'
+DEFAULT_PARTITIONS_ROOT = 'data/partitioned'
+
+_settings = {
+    'datasets': dict(DEFAULT_DATASETS),
+    'results_dir': DEFAULT_RESULTS_DIR,
+    # None - корень по умолчанию для текущих датасетов (default_partitions_root)
+    'partitions_root': None,
+}
+
+
+def configure(datasets=None, results_dir=None, partitions_root=None):
+    """Задает пути конвейера; не переданные значения не меняются"""
+    if datasets:
+        unknown = set(datasets) - set(DEFAULT_DATASETS)
+        if unknown:
+            raise ValueError(f"Неизвестный тип датасета: {', '.join(sorted(unknown))}")
+        _settings['datasets'] = dict(_settings['datasets'], **datasets)
+    if results_dir:
+        _settings['results_dir'] = results_dir
+    if partitions_root:
+        _settings['partitions_root'] = partitions_root
+
+
+def settings():
+    """Текущие пути в виде словаря для configure(**settings()) в другом процессе"""
+    return {
+        'datasets': dict(_settings['datasets']),
+        'results_dir': _settings['results_dir'],
+        'partitions_root': partitions_root(),
+    }
+
+
+def datasets():
+    """Пути к исходным датасетам {тип объявления: файл}"""
+    return dict(_settings['datasets'])
+
+
+def dataset_path(ad_type):
+    """Путь к исходному датасету lost/found"""
+    return _settings['datasets'][ad_type]
+
+
+def results_dir():
+    """Папка результатов"""
+    return _settings['results_dir']
+
+
+def results_path(*parts):
+    """Путь внутри папки результатов"""
+    return os.path.join(_settings['results_dir'], *parts)
+
+
+def default_partitions_root(datasets):
+    """
+    Корень партиций по умолчанию для набора датасетов: для датасетов
+    репозитория - DEFAULT_PARTITIONS_ROOT, для других - каталог рядом с
+    файлом потерянных животных, чтобы партиции разных датасетов не смешивались
+    """
+    if datasets == DEFAULT_DATASETS:
+        return DEFAULT_PARTITIONS_ROOT
+    return os.path.splitext(datasets['lost'])[0] + '_partitioned'
+
+
+def partitions_root():
+    """Корень партиционированного хранилища (см. src/partitions.py)"""
+    return _settings['partitions_root'] or default_partitions_root(_settings['datasets'])
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Агрегатный куб объявлений: количество объявлений (n) и успешных поисков
+(успехи) по сочетаниям измерений - регион, тип животного, месяц
+публикации, статус, наличие и количество фото, наличие и длина описания,
+контакты, порода. Тип объявления - отдельный куб для каждого датасета.
+
+Измерения, которые шаги используют только по группам, сводятся к группам
+при построении куба, иначе почти каждое объявление было бы отдельной
+ячейкой:
+    - дата публикации -> месяц ('2025-09', NaN - дата не распознана);
+    - количество фото и длина описания -> интервалы step_3_1 и модели
+      успеха (src/success_model.py); значение заменяется правой границей
+      своего интервала (BUCKETS), поэтому pd.cut и searchsorted по этим
+      интервалам относят ячейку к той же группе, что исходные строки.
+Остальные значения хранятся в том виде, в каком их возвращает pd.read_csv
+(строки, числа, логические значения, NaN). Шаги не группируют строки сами,
+а применяют свою подготовку (нижний регистр, тип местности, интервалы фото
+и длины описания) к уникальным значениям куба и суммируют меры:
+    - step_1_1: регион × успех;
+    - step_1_2: месяц публикации по регионам и типам животных;
+    - step_3_1: тип животного, фото, описание, контакты × успех;
+    - step_5: тип местности и породистость × успех.
+Успех - статус "питомец найден" / "хозяин найден"; статус тоже измерение,
+поэтому шаг с другим определением успеха считает его по статусу.
+
+Распределения и корреляции step_2_2 и src/significance.py требуют
+точных количеств фото и длин описания, поэтому рядом строится куб
+публикации (view='publication'): статус, наличие фото, количество фото и
+длина описания без группировки. Число его ячеек ограничено числом разных
+значений этих колонок, а не числом объявлений.
+
+Кубы строятся за один проход по файлу: кодировка определяется по началу
+файла (detect_encoding), читаются только колонки измерений, частями, поэтому
+память ограничена размером части этих колонок, а не файла. Кубы
+сохраняются в results/.cube отдельно для каждого файла датасета или
+партиции вместе с размером и хэшем файла. Обновление инкрементальное:
+    - новая выгрузка в партициях (python3 -m src.partitions) добавляет файлы
+      и сжимает хранилище, агрегируются только новые и сжатые файлы;
+    - если в конец CSV дописаны строки, читается только дописанная часть.
+"""
+import codecs
+import hashlib
+import io
+import os
+import pickle
+import time
+
+from . import config
+from .build_cache import file_digest
+from .chunked import iter_chunks
+from .caches import map_cached
+from .deps import np, pd
+from .partitions import dataset_files, selects
+from .phases import phase
+from .success_model import DESCRIPTION_BINS, PHOTO_BINS
+
+DIMENSIONS = ['регион', 'тип_животного', 'дата_публикации', 'статус', 'есть_фото', 'количество_фото',
+              'наличие_описания', 'Длина_описания_в_словах', 'есть_контакты', 'порода']
+MEASURES = ['n', 'успехи']
+
+# Числовые измерения основного куба и границы их интервалов
+BUCKETS = {
+    'количество_фото': PHOTO_BINS,
+    'Длина_описания_в_словах': DESCRIPTION_BINS,
+}
+
+# Измерения кубов: основной и куб публикации с точными значениями (см. описание модуля)
+VIEWS = {
+    'cube': DIMENSIONS,
+    'publication': ['статус', 'есть_фото', 'количество_фото', 'Длина_описания_в_словах'],
+}
+
+# Версия сохраненных кубов: кубы другой версии строятся заново
+CUBE_VERSION = 2
+
+SUCCESS_STATUSES = {
+    'lost': 'питомец найден',
+    'found': 'хозяин найден',
+}
+
+ENCODINGS = ['utf-8', 'cp1251', 'latin1']
+# Сколько байт с начала файла проверяется при определении кодировки
+ENCODING_SAMPLE_BYTES = 1 << 16
+
+CUBE_DIR = '.cube'
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Кубы, уже загруженные в процессе: {файл куба: (размер, mtime, куб)}
+_loaded = {}
+
+
+# ----------------------------- Построение -----------------------------
+def publication_month(value):
+    """Месяц публикации ('2025-09') по дате вида "пт, 26.09.2025" (NaN - дата не распознана)"""
+    from .time_counters import parse_publication_date
+
+    date = parse_publication_date(value) if isinstance(value, str) else pd.NaT
+    return np.nan if pd.isna(date) else date.strftime('%Y-%m')
+
+
+def interval_edges(values, bins):
+    """
+    Правая граница интервала (b[i], b[i+1]] каждого значения; значения не
+    больше первой границы - первая граница, больше последней - inf,
+    нечисловые и пропуски - NaN
+    """
+    x = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    edges = np.append(np.asarray(bins, dtype=float), np.inf)
+    result = edges[np.searchsorted(bins, x, side='left')]
+    result[np.isnan(x)] = np.nan
+    return result
+
+
+def group_dimensions(frame):
+    """Сводит дату публикации к месяцу, а количество фото и длину описания - к интервалам"""
+    frame = frame.copy()
+    frame['дата_публикации'] = map_cached(frame['дата_публикации'], publication_month)
+    for column, bins in BUCKETS.items():
+        frame[column] = interval_edges(frame[column], bins)
+    return frame
+
+
+def summarize(frame, dimensions):
+    return frame.groupby(dimensions, dropna=False, sort=False)[MEASURES].sum().reset_index()
+
+
+def aggregate(df, ad_type):
+    """Кубы всех видов (VIEWS) по части строк датасета: {вид: куб}"""
+    frame = df.reindex(columns=DIMENSIONS)
+    frame['n'] = 1
+    frame['успехи'] = (df['статус'] == SUCCESS_STATUSES[ad_type]).astype('int64')
+    return {
+        'cube': summarize(group_dimensions(frame), VIEWS['cube']),
+        'publication': summarize(frame, VIEWS['publication']),
+    }
+
+
+def merge_view(cubes, dimensions):
+    """Объединяет кубы одного вида с измерениями dimensions"""
+    if not cubes:
+        return pd.DataFrame(columns=dimensions + MEASURES)
+    if len(cubes) == 1:
+        return cubes[0]
+    return summarize(pd.concat(cubes, ignore_index=True), dimensions)
+
+
+def merge(parts):
+    """
+    Объединяет кубы (частей файла, файлов партиций или старой и новой
+    выгрузки) - словари {вид: куб}, как их возвращает aggregate
+    """
+    parts = [part for part in parts if part is not None]
+    return {view: merge_view([part[view] for part in parts], dimensions) for view, dimensions in VIEWS.items()}
+
+
+def read_sample(source, size=ENCODING_SAMPLE_BYTES):
+    """Первые size байт CSV-файла (пути или открытого двоичного файла)"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+        sample = source.read(size)
+        source.seek(0)
+        return sample
+    with open(source, 'rb') as f:
+        return f.read(size)
+
+
+def detect_encoding(source):
+    """
+    Первая из ENCODINGS, в которой читается начало файла; символ, обрезанный
+    на границе образца, не считается ошибкой
+    """
+    sample = read_sample(source)
+    for encoding in ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return ENCODINGS[-1]
+
+
+def candidate_encodings(source):
+    """
+    Кодировки для чтения файла: определенная по началу файла и следующие за
+    ней в ENCODINGS - на случай, если ошибка встретится дальше образца
+    """
+    return ENCODINGS[ENCODINGS.index(detect_encoding(source)):]
+
+
+# ----------------------------- Ячейки по строкам -----------------------------
+def region_animal_labels(df):
+    """Регион и тип животного строк для группировки: пропуски - 'не указан', тип - в нижнем регистре"""
+    return {
+        'регион': df['регион'].fillna('не указан').astype(str).str.strip(),
+        'тип_животного': df['тип_животного'].fillna('не указан').astype(str).str.strip().str.lower(),
+    }
+
+
+def aggregate_cells(frames, measures=('n',)):
+    """Сумма мер measures по сочетаниям значений остальных колонок частей frames"""
+    combined = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    keys = [column for column in combined.columns if column not in measures]
+    return combined.groupby(keys, dropna=False, sort=False)[list(measures)].sum().reset_index()
+
+
+def read_cells(file_path, ad_type, filters, chunksize, columns, cells, measures=('n',), **read_csv_kwargs):
+    """
+    Ячейки датасета (исходного файла или отобранных фильтрами партиций):
+    файлы читаются частями (только колонки columns), каждая часть
+    переводится в строки ячеек функцией cells(часть, ad_type) и сводится
+    по мерам measures. None - в датасете нет строк.
+    """
+    parts = []
+    for path in dataset_files(file_path, ad_type, filters):
+        for encoding in candidate_encodings(path):
+            try:
+                file_parts = [aggregate_cells([cells(chunk.reindex(columns=columns), ad_type)], measures)
+                              for chunk in iter_chunks(path, ad_type, chunksize=chunksize, encoding=encoding,
+                                                       usecols=lambda column: column in columns,
+                                                       **read_csv_kwargs)]
+                parts.extend(file_parts)
+                break
+            except UnicodeDecodeError:
+                continue
+    return aggregate_cells(parts, measures) if parts else None
+
+
+def aggregate_csv(source, ad_type, chunk_rows=None):
+    """Кубы CSV-файла (пути или открытого двоичного файла), прочитанного частями"""
+    for encoding in candidate_encodings(source):
+        try:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            parts = []
+            # Читаются только колонки измерений: описание и прочий текст в память не попадают
+            reader = iter(pd.read_csv(source, usecols=lambda column: column in DIMENSIONS,
+                                      chunksize=chunk_rows or DEFAULT_CHUNK_ROWS, encoding=encoding))
+            while True:
+                with phase('load'):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    break
+                parts.append(aggregate(chunk, ad_type))
+            return merge(parts)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Не удалось прочитать {source} в кодировках {', '.join(ENCODINGS)}")
+
+
+def prefix_digest(path, size):
+    """Хэш первых size байт файла (проверка, что к файлу только дописывали строки)"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = size
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block:
+                break
+            sha.update(block)
+            remaining -= len(block)
+    return sha.hexdigest()
+
+
+def appended_rows(path, offset):
+    """Заголовок и строки, дописанные в файл после offset байт, как двоичный файл CSV"""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(offset)
+        return io.BytesIO(header + f.read())
+
+
+# ----------------------------- Хранение -----------------------------
+def cube_path(source_file, ad_type):
+    key = hashlib.sha1(os.path.abspath(source_file).encode('utf-8')).hexdigest()[:16]
+    return config.results_path(CUBE_DIR, f'{ad_type}-{key}.pkl')
+
+
+def read_stored(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save_stored(path, stored):
+    """Атомарно сохраняет куб файла"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(stored, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def source_state(source_file):
+    """Размер, время изменения и хэш файла; можно ли дописывать к нему строки"""
+    stat = os.stat(source_file)
+    with open(source_file, 'rb') as f:
+        f.seek(max(stat.st_size - 1, 0))
+        # Дописывать строки можно, только если файл заканчивается переводом строки
+        appendable = f.read(1) == b'\n'
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': file_digest(source_file),
+            'appendable': appendable}
+
+
+def source_change(source_file, stored):
+    """
+    Изменение файла относительно сохраненного состояния stored (см. source_state):
+    None - не изменился, 'проверен' - изменилось только время изменения,
+    'дописан' - в конец дописаны строки (после stored['size'] байт),
+    'изменен' - файл нужно обработать заново.
+    """
+    if stored is None:
+        return 'изменен'
+    stat = os.stat(source_file)
+    if (stored['size'], stored['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return None
+    if stored['size'] == stat.st_size and file_digest(source_file) == stored['digest']:
+        return 'проверен'
+    if (stored['size'] < stat.st_size and stored['appendable']
+            and prefix_digest(source_file, stored['size']) == stored['digest']):
+        return 'дописан'
+    return 'изменен'
+
+
+def file_cube(source_file, ad_type, chunk_rows=None):
+    """
+    Кубы одного файла датасета или партиции ({вид: куб}). Сохраненные кубы
+    переиспользуются, если файл не изменился; если к файлу дописаны строки -
+    дополняются ими. Возвращает кубы и действие ('построен', 'дополнен' или
+    None - переиспользован).
+    """
+    path = cube_path(source_file, ad_type)
+    stat = os.stat(source_file)
+    if path in _loaded and _loaded[path][:2] == (stat.st_size, stat.st_mtime_ns):
+        return _loaded[path][2], None
+
+    stored = read_stored(path)
+    if stored is not None and (stored.get('version') != CUBE_VERSION
+                               or stored['source'] != os.path.abspath(source_file)):
+        stored = None
+    change = source_change(source_file, stored)
+    action = None
+    if change == 'дописан':
+        with appended_rows(source_file, stored['size']) as tail:
+            stored['cubes'] = merge([stored['cubes'], aggregate_csv(tail, ad_type, chunk_rows)])
+        action = 'дополнен'
+    elif change == 'изменен':
+        stored = {'source': os.path.abspath(source_file), 'version': CUBE_VERSION,
+                  'cubes': aggregate_csv(source_file, ad_type, chunk_rows)}
+        action = 'построен'
+    if change is not None:
+        stored.update(source_state(source_file))
+        save_stored(path, stored)
+
+    _loaded[path] = (stat.st_size, stat.st_mtime_ns, stored['cubes'])
+    return stored['cubes'], action
+
+
+# ----------------------------- Доступ для шагов -----------------------------
+def load(ad_type, filters=None, chunk_rows=None, source_file=None, view='cube'):
+    """
+    Куб вида view (см. VIEWS) датасета ad_type: исходного файла (по
+    умолчанию из src/config.py) или отобранных фильтрами партиций
+    """
+    files = dataset_files(source_file or config.dataset_path(ad_type), ad_type, filters)
+    started = time.perf_counter()
+    parts, actions = [], {}
+    for path in files:
+        part, action = file_cube(path, ad_type, chunk_rows)
+        parts.append(part)
+        if action is not None:
+            actions[action] = actions.get(action, 0) + 1
+    cube = merge_view([part[view] for part in parts], VIEWS[view])
+
+    if actions:
+        updated = ', '.join(f'{action} по {count} из {len(files)} файлов' for action, count in actions.items())
+        print(f"🧊 Куб {ad_type} {updated}: {int(cube['n'].sum())} объявлений -> {len(cube)} ячеек "
+              f"за {time.perf_counter() - started:.1f} с")
+    return cube
+
+
+def ensure(ad_types, filters=None, chunk_rows=None):
+    """Строит или обновляет кубы заранее, до запуска шагов в отдельных процессах"""
+    for ad_type in ad_types:
+        if selects(filters, ad_type):
+            load(ad_type, filters, chunk_rows)
+
+
+def rollup(cube, by, measures=MEASURES):
+    """
+    Сумма мер по группам by (имена измерений или значения, вычисленные по
+    строкам куба), как groupby по исходным строкам
+    """
+    return cube.groupby(by, dropna=False)[measures].sum()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Построение или обновление агрегатного куба')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR, help='папка результатов')
+    args = parser.parse_args()
+
+    config.configure(results_dir=args.output_dir)
+    ensure(config.datasets())
@@ -1,24 +1,110 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+"""
+Общие зависимости шагов анализа.
+
+Тяжелые библиотеки (pandas, numpy, matplotlib, seaborn, scipy, sklearn, nltk,
+pymorphy3) импортируются при первом обращении к имени, а не при импорте
+модуля шага: шаг или прогнозная модель платят только за то, чем пользуются.
+"""
+import importlib
+import importlib.util
 import os
 from datetime import datetime, timedelta
 import warnings
 import csv
 import json
-from scipy import stats
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.metrics import silhouette_score, silhouette_samples
-from sklearn.manifold import TSNE
-import matplotlib.patches as mpatches
-from matplotlib.colors import ListedColormap
 import re
 import string
 from collections import Counter
-from nltk.corpus import stopwords
-import pymorphy3
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.feature_selection import chi2
\ No newline at end of file
+
+
+class _LazyModule:
+    """Модуль, который импортируется при первом обращении к любому его атрибуту"""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self.__dict__['_module'] is None:
+            self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return self.__dict__['_module']
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'загружен' if self.__dict__['_module'] is not None else 'не загружен'
+        return f"<ленивый модуль {self.__dict__['_name']} ({state})>"
+
+
+class _LazyAttr:
+    """Объект модуля (класс, функция), который импортируется при первом использовании"""
+
+    def __init__(self, module, attr):
+        self.__dict__['_path'] = (module, attr)
+        self.__dict__['_object'] = None
+
+    def _load(self):
+        if self.__dict__['_object'] is None:
+            module, attr = self.__dict__['_path']
+            self.__dict__['_object'] = getattr(importlib.import_module(module), attr)
+        return self.__dict__['_object']
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<ленивый объект {'.'.join(self.__dict__['_path'])}>"
+
+
+pd = _LazyModule('pandas')
+np = _LazyModule('numpy')
+plt = _LazyModule('matplotlib.pyplot')
+sns = _LazyModule('seaborn')
+stats = _LazyModule('scipy.stats')
+KMeans = _LazyAttr('sklearn.cluster', 'KMeans')
+StandardScaler = _LazyAttr('sklearn.preprocessing', 'StandardScaler')
+PCA = _LazyAttr('sklearn.decomposition', 'PCA')
+silhouette_score = _LazyAttr('sklearn.metrics', 'silhouette_score')
+silhouette_samples = _LazyAttr('sklearn.metrics', 'silhouette_samples')
+TSNE = _LazyAttr('sklearn.manifold', 'TSNE')
+mpatches = _LazyModule('matplotlib.patches')
+ListedColormap = _LazyAttr('matplotlib.colors', 'ListedColormap')
+stopwords = _LazyAttr('nltk.corpus', 'stopwords')
+pymorphy3 = _LazyModule('pymorphy3')
+TfidfVectorizer = _LazyAttr('sklearn.feature_extraction.text', 'TfidfVectorizer')
+chi2 = _LazyAttr('sklearn.feature_selection', 'chi2')
+
+# Пакеты, которые нужно установить для каждого имени (для проверки перед запуском шага)
+PACKAGES = {
+    'pandas': 'pandas',
+    'numpy': 'numpy',
+    'matplotlib': 'matplotlib',
+    'seaborn': 'seaborn',
+    'scipy': 'scipy',
+    'sklearn': 'scikit-learn',
+    'nltk': 'nltk',
+    'pymorphy3': 'pymorphy3',
+}
+
+
+def missing_packages(modules):
+    """Список неустановленных пакетов из modules; сами модули не импортируются"""
+    return [PACKAGES.get(name, name) for name in modules if importlib.util.find_spec(name) is None]
+
+
+__all__ = [
+    'pd', 'np', 'plt', 'sns', 'os', 'datetime', 'timedelta', 'warnings', 'csv', 'json', 'stats',
+    'KMeans', 'StandardScaler', 'PCA', 'silhouette_score', 'silhouette_samples', 'TSNE',
+    'mpatches', 'ListedColormap', 're', 'string', 'Counter', 'stopwords', 'pymorphy3',
+    'TfidfVectorizer', 'chi2',
+]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Таблицы успешности по факторам объявления для step_3_1 за один проход.
+
+Предобработанные ячейки агрегатного куба (колонки факторов, is_success и n -
+число объявлений в ячейке) кодируются в одну матрицу номеров значений:
+строка - ячейка, столбец - фактор, -1 - значение вне интервалов. Номера
+факторов сдвигаются в общую нумерацию, поэтому число объявлений и успехов
+по всем значениям всех факторов считается двумя вызовами np.bincount, без
+временных колонок и отдельного groupby для каждого фактора.
+
+Для каждого значения фактора - число объявлений (count), успехов
+(successes), доля успеха (rate, NaN для пустого интервала) и 95%
+доверительный интервал Уилсона (ci_low, ci_high), который не выходит за
+[0, 1] и остается осмысленным для малых групп и долей около 0 или 1.
+"""
+from .deps import np, pd
+from .success_model import DESCRIPTION_BINS, DESCRIPTION_GROUPS, PHOTO_BINS, PHOTO_GROUPS
+
+# Фактор: колонка предобработанных ячеек и интервалы значений (None - по самим значениям)
+FACTORS = {
+    'animal_type': ('тип_животного', None),
+    'has_photo': ('есть_фото', None),
+    'photo_count': ('количество_фото', (PHOTO_BINS, PHOTO_GROUPS)),
+    'has_description': ('наличие_описания', None),
+    'description_length': ('длина_описания', (DESCRIPTION_BINS, DESCRIPTION_GROUPS)),
+    'has_contacts': ('есть_контакты', None),
+}
+
+# Квантиль стандартного нормального распределения для 95% интервала
+Z_95 = 1.959963984540054
+
+TABLE_COLUMNS = ['count', 'successes', 'rate', 'ci_low', 'ci_high']
+
+
+def interval_codes(values, bins, labels):
+    """
+    Номера интервалов (b[i], b[i+1]] как у pd.cut; значения вне границ и
+    пропуски - -1
+    """
+    codes = np.searchsorted(bins, np.asarray(values, dtype=float), side='left') - 1
+    codes[(codes < 0) | (codes >= len(labels))] = -1
+    return codes
+
+
+def encode(cells):
+    """
+    Матрица номеров значений факторов, которые есть в ячейках, и значения
+    каждого фактора (отсортированные, как в groupby, или подписи интервалов)
+    """
+    factors = {name: spec for name, spec in FACTORS.items() if spec[0] in cells.columns}
+    codes = np.empty((len(cells), len(factors)), dtype='int64')
+    levels = {}
+    for j, (name, (column, intervals)) in enumerate(factors.items()):
+        values = cells[column].to_numpy()
+        if intervals is None:
+            codes[:, j], levels[name] = pd.factorize(values, sort=True)
+        else:
+            bins, labels = intervals
+            levels[name] = np.asarray(labels, dtype=object)
+            codes[:, j] = interval_codes(values, bins, labels)
+    return codes, levels
+
+
+def wilson_interval(successes, counts, z=Z_95):
+    """Доверительный интервал Уилсона для доли успеха (NaN для пустых групп)"""
+    counts = np.asarray(counts, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = successes / counts
+        denominator = 1 + z ** 2 / counts
+        center = (rate + z ** 2 / (2 * counts)) / denominator
+        half_width = z * np.sqrt(rate * (1 - rate) / counts + z ** 2 / (4 * counts ** 2)) / denominator
+    return center - half_width, center + half_width
+
+
+def aggregate(cells):
+    """
+    Общее число объявлений и успехов и таблица по значениям каждого фактора
+    (колонки TABLE_COLUMNS) за один проход по ячейкам
+    """
+    codes, levels = encode(cells)
+    sizes = np.array([len(values) for values in levels.values()], dtype='int64')
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    counts = cells['n'].to_numpy().astype(float)
+    successes = cells['is_success'].to_numpy() * counts
+    valid = codes >= 0
+    positions = (codes + offsets)[valid]
+    # Номер ячейки для каждого учтенного значения: матрица разворачивается по строкам
+    rows = np.nonzero(valid)[0]
+    total_counts = np.bincount(positions, weights=counts[rows], minlength=sizes.sum())
+    total_successes = np.bincount(positions, weights=successes[rows], minlength=sizes.sum())
+
+    factors = {}
+    for (name, values), start, size in zip(levels.items(), offsets, sizes):
+        count = total_counts[start:start + size].astype('int64')
+        success = total_successes[start:start + size].astype('int64')
+        ci_low, ci_high = wilson_interval(success, count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = success / count.astype(float)
+        factors[name] = pd.DataFrame({'count': count, 'successes': success, 'rate': rate,
+                                      'ci_low': ci_low, 'ci_high': ci_high}, index=pd.Index(values, name=name))
+
+    return {
+        'total': {'count': int(counts.sum()), 'successes': int(successes.sum())},
+        'factors': factors,
+    }
+
+
+def to_json(factors):
+    """Таблицы факторов в виде словарей для JSON статистики (значения - строки)"""
+    result = {}
+    for name, table in factors.items():
+        columns = {column: table[column].tolist() for column in TABLE_COLUMNS}
+        result[name] = {str(value): {column: columns[column][i] for column in TABLE_COLUMNS}
+                        for i, value in enumerate(table.index)}
+    return result
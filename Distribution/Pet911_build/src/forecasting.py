@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Прогноз многих коротких временных рядов сразу - например, количества
+заявок по месяцам для каждого региона и типа животного.
+
+Ряды передаются матрицей (ряды × периоды, пустые периоды - нули). Каждая
+модель обрабатывает все ряды за один проход по периодам векторными
+операциями NumPy, без цикла по рядам:
+    - naive: последнее значение;
+    - mean: среднее за всю историю;
+    - seasonal_naive: значение того же сезона прошлого цикла (SEASON периодов);
+    - ses: простое экспоненциальное сглаживание, параметр сглаживания
+      выбирается для каждого ряда по сетке ALPHAS;
+    - holt: сглаживание с затухающим трендом, параметры - по сеткам.
+
+Интервалы прогноза строятся по остаткам прогноза на шаг вперед внутри
+ряда (нормальное приближение, нижняя граница не меньше нуля); если
+остатков нет, разброс оценивается как у пуассоновских количеств.
+Модель 'auto' выбирает для каждого ряда модель с наименьшей ошибкой
+скользящей проверки (backtest), а если ряд для проверки слишком короткий -
+среднее (параметры сглаживания по двум-трем точкам не определяются).
+
+    result = forecast(values, horizon=3)
+    result['mean'], result['lower'], result['upper'], result['model']
+"""
+import time
+from statistics import NormalDist
+
+from .deps import np
+
+SEASON = 12
+DEFAULT_LEVEL = 0.9
+
+# Сетки параметров сглаживания
+ALPHAS = np.linspace(0.1, 0.9, 9)
+BETAS = np.array([0.05, 0.1, 0.2, 0.3])
+DAMPING = 0.9
+
+# Первая точка проверки: модели обучаются минимум на MIN_TRAIN периодах
+MIN_TRAIN = 3
+# Модель для прогноза выбирается по последним BACKTEST_ORIGINS точкам проверки
+BACKTEST_ORIGINS = 6
+
+# Названия моделей для подписей и таблиц
+MODEL_TITLES = {
+    'naive': 'последнее значение',
+    'mean': 'среднее',
+    'seasonal_naive': 'сезонная',
+    'ses': 'экспоненциальное сглаживание',
+    'holt': 'сглаживание с трендом',
+}
+
+
+# ----------------------------- Модели -----------------------------
+def residual_sigma(values, residuals):
+    """Разброс ошибки прогноза на шаг вперед для каждого ряда"""
+    if residuals.shape[1] == 0:
+        # Остатков нет: разброс пуассоновских количеств с тем же средним
+        return np.sqrt(np.maximum(values.mean(axis=1), 1.0))
+    return np.sqrt(np.mean(residuals ** 2, axis=1))
+
+
+def naive(values, horizon):
+    """Последнее значение; разброс растет как корень из горизонта"""
+    mean = np.repeat(values[:, -1:], horizon, axis=1)
+    sigma = residual_sigma(values, np.diff(values, axis=1))
+    return mean, sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))
+
+
+def mean_model(values, horizon):
+    """Среднее за всю историю"""
+    periods = values.shape[1]
+    mean = np.repeat(values.mean(axis=1, keepdims=True), horizon, axis=1)
+    sigma = values.std(axis=1, ddof=1) if periods > 1 else residual_sigma(values, values[:, :0])
+    return mean, np.repeat((sigma * np.sqrt(1 + 1 / periods))[:, None], horizon, axis=1)
+
+
+def seasonal_naive(values, horizon, season=SEASON):
+    """Значение того же сезона прошлого цикла"""
+    steps = np.arange(horizon)
+    mean = values[:, values.shape[1] - season + steps % season]
+    sigma = residual_sigma(values, values[:, season:] - values[:, :-season])
+    return mean, sigma[:, None] * np.sqrt(steps // season + 1)
+
+
+def ses(values, horizon, alphas=ALPHAS):
+    """Простое экспоненциальное сглаживание; все значения параметра считаются одновременно"""
+    level = np.repeat(values[:, :1], len(alphas), axis=1)  # ряды × параметры
+    sse = np.zeros_like(level)
+    for t in range(1, values.shape[1]):
+        error = values[:, t:t + 1] - level
+        sse += error ** 2
+        level += alphas * error
+
+    rows = np.arange(len(values))
+    best = np.argmin(sse, axis=1)
+    alpha = alphas[best]
+    if values.shape[1] > 1:
+        sigma = np.sqrt(sse[rows, best] / (values.shape[1] - 1))
+    else:
+        sigma = residual_sigma(values, values[:, :0])
+
+    mean = np.repeat(level[rows, best][:, None], horizon, axis=1)
+    scale = np.sqrt(1 + np.arange(horizon)[None, :] * alpha[:, None] ** 2)
+    return mean, sigma[:, None] * scale
+
+
+def holt(values, horizon, alphas=ALPHAS, betas=BETAS, damping=DAMPING):
+    """Сглаживание с затухающим трендом; все сочетания параметров считаются одновременно"""
+    alpha, beta = (grid.ravel() for grid in np.meshgrid(alphas, betas))
+    level = np.repeat(values[:, :1], len(alpha), axis=1)
+    trend = np.repeat(values[:, 1:2] - values[:, :1], len(alpha), axis=1)
+    sse = np.zeros_like(level)
+    for t in range(1, values.shape[1]):
+        predicted = level + damping * trend
+        error = values[:, t:t + 1] - predicted
+        sse += error ** 2
+        level = predicted + alpha * error
+        trend = damping * trend + alpha * beta * error
+
+    rows = np.arange(len(values))
+    best = np.argmin(sse, axis=1)
+    sigma = np.sqrt(sse[rows, best] / (values.shape[1] - 1))
+
+    damped_steps = np.cumsum(damping ** np.arange(1, horizon + 1))
+    mean = level[rows, best][:, None] + damped_steps[None, :] * trend[rows, best][:, None]
+    # Дисперсия ошибки на h шагов: 1 + сумма (alpha * (1 + j * beta))^2 по 0 < j < h
+    steps = np.arange(1, horizon + 1)
+    terms = (alpha[best][:, None] * (1 + steps[None, :] * beta[best][:, None])) ** 2
+    variance = 1 + np.cumsum(terms, axis=1) - terms
+    return mean, sigma[:, None] * np.sqrt(variance)
+
+
+# Модель и минимальная длина ряда
+MODELS = {
+    'naive': (naive, 1),
+    'mean': (mean_model, 1),
+    'seasonal_naive': (seasonal_naive, SEASON + 1),
+    'ses': (ses, 2),
+    'holt': (holt, 3),
+}
+
+
+def available_models(periods):
+    """Модели, которые можно обучить на ряде длины periods"""
+    return [name for name, (_, min_length) in MODELS.items() if periods >= min_length]
+
+
+def as_matrix(values):
+    values = np.asarray(values, dtype=float)
+    return values[None, :] if values.ndim == 1 else values
+
+
+# ----------------------------- Проверка -----------------------------
+def backtest(values, models=None, horizon=1, level=DEFAULT_LEVEL, min_train=MIN_TRAIN, max_origins=None):
+    """
+    Скользящая проверка: модели обучаются на первых t периодах и
+    прогнозируют следующие horizon для каждого t, начиная с min_train (и
+    минимальной длины самой требовательной модели); max_origins - только
+    последние точки проверки. Возвращает число точек
+    проверки и для каждой модели среднюю абсолютную ошибку (mae) и долю
+    фактических значений внутри интервала (coverage) по каждому ряду.
+    """
+    values = as_matrix(values)
+    periods = values.shape[1]
+    models = models or available_models(periods)
+    start = max([min_train] + [MODELS[name][1] for name in models])
+    origins = range(start, periods - horizon + 1)
+    if max_origins:
+        origins = origins[-max_origins:]
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+
+    scores = {}
+    for name in models:
+        abs_error = np.zeros(len(values))
+        covered = np.zeros(len(values))
+        for origin in origins:
+            mean, sigma = MODELS[name][0](values[:, :origin], horizon)
+            actual = values[:, origin:origin + horizon]
+            abs_error += np.abs(actual - mean).mean(axis=1)
+            covered += (np.abs(actual - mean) <= z * sigma).mean(axis=1)
+        count = len(origins)
+        scores[name] = {
+            'mae': abs_error / count if count else np.full(len(values), np.nan),
+            'coverage': covered / count if count else np.full(len(values), np.nan),
+        }
+    return {'origins': len(origins), 'scores': scores}
+
+
+# ----------------------------- Прогноз -----------------------------
+def forecast(values, horizon=3, model='auto', level=DEFAULT_LEVEL):
+    """
+    Прогноз рядов (матрица ряды × периоды или один ряд) на horizon периодов.
+    Возвращает словарь: mean, lower, upper (ряды × horizon), model (имя модели
+    каждого ряда), backtest_mae (ошибка выбранной модели на проверке, NaN -
+    проверки не было), level, elapsed (с) и series_per_second.
+    """
+    started = time.perf_counter()
+    values = as_matrix(values)
+    periods = values.shape[1]
+    if periods == 0:
+        raise ValueError("Для прогноза нужен хотя бы один период")
+
+    if model != 'auto' and model not in MODELS:
+        raise ValueError(f"Неизвестная модель: {model}. Допустимые: auto, {', '.join(MODELS)}")
+    models = available_models(periods) if model == 'auto' else [model]
+    if model != 'auto' and periods < MODELS[model][1]:
+        raise ValueError(f"Модели {model} нужно не меньше {MODELS[model][1]} периодов, в рядах {periods}")
+
+    # Ошибка каждой модели на проверке; без проверки выбирается среднее
+    report = backtest(values, models, level=level, max_origins=BACKTEST_ORIGINS)
+    mae = np.vstack([report['scores'][name]['mae'] for name in models])
+    if report['origins']:
+        choice = np.argmin(mae, axis=0)
+    else:
+        choice = np.full(len(values), models.index('mean') if 'mean' in models else 0)
+
+    rows = np.arange(len(values))
+    forecasts = [MODELS[name][0](values, horizon) for name in models]
+    mean = np.stack([result[0] for result in forecasts])[choice, rows]
+    sigma = np.stack([result[1] for result in forecasts])[choice, rows]
+
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    mean = np.maximum(mean, 0)
+    elapsed = time.perf_counter() - started
+    return {
+        'mean': mean,
+        'lower': np.maximum(mean - z * sigma, 0),
+        'upper': mean + z * sigma,
+        'model': np.array(models)[choice],
+        'backtest_mae': mae[choice, rows],
+        'level': level,
+        'elapsed': elapsed,
+        'series_per_second': len(values) / elapsed if elapsed > 0 else float('inf'),
+    }
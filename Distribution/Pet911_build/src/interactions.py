@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Поиск взаимодействий факторов объявления для step_2_2: какие сочетания
+региона, типа животного, количества фото, длины описания, контактов и
+активности обсуждения связаны с успехом сильнее, чем следует из каждого
+фактора в отдельности.
+
+Файл датасета читается частями (только нужные колонки), строки сразу
+сводятся к группам факторов (интервалы фото и длины описания - как в
+модели успеха, интервалы комментариев - как в step_2_1), поэтому дальше
+работа идет с ячейками - уникальными сочетаниями групп с числом
+объявлений (n) и успехов. Ячейки кодируются в матрицу номеров групп
+(ячейка × фактор), и для каждого набора факторов число объявлений и успехов
+по всем сочетаниям их групп считается двумя вызовами np.bincount по
+смешанному номеру сочетания.
+
+Эффект взаимодействия сочетания S - остаток доли успеха после вычета
+вкладов всех его частей (включения-исключения по подмножествам T ⊆ S):
+    effect(S) = Σ (-1)^(|S| - |T|) · доля(T), доля(∅) - общая доля успеха;
+для пары - доля(ab) - доля(a) - доля(b) + доля(∅). Сочетания с числом
+объявлений меньше MIN_SUPPORT не учитываются, остальные ранжируются по
+модулю эффекта.
+"""
+import itertools
+import time
+
+from . import config
+from .chunked import DEFAULT_CHUNKSIZE
+from .cube import SUCCESS_STATUSES, read_cells, region_animal_labels
+from .deps import np, pd
+from .phases import phase
+from .success_model import DESCRIPTION_BINS, DESCRIPTION_GROUPS, PHOTO_BINS, PHOTO_GROUPS, group_label
+
+# Колонки датасета, которые читаются для поиска
+READ_COLUMNS = ['регион', 'тип_животного', 'количество_фото', 'Длина_описания_в_словах', 'есть_контакты',
+                'количество_комментариев', 'статус']
+
+FACTORS = ['регион', 'тип_животного', 'группа_фото', 'группа_описания', 'есть_контакты',
+           'активность_комментариев']
+
+# Группы по количеству комментариев (как в step_2_1)
+COMMENT_BINS = [-1, 0, 2, 5, 10, 100]
+COMMENT_LABELS = ['0', '1-2', '3-5', '6-10', '10+']
+
+# Наибольшее число факторов во взаимодействии и минимальное число объявлений в сочетании
+MAX_ORDER = 3
+MIN_SUPPORT = 30
+
+TABLE_COLUMNS = ['взаимодействие', 'порядок', 'сочетание', 'объявлений', 'успехов', 'доля_успеха',
+                 'ожидаемая_доля', 'эффект_взаимодействия', 'отклонение_от_среднего']
+
+
+# ----------------------------- Ячейки -----------------------------
+def factor_groups(df, ad_type):
+    """Группы факторов и признак успеха для части строк датасета"""
+    from .step_3_1 import typed_column
+
+    def numeric(column):
+        return pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy()
+
+    return pd.DataFrame({
+        **region_animal_labels(df),
+        'группа_фото': group_label(numeric('количество_фото'), PHOTO_BINS, PHOTO_GROUPS),
+        'группа_описания': group_label(numeric('Длина_описания_в_словах'), DESCRIPTION_BINS, DESCRIPTION_GROUPS),
+        'есть_контакты': np.where(typed_column(df['есть_контакты'], 'есть_контакты') == 1, 'да', 'нет'),
+        'активность_комментариев': group_label(numeric('количество_комментариев'), COMMENT_BINS, COMMENT_LABELS),
+        'n': 1,
+        'успехи': (df['статус'] == SUCCESS_STATUSES[ad_type]).astype('int64'),
+    }, index=df.index)
+
+
+# ----------------------------- Поиск -----------------------------
+def encode(cells):
+    """Матрица номеров групп (ячейка × фактор) и группы каждого фактора"""
+    codes = np.empty((len(cells), len(FACTORS)), dtype='int64')
+    levels = []
+    for j, factor in enumerate(FACTORS):
+        codes[:, j], uniques = pd.factorize(cells[factor], sort=True)
+        levels.append(np.asarray(uniques, dtype=object))
+    return codes, levels
+
+
+def subset_tables(codes, shape, counts, successes, max_order):
+    """
+    Число объявлений и успехов по сочетаниям групп для всех наборов не более
+    чем из max_order факторов: {набор номеров факторов: (объявления, успехи)},
+    массивы размерности по числу факторов набора
+    """
+    tables = {(): (np.array(counts.sum()), np.array(successes.sum()))}
+    for order in range(1, max_order + 1):
+        for subset in itertools.combinations(range(len(shape)), order):
+            dims = tuple(shape[i] for i in subset)
+            keys = np.ravel_multi_index(codes[:, subset].T, dims)
+            size = int(np.prod(dims))
+            tables[subset] = (np.bincount(keys, weights=counts, minlength=size).reshape(dims),
+                              np.bincount(keys, weights=successes, minlength=size).reshape(dims))
+    return tables
+
+
+def rate(table):
+    counts, successes = table
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return successes / counts
+
+
+def interaction_effect(subset, tables):
+    """Эффект взаимодействия для всех сочетаний групп набора subset (включения-исключения)"""
+    effect = np.zeros(tables[subset][0].shape)
+    for order in range(len(subset) + 1):
+        sign = (-1) ** (len(subset) - order)
+        for part in itertools.combinations(subset, order):
+            # Доля по части набора, развернутая на оси всего набора
+            shape = [tables[subset][0].shape[i] if factor in part else 1 for i, factor in enumerate(subset)]
+            effect = effect + sign * rate(tables[part]).reshape(shape)
+    return effect
+
+
+def scan(cells, min_support=MIN_SUPPORT, max_order=MAX_ORDER):
+    """Таблица взаимодействий 2..max_order факторов, ранжированная по модулю эффекта"""
+    codes, levels = encode(cells)
+    shape = [len(values) for values in levels]
+    counts = cells['n'].to_numpy(dtype=float)
+    successes = cells['успехи'].to_numpy(dtype=float)
+    tables = subset_tables(codes, shape, counts, successes, max_order)
+    base_rate = rate(tables[()])
+
+    parts = []
+    for order in range(2, max_order + 1):
+        for subset in itertools.combinations(range(len(FACTORS)), order):
+            n, s = tables[subset]
+            effect = interaction_effect(subset, tables)
+            selected = np.nonzero(n >= min_support)
+            if not len(selected[0]):
+                continue
+            rates = s[selected] / n[selected]
+            labels = [[f'{FACTORS[factor]}={value}' for value in levels[factor][index]]
+                      for factor, index in zip(subset, selected)]
+            parts.append(pd.DataFrame({
+                'взаимодействие': ' × '.join(FACTORS[factor] for factor in subset),
+                'порядок': order,
+                'сочетание': ['; '.join(combination) for combination in zip(*labels)],
+                'объявлений': n[selected].astype('int64'),
+                'успехов': s[selected].astype('int64'),
+                'доля_успеха': rates,
+                'ожидаемая_доля': rates - effect[selected],
+                'эффект_взаимодействия': effect[selected],
+                'отклонение_от_среднего': rates - base_rate,
+            }))
+
+    if not parts:
+        return pd.DataFrame(columns=TABLE_COLUMNS)
+    table = pd.concat(parts, ignore_index=True)
+    order = np.argsort(-np.abs(table['эффект_взаимодействия'].to_numpy()), kind='stable')
+    return table.iloc[order].reset_index(drop=True)
+
+
+def scan_dataset(dataset_type, display_name, filters=None, chunksize=None, min_support=MIN_SUPPORT):
+    """Поиск взаимодействий для датасета и таблица в папке результатов главы 2"""
+    started = time.perf_counter()
+    cells = read_cells(config.dataset_path(dataset_type), dataset_type, filters, chunksize or DEFAULT_CHUNKSIZE,
+                       READ_COLUMNS, factor_groups, measures=['n', 'успехи'])
+    if cells is None or cells['n'].sum() == 0:
+        return None
+    with phase('compute'):
+        table = scan(cells, min_support)
+
+    path = config.results_path('Результаты 2 главы анализа',
+                               f'2.2.5. Взаимодействия факторов успеха для {display_name}.csv')
+    table.to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"🔀 Взаимодействия факторов ({display_name}): {len(table)} сочетаний не меньше чем из "
+          f"{min_support} объявлений по {int(cells['n'].sum())} объявлениям за "
+          f"{time.perf_counter() - started:.1f} с")
+    return table
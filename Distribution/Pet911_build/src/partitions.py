@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+Партиционированное хранилище датасетов в стиле Hive.
+
+Раскладка каталогов:
+    data/partitioned/ad_type=lost/year=2025/month=09/region=Moskva/part-<хэш>.csv
+
+Каждый файл партиции - обычный CSV с той же схемой колонок, что и исходный
+датасет, поэтому все загрузчики шагов читают его без изменений. Фильтры
+отсекают лишние каталоги до чтения файлов. Хранилище пополняется только
+добавлением файлов: новая выгрузка записывает свои файлы рядом с прежними.
+Объявления, которые есть и в прежних файлах (повторно выгруженные, с тем
+же id), при чтении берутся из самого нового файла, а сжатие хранилища
+(compact_partitions) убирает их прежние записи из старых файлов.
+Корень хранилища по умолчанию берется из src/config.py.
+
+Партиции, построенные из исходного файла при запросе с фильтрами
+(ensure_partitions), помечаются путем и хэшем этого файла
+(ad_type=<тип>/_source.json) и строятся заново, если файл изменился или
+задан другой файл. Новые партиции строятся во временном каталоге корня
+и подменяют прежние целиком; отметка записывается только после подмены,
+а проверка и подмена выполняются под блокировкой корня (файл .lock),
+поэтому процессы, которые одновременно запрашивают партиции, не
+перезаписывают их друг у друга. Хранилище, пополняемое выгрузками
+(python3 -m src.partitions), помечается как пополняемое вручную и из
+исходного файла не перестраивается.
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from . import config
+from .deps import pd
+from .phases import timed
+
+DEFAULT_ROOT = config.DEFAULT_PARTITIONS_ROOT
+
+# Порядок уровней партиционирования
+PARTITION_KEYS = ['ad_type', 'year', 'month', 'region']
+
+# Значение партиции для пустого поля (как в Hive)
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# Отметка об источнике партиций типа объявления и префикс каталогов их пересборки
+SOURCE_STATE = '_source.json'
+REBUILD_PREFIX = '.rebuild-'
+# Файл блокировки корня хранилища на время проверки и подмены партиций
+LOCK_FILE = '.lock'
+
+DATE_PATTERN = re.compile(r'(\d{2})\.(\d{2})\.(\d{4})')
+
+# Прочитанные датасеты для долгоживущего процесса (режим наблюдения, src/watch.py):
+# {(файлы, параметры чтения): (размеры и mtime файлов, DataFrame)}, None - кэш выключен
+_frame_cache = None
+
+
+# ----------------------------- Фильтры -----------------------------
+def normalize_filters(filters):
+    """
+    Приводит фильтры к виду {ключ: множество строковых значений партиций}.
+    Допускаются скалярные значения и списки, год и месяц можно задавать числами.
+    """
+    if not filters:
+        return {}
+
+    normalized = {}
+    for key, values in filters.items():
+        if key not in PARTITION_KEYS:
+            raise ValueError(f"Неизвестный ключ фильтра: {key}. Допустимые: {', '.join(PARTITION_KEYS)}")
+        if values is None:
+            continue
+        if isinstance(values, (str, int)):
+            values = [values]
+
+        prepared = set()
+        for value in values:
+            if value is None:
+                prepared.add(NULL_PARTITION)
+            elif key == 'month':
+                prepared.add(f'{int(value):02d}')
+            else:
+                prepared.add(str(value))
+        normalized[key] = prepared
+
+    return normalized
+
+
+def selects(filters, ad_type):
+    """Проверяет, попадает ли тип объявления (lost/found) под фильтр"""
+    allowed = normalize_filters(filters).get('ad_type')
+    return allowed is None or ad_type in allowed
+
+
+# ----------------------------- Запись партиций -----------------------------
+def partition_values(row_date, row_region):
+    """Вычисляет значения year/month/region для одной строки датасета"""
+    match = DATE_PATTERN.search(str(row_date)) if isinstance(row_date, str) else None
+    if match:
+        year, month = match.group(3), match.group(2)
+    else:
+        year = month = NULL_PARTITION
+
+    region = row_region if isinstance(row_region, str) and row_region.strip() else NULL_PARTITION
+    return year, month, region
+
+
+def partition_dir(root, ad_type, year, month, region):
+    """Путь к каталогу партиции; значения экранируются, как это делает Hive"""
+    return os.path.join(
+        root,
+        f'ad_type={ad_type}',
+        f'year={year}',
+        f'month={month}',
+        f'region={quote(region, safe=" -_.()")}'
+    )
+
+
+def write_partitions(source_file, ad_type, root=None):
+    """
+    Раскладывает CSV-файл выгрузки по партициям.
+    Имя файла партиции строится по хэшу содержимого, поэтому повторная
+    запись той же выгрузки ничего не меняет. Прежние файлы партиций не
+    трогаются; повторно выгруженные объявления убирает compact_partitions.
+    Возвращает список созданных файлов.
+    """
+    root = root or config.partitions_root()
+    # Читаем все значения как строки, чтобы содержимое файлов не менялось
+    df = pd.read_csv(source_file, dtype=str, keep_default_na=False)
+
+    keys = [partition_values(date, region) for date, region in zip(df['дата_публикации'], df['регион'])]
+    df_keys = pd.DataFrame(keys, columns=['year', 'month', 'region'], index=df.index)
+
+    created = []
+    for (year, month, region), index in df_keys.groupby(['year', 'month', 'region']).groups.items():
+        file_path = write_part(partition_dir(root, ad_type, year, month, region), df.loc[index])
+        if file_path is not None:
+            created.append(file_path)
+
+    return created
+
+
+def write_part(directory, part):
+    """
+    Записывает строки part в файл партиции part-<хэш содержимого>.csv.
+    Возвращает путь к файлу или None, если такой файл уже есть.
+    """
+    content = part.to_csv(index=False, quoting=csv.QUOTE_MINIMAL)
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, f'part-{digest}.csv')
+    if os.path.exists(file_path):
+        return None
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def by_age(files):
+    """Файлы от самого старого к самому новому (по времени изменения)"""
+    return sorted(files, key=lambda path: (os.stat(path).st_mtime_ns, path))
+
+
+def compact_partitions(ad_type, root=None):
+    """
+    Убирает из файлов партиций объявления, которые есть в более новых
+    файлах (повторные выгрузки с тем же id). Файл с такими строками
+    заменяется файлом без них (с тем же временем изменения), файл без
+    оставшихся строк удаляется. Возвращает число удаленных строк.
+    """
+    root = root or config.partitions_root()
+    files = by_age(list_partition_files(ad_type, root=root))
+
+    # Для каждого id - самый новый файл, в котором он есть
+    latest = {}
+    for path in files:
+        ids = pd.read_csv(path, usecols=['id'], dtype=str, keep_default_na=False)['id']
+        latest.update(dict.fromkeys(ids, path))
+
+    removed = 0
+    for path in files:
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        keep = df['id'].map(latest).eq(path)
+        if keep.all():
+            continue
+        removed += int((~keep).sum())
+        stat = os.stat(path)
+        if keep.any():
+            new_path = write_part(os.path.dirname(path), df[keep])
+            if new_path is not None:
+                # Сжатый файл сохраняет место прежнего в порядке выгрузок
+                os.utime(new_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.remove(path)
+
+    return removed
+
+
+def read_source_state(root, ad_type):
+    """Отметка об источнике партиций типа объявления (None, если ее нет)"""
+    try:
+        with open(os.path.join(root, f'ad_type={ad_type}', SOURCE_STATE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_source_state(root, ad_type, state):
+    path = os.path.join(root, f'ad_type={ad_type}', SOURCE_STATE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+
+
+@contextmanager
+def locked(root):
+    """
+    Исключительная блокировка корня хранилища между процессами; снимается
+    и при аварийном завершении процесса
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            # LK_LOCK повторяет попытку 10 раз в секунду, затем ошибка - ждем дальше
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def ensure_partitions(source_file, ad_type, root=None):
+    """
+    Создает партиции из исходного файла, если их еще нет, и строит их
+    заново, если изменилось содержимое файла или задан другой файл
+    (хранилище, пополняемое выгрузками, не перестраивается)
+    """
+    from .build_cache import file_digest
+
+    root = root or config.partitions_root()
+    directory = os.path.join(root, f'ad_type={ad_type}')
+    state = {'source': os.path.abspath(source_file), 'digest': file_digest(source_file)}
+    with locked(root):
+        stored = read_source_state(root, ad_type)
+        if stored is not None and (stored.get('manual') or stored == state and os.path.isdir(directory)):
+            return
+
+        action = 'Построение' if not os.path.isdir(directory) else 'Пересборка'
+        print(f"🗂 {action} партиций {ad_type} из {os.path.basename(source_file)}")
+        # Новые партиции строятся в отдельном каталоге и подменяют прежние целиком
+        rebuild_root = tempfile.mkdtemp(prefix=REBUILD_PREFIX, dir=root)
+        try:
+            write_partitions(source_file, ad_type, rebuild_root)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(os.path.join(rebuild_root, f'ad_type={ad_type}'), directory)
+        finally:
+            shutil.rmtree(rebuild_root, ignore_errors=True)
+        # Отметка об источнике - только после полной подмены партиций
+        save_source_state(root, ad_type, state)
+
+
+# ----------------------------- Чтение партиций -----------------------------
+def _matches(directory, key, allowed):
+    """Проверяет, что каталог вида key=value проходит фильтр"""
+    if not directory.startswith(f'{key}='):
+        return False
+    if allowed is None:
+        return True
+    return unquote(directory[len(key) + 1:]) in allowed
+
+
+def list_partition_files(ad_type, filters=None, root=None):
+    """
+    Возвращает отсортированный список файлов партиций, прошедших фильтры.
+    Каталоги, не подходящие под фильтр, отбрасываются без обхода их содержимого.
+    """
+    root = root or config.partitions_root()
+    filters = normalize_filters(filters)
+    if 'ad_type' in filters and ad_type not in filters['ad_type']:
+        return []
+
+    levels = [os.path.join(root, f'ad_type={ad_type}')]
+    if not os.path.isdir(levels[0]):
+        return []
+
+    for key in PARTITION_KEYS[1:]:
+        allowed = filters.get(key)
+        next_levels = []
+        for directory in levels:
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path) and _matches(name, key, allowed):
+                    next_levels.append(path)
+        levels = next_levels
+
+    files = []
+    for directory in levels:
+        files.extend(
+            os.path.join(directory, name)
+            for name in sorted(os.listdir(directory))
+            if name.startswith('part-') and name.endswith('.csv')
+        )
+    return files
+
+
+def dataset_files(file_path, ad_type, filters=None, root=None):
+    """
+    Список физических файлов для чтения датасета.
+    Без фильтров это сам исходный файл, с фильтрами - отобранные партиции.
+    Для типа объявления, который фильтр ad_type исключает, список пуст, и
+    партиции не строятся.
+    """
+    if not normalize_filters(filters):
+        return [file_path]
+    if not selects(filters, ad_type):
+        return []
+
+    ensure_partitions(file_path, ad_type, root)
+    return list_partition_files(ad_type, filters, root)
+
+
+# ----------------------------- Чтение -----------------------------
+def enable_frame_cache(enabled=True):
+    """
+    Хранит прочитанные датасеты в памяти процесса: повторное чтение тех же
+    файлов с теми же параметрами возвращает копию без разбора CSV. Файл,
+    у которого изменились размер или mtime, читается заново.
+    """
+    global _frame_cache
+    _frame_cache = {} if enabled else None
+
+
+def file_state(path):
+    """Размер и mtime файла (None, если файла нет) - признак изменения без чтения содержимого"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+@timed('load')
+def read_dataset(file_path, ad_type, filters=None, root=None, **read_csv_kwargs):
+    """
+    Загружает датасет с учетом фильтров партиций.
+    Параметры read_csv_kwargs передаются в pd.read_csv для каждого файла.
+    """
+    files = dataset_files(file_path, ad_type, filters, root)
+    if _frame_cache is None:
+        return read_files(files, file_path, ad_type, filters, read_csv_kwargs)
+
+    key = (tuple(os.path.abspath(path) for path in files), repr(sorted(read_csv_kwargs.items())))
+    state = tuple(file_state(path) for path in files)
+    cached = _frame_cache.get(key)
+    if cached is None or cached[0] != state:
+        cached = _frame_cache[key] = (state, read_files(files, file_path, ad_type, filters, read_csv_kwargs))
+    # Шаги изменяют полученные таблицы, поэтому в кэше остается нетронутый экземпляр
+    return cached[1].copy()
+
+
+def read_files(files, file_path, ad_type, filters, read_csv_kwargs):
+    """Читает файлы датасета (исходный CSV или отобранные партиции) в одну таблицу"""
+    if not normalize_filters(filters):
+        return pd.read_csv(file_path, **read_csv_kwargs)
+
+    kwargs = dict(read_csv_kwargs)
+    # Каждый файл партиции начинается с заголовка: заменяем его переданными именами
+    if 'names' in kwargs and kwargs.get('header', 'infer') is None:
+        kwargs['header'] = 0
+
+    frames = [pd.read_csv(path, **kwargs) for path in files]
+    if not frames:
+        print(f"⚠️ Ни одна партиция {ad_type} не подходит под фильтры {filters}")
+        header_kwargs = {k: v for k, v in kwargs.items() if k in ('names', 'encoding')}
+        return pd.read_csv(file_path, nrows=0, **header_kwargs)
+
+    return pd.concat(latest_records(files, frames), ignore_index=True)
+
+
+def latest_records(files, frames):
+    """
+    Оставляет каждое объявление (id) только в самом новом из файлов files,
+    порядок файлов и строк не меняется
+    """
+    if len(frames) < 2 or any('id' not in frame.columns for frame in frames):
+        return frames
+
+    position = {path: i for i, path in enumerate(files)}
+    seen = set()
+    result = list(frames)
+    for path in reversed(by_age(files)):
+        i = position[path]
+        ids = frames[i]['id'].astype(str)
+        result[i] = frames[i][~ids.isin(seen)]
+        seen.update(ids)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Добавление выгрузки в партиционированное хранилище')
+    parser.add_argument('source', nargs='?', help='CSV-файл выгрузки (без него - только сжатие хранилища)')
+    parser.add_argument('--ad-type', choices=['lost', 'found'], required=True)
+    parser.add_argument('--root', default=DEFAULT_ROOT)
+    parser.add_argument('--no-compact', action='store_true',
+                        help='не убирать повторно выгруженные объявления из прежних файлов')
+    args = parser.parse_args()
+
+    with locked(args.root):
+        if args.source:
+            created_files = write_partitions(args.source, args.ad_type, args.root)
+            save_source_state(args.root, args.ad_type, {'manual': True})
+            print(f"✅ Добавлено файлов партиций: {len(created_files)}")
+        if not args.no_compact:
+            removed_rows = compact_partitions(args.ad_type, args.root)
+            print(f"🧹 Удалено повторно выгруженных строк: {removed_rows}")
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Замер шагов и их этапов: загрузка, подготовка, вычисления, диаграммы,
+сохранение.
+
+Участки кода шагов помечаются блоком with phase('load') или декоратором
+@timed('preprocess'); все, что не помечено, относится к этапу compute.
+Для каждого этапа считается время (wall и CPU) без вложенных этапов,
+поэтому сумма этапов равна времени шага, и, если включен tracemalloc,
+пик памяти, выделенной Python за время этапа. Пока замер выключен,
+пометка стоит одну проверку флага.
+
+Замер включается:
+    - configure(report=True, memory=..., cprofile=...) - main.py --instrument:
+      отчет каждого шага в results/profiling/<шаг>.json (и <шаг>.prof для
+      cProfile), общий отчет results/profiling/report.json и таблица в консоли;
+    - переменной окружения PET911_PHASES с путем к файлу JSON Lines, куда
+      после каждого шага дописывается строка с замером (benchmarks/scaling.py).
+Процессам-исполнителям шагов настройки передаются явно (settings()).
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from . import config
+
+PHASES = ['load', 'preprocess', 'compute', 'render', 'save']
+
+# Этап для времени шага, не попавшего ни в одну пометку
+DEFAULT_PHASE = 'compute'
+
+ENV_VAR = 'PET911_PHASES'
+
+# Папка отчетов внутри папки результатов
+REPORT_DIR = 'profiling'
+REPORT_NAME = 'report.json'
+
+# Сколько функций с наибольшим собственным временем cProfile попадает в отчет
+CPROFILE_TOP = 15
+
+_settings = {
+    'log': os.environ.get(ENV_VAR) or None,
+    'report': False,
+    'memory': False,
+    'cprofile': False,
+}
+_stack = []  # [этап, начало wall, начало CPU, wall вложенных, CPU вложенных, пик памяти]
+_totals = None  # {этап: {'wall', 'cpu', 'peak'}} текущего шага, None - шаг не замеряется
+
+
+def configure(log=None, report=False, memory=False, cprofile=False):
+    """Задает замер шагов (см. описание модуля)"""
+    _settings.update(log=log or os.environ.get(ENV_VAR) or None, report=report, memory=memory, cprofile=cprofile)
+
+
+def settings():
+    """Текущие настройки в виде словаря для configure(**settings()) в другом процессе"""
+    return dict(_settings)
+
+
+def enabled():
+    """Замер шагов включен"""
+    return bool(_settings['log'] or _settings['report'])
+
+
+def report_dir():
+    """Папка отчетов замера в папке результатов"""
+    return config.results_path(REPORT_DIR)
+
+
+# ----------------------------- Пометки этапов -----------------------------
+def _traced_peak():
+    return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+
+
+@contextmanager
+def phase(name):
+    """Относит время блока к этапу name (без вложенных этапов)"""
+    if _totals is None:
+        yield
+        return
+
+    if _stack and tracemalloc.is_tracing():
+        # Пик до вложенного этапа сохраняется у внешнего, счетчик пика сбрасывается
+        _stack[-1][5] = max(_stack[-1][5], _traced_peak())
+        tracemalloc.reset_peak()
+    entry = [name, time.perf_counter(), time.process_time(), 0.0, 0.0, 0]
+    _stack.append(entry)
+    try:
+        yield
+    finally:
+        _stack.pop()
+        wall = time.perf_counter() - entry[1]
+        cpu = time.process_time() - entry[2]
+        peak = max(entry[5], _traced_peak())
+
+        totals = _totals.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak': 0})
+        totals['wall'] += wall - entry[3]
+        totals['cpu'] += cpu - entry[4]
+        totals['peak'] = max(totals['peak'], peak)
+        if _stack:
+            _stack[-1][3] += wall
+            _stack[-1][4] += cpu
+            _stack[-1][5] = max(_stack[-1][5], peak)
+
+
+def timed(name):
+    """Декоратор: относит время вызова функции к этапу name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _totals is None:
+                return func(*args, **kwargs)
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ----------------------------- Замер шага -----------------------------
+@contextmanager
+def step(name):
+    """Замеряет этапы шага и сохраняет итог (файл PET911_PHASES и/или отчет в results)"""
+    global _totals
+    if not enabled():
+        yield
+        return
+
+    started_tracing = _settings['memory'] and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if _settings['cprofile'] else None
+
+    _totals = {}
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with phase(DEFAULT_PHASE):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        totals, _totals = _totals, None
+        if started_tracing:
+            tracemalloc.stop()
+        save_step_record(step_record(name, totals), profiler)
+
+
+def step_record(name, totals):
+    """Итог замера шага: время и пик памяти всего шага и по этапам"""
+    return {
+        'step': name,
+        'pid': os.getpid(),
+        'wall': round(sum(entry['wall'] for entry in totals.values()), 4),
+        'cpu': round(sum(entry['cpu'] for entry in totals.values()), 4),
+        'peak_mb': round(max((entry['peak'] for entry in totals.values()), default=0) / 1024 ** 2, 2)
+        if _settings['memory'] else None,
+        'phases': {
+            key: {
+                'wall': round(entry['wall'], 4),
+                'cpu': round(entry['cpu'], 4),
+                'peak_mb': round(entry['peak'] / 1024 ** 2, 2) if _settings['memory'] else None,
+            }
+            for key, entry in sorted(totals.items(), key=lambda item: PHASES.index(item[0])
+                                     if item[0] in PHASES else len(PHASES))
+        },
+    }
+
+
+def profile_summary(profiler, path):
+    """Сохраняет cProfile в файл pstats и возвращает функции с наибольшим собственным временем"""
+    profiler.dump_stats(path)
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    top = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+            stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:CPROFILE_TOP]:
+        top.append({'function': f"{os.path.basename(filename)}:{line}({function})", 'calls': calls,
+                    'own': round(own, 4), 'cumulative': round(cumulative, 4)})
+    return {'file': path, 'top': top}
+
+
+def save_step_record(record, profiler=None):
+    if _settings['log']:
+        with open(_settings['log'], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    if _settings['report']:
+        directory = report_dir()
+        os.makedirs(directory, exist_ok=True)
+        if profiler is not None:
+            record = dict(record, cprofile=profile_summary(profiler, os.path.join(directory, f"{record['step']}.prof")))
+        with open(os.path.join(directory, f"{record['step']}.json"), 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+
+def read_log(path):
+    """Записи файла PET911_PHASES [{'step', 'pid', 'wall', 'cpu', 'peak_mb', 'phases'}]"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ----------------------------- Общий отчет -----------------------------
+def write_report(step_names):
+    """Собирает отчеты шагов в results/profiling/report.json и возвращает их"""
+    directory = report_dir()
+    records = []
+    for name in step_names:
+        path = os.path.join(directory, f'{name}.json')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                records.append(json.load(f))
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, REPORT_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'settings': {key: _settings[key] for key in ('memory', 'cprofile')}, 'steps': records},
+                  f, ensure_ascii=False, indent=2)
+    return records
+
+
+def print_report(records):
+    """Таблица времени этапов (wall / CPU) и пиков памяти по шагам"""
+    if not records:
+        return
+    memory = any(record.get('peak_mb') is not None for record in records)
+
+    print(f"\n🔬 Этапы шагов, с (wall / CPU){', пик памяти Python, МБ' if memory else ''}:")
+    header = f"   {'шаг':<10}{'всего':>15}" + ''.join(f"{name:>15}" for name in PHASES)
+    print(header + (f"{'память':>9}" if memory else ''))
+    for record in records:
+        line = f"   {record['step']:<10}{record['wall']:>7.2f} /{record['cpu']:>6.2f}"
+        for name in PHASES:
+            entry = record['phases'].get(name)
+            line += f"{entry['wall']:>7.2f} /{entry['cpu']:>6.2f}" if entry else f"{'-':>15}"
+        if memory:
+            line += f"{record['peak_mb']:>9.1f}"
+        print(line)
+
+    for record in records:
+        if record.get('cprofile'):
+            heaviest = record['cprofile']['top'][:3]
+            functions = ', '.join(f"{entry['function']} {entry['own']:.2f} с" for entry in heaviest)
+            print(f"   {record['step']}: {record['cprofile']['file']} - {functions}")
+    print(f"💾 Отчет: {os.path.join(report_dir(), REPORT_NAME)}")
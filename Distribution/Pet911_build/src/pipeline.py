@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Описание шагов конвейера анализа и их запуск.
+
+Для каждого шага указаны входные датасеты, дополнительные входные файлы
+и шаблоны выходных файлов (относительно папки результатов), параметры,
+которые принимает функция шага, сторонние пакеты, которые шаг
+импортирует при выполнении (см. src/deps.py), и используемые шагом
+модули src, кроме общих. По этим данным build_cache
+решает, можно ли переиспользовать результаты прошлого запуска. Пути к
+датасетам и папке результатов задаются в src/config.py.
+"""
+import importlib
+import os
+import time
+
+from . import phases
+from .deps import missing_packages
+
+STATS_DIR = os.path.join('Результаты 3 главы анализа', '3.1 Stats for 3.2 Prediction')
+
+STEPS = [
+    {
+        'name': 'step_1_1',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 1 главы анализа/1.1*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy', 'matplotlib', 'seaborn'],
+        # Считается по агрегатному кубу (src/cube.py), который строится до запуска шага
+        'cube': True,
+    },
+    {
+        'name': 'step_1_2',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 1 главы анализа/1.2*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy', 'matplotlib', 'seaborn'],
+        # Ряды по времени - из счетчиков (src/time_counters.py), которые пополняются до запуска шага
+        'counters': True,
+        # Прогноз по регионам и типам животных - по агрегатному кубу (src/cube.py)
+        'cube': True,
+    },
+    {
+        'name': 'step_2_1',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 2 главы анализа/2.1*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy', 'matplotlib', 'scipy'],
+    },
+    {
+        'name': 'step_2_2',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 2 главы анализа/2.2*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy', 'matplotlib'],
+        # Считается по агрегатному кубу (src/cube.py), который строится до запуска шага;
+        # взаимодействия факторов (src/interactions.py) - по колонкам датасета, прочитанным частями
+        'cube': True,
+        # Модули шага, кроме общих (build_cache.SHARED_SOURCES): interactions.py берет typed_column из step_3_1
+        'sources': ['interactions.py', 'step_3_1.py'],
+    },
+    {
+        'name': 'step_2_3',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 2 главы анализа/2.3*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy'],
+        # Проверки по агрегатному кубу (src/cube.py), который строится до запуска шага
+        'cube': True,
+        # Проверки значимости (src/significance.py) берут частоты комментариев из step_2_1,
+        # typed_column из step_3_1 и тип местности и породистость из step_5
+        'sources': ['significance.py', 'step_2_1.py', 'step_3_1.py', 'step_5.py', 'survival.py'],
+    },
+    {
+        'name': 'step_3_1',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 3 главы анализа/3.1*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy', 'matplotlib', 'seaborn'],
+        # Считается по агрегатному кубу (src/cube.py), который строится до запуска шага
+        'cube': True,
+    },
+    {
+        'name': 'step_3_2',
+        'datasets': [],
+        'inputs': [
+            os.path.join(STATS_DIR, 'pet911_lost_statistics.json'),
+            os.path.join(STATS_DIR, 'pet911_found_statistics.json'),
+            os.path.join(STATS_DIR, 'pet911_lost_model.json'),
+            os.path.join(STATS_DIR, 'pet911_found_model.json'),
+        ],
+        'outputs': ['Результаты 3 главы анализа/3.2*'],
+        'params': ['ads_file'],
+        'requires': ['pandas', 'numpy', 'matplotlib'],
+        # Прогноз строится по ответам пользователя, поэтому всегда запускается заново
+        'interactive': True,
+        # С файлом объявлений шаг работает без диалога; файл входит в отпечаток шага
+        'batch_input': 'ads_file',
+    },
+    {
+        'name': 'step_4_1',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 4 главы анализа/4.1*'],
+        'params': ['filters'],
+        'requires': ['pandas', 'matplotlib', 'seaborn', 'sklearn', 'nltk', 'pymorphy3'],
+    },
+    {
+        'name': 'step_4_2',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 4 главы анализа/4.2*'],
+        'params': ['filters'],
+        'requires': ['pandas', 'numpy', 'matplotlib', 'seaborn', 'sklearn'],
+    },
+    {
+        'name': 'step_5',
+        'datasets': ['lost', 'found'],
+        'outputs': ['Результаты 5 главы анализа/*'],
+        'params': ['filters', 'chunksize'],
+        'requires': ['pandas', 'numpy', 'matplotlib', 'seaborn', 'scipy'],
+        # Считается по агрегатному кубу (src/cube.py), который строится до запуска шага
+        'cube': True,
+        # Анализ выживаемости (src/survival.py) берет typed_column из step_3_1
+        'sources': ['survival.py', 'step_3_1.py'],
+    },
+]
+
+STEPS_BY_NAME = {step['name']: step for step in STEPS}
+
+
+def get_step_function(name):
+    """Импортирует модуль шага только при необходимости и возвращает функцию шага"""
+    module = importlib.import_module(f'.{name}', __package__)
+    return getattr(module, name)
+
+
+def step_params(step, params):
+    """Оставляет только те параметры, которые принимает функция шага"""
+    return {key: value for key, value in (params or {}).items() if key in step['params']}
+
+
+def is_interactive(step, kwargs):
+    """Шаг ждет ввода пользователя: интерактивный и не получил файл для пакетного режима"""
+    return bool(step.get('interactive')) and not kwargs.get(step.get('batch_input'))
+
+
+def run_step(step, params=None):
+    """Запускает один шаг и возвращает время выполнения в секундах"""
+    missing = missing_packages(step.get('requires', []))
+    if missing:
+        raise ImportError(f"Для шага {step['name']} не установлены пакеты: {', '.join(missing)}")
+
+    func = get_step_function(step['name'])
+    started = time.perf_counter()
+    with phases.step(step['name']):
+        func(**step_params(step, params))
+    return time.perf_counter() - started
+
+
+def run_pipeline(step_names=None, params=None, force=False, workers=1, render_workers=None,
+                 profile='publication'):
+    """
+    Выполняет шаги конвейера.
+    Шаги, отпечаток входов которых совпадает с сохраненным в манифесте,
+    пропускаются, а их результаты в папке results переиспользуются.
+    force=True очищает results и пересчитывает все шаги.
+    workers - число процессов для независимых шагов (None - по числу ядер),
+    см. src/scheduler.py; render_workers - число процессов отрисовки
+    диаграмм в каждом шаге, profile - профиль вывода диаграмм
+    (publication, preview, vector), см. src/rendering.py.
+    Возвращает списки пересчитанных и переиспользованных шагов.
+    """
+    from .scheduler import run_scheduled
+
+    report = run_scheduled(step_names, params, force, workers, render_workers, profile)
+    rebuilt = [name for name, entry in report.items() if entry['status'] == 'rebuilt']
+    reused = [name for name, entry in report.items() if entry['status'] == 'reused']
+    return rebuilt, reused
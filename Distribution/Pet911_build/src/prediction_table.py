@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Таблица прогнозов step_3_2 для всех сочетаний признаков объявления.
+
+Прогноз зависит только от типа объявления, типа животного, интервала
+количества фото и длины описания, наличия контактов и региона (см.
+src/success_model.py), поэтому вероятность, базовый уровень, влияние
+факторов и рекомендации считаются один раз для каждой ячейки по
+PetSearchPredictor: моделью успеха или, если модели нет, поправками по
+статистике. Прогноз для объявлений - это выборка из массивов по номерам
+значений признаков, без обхода модели и статистики по каждой строке.
+
+Регион не входит в ячейки таблицы: в модели он добавляет свой вклад к
+логиту, а поправки по статистике от региона не зависят. Для модели в
+ячейке хранится сумма вкладов остальных признаков и каждый вклад по
+отдельности, а вклад региона прибавляется при выборке
+(region_offsets), поэтому размер и время построения таблицы не растут с
+числом регионов. Вероятность и влияние факторов для объявлений с
+регионом считаются векторно, тексты факторов - для разных сочетаний
+ячейки и региона в пакете, а не для каждой строки.
+
+Все типы животных и регионы, которых нет в статистике и модели, попадают в
+одну ячейку; их названия и длина описания подставляются в тексты факторов
+вместо ANIMAL_PLACEHOLDER, REGION_PLACEHOLDER и LENGTH_PLACEHOLDER.
+
+Таблица строится для одного снимка статистики (StatisticsSnapshot в
+step_3_2), сохраняется рядом с pet911_*_statistics.json и строится заново,
+если изменилась версия статистики и моделей или код прогноза.
+"""
+import os
+
+from .build_cache import file_digest
+from .cube import read_stored, save_stored
+from .deps import np, pd
+from .success_model import (DESCRIPTION_BINS, DESCRIPTION_GROUPS, PHOTO_BINS, PHOTO_GROUPS, factor_label,
+                            factor_text, group_label, sigmoid)
+
+TABLE_FILE = 'pet911_prediction_table.pkl'
+STATISTICS_FILES = {
+    'lost': 'pet911_lost_statistics.json',
+    'found': 'pet911_found_statistics.json',
+}
+
+AD_TYPES = ['lost', 'found']
+# Наличие контактов: 0 - "нет", 1 - "да"
+FLAG_VALUES = ['нет', 'да']
+
+# Признаки модели, по которым строятся ячейки таблицы (регион - при выборке)
+CELL_FEATURES = ['animal_type', 'photo_group', 'description_group', 'has_contacts']
+
+ANIMAL_PLACEHOLDER = '{animal_type}'
+REGION_PLACEHOLDER = '{region}'
+LENGTH_PLACEHOLDER = '{desc_length}'
+
+# Код, по которому строится таблица: его изменение тоже делает таблицу устаревшей
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_FILES = [os.path.join(SRC_DIR, name) for name in ('prediction_table.py', 'success_model.py', 'step_3_2.py')]
+
+
+def table_key(snapshot, use_model):
+    """Версия статистики и моделей снимка и хэши кода прогноза"""
+    return [use_model, snapshot.version] + [file_digest(path) for path in CODE_FILES]
+
+
+def statistics_ad(levels):
+    """Объявление для поправок по статистике по значениям признаков ячейки"""
+    return {
+        'animal_type': levels['animal_type'],
+        'has_photos': 'нет' if levels['photo_group'] == '0' else 'да',
+        'has_description': 'нет' if levels['description_group'] == '0' else 'да',
+        'desc_length': LENGTH_PLACEHOLDER,
+        'has_contacts': levels['has_contacts'],
+    }
+
+
+def coefficient_values(model, feature, levels):
+    """Вклады значений levels признака feature в логит модели (NaN - значения нет в модели)"""
+    coefficients = model['coefficients'][feature]
+    return np.array([coefficients.get(level, np.nan) for level in levels], dtype=float)
+
+
+def compile_table(predictor, snapshot):
+    """
+    Считает прогноз для каждой ячейки по снимку статистики: тип объявления ×
+    тип животного × фото × описание × контакты (значения из статистики и
+    моделей и "нет в статистике"); вклады регионов в логит моделей - отдельно
+    """
+    loaded = [bool(snapshot.stats_lost), bool(snapshot.stats_found)]
+    stats = [snapshot.stats_lost or {}, snapshot.stats_found or {}]
+    models = list(snapshot.models.values())
+    animals = sorted(set().union(*(s.get('animal_success_rates', {}) for s in stats),
+                                 *(m['coefficients']['animal_type'] for m in models)))
+    regions = sorted(set().union(*(m['coefficients']['region'] for m in models)))
+    levels = [AD_TYPES, animals + [ANIMAL_PLACEHOLDER], PHOTO_GROUPS, DESCRIPTION_GROUPS, FLAG_VALUES]
+
+    shape = tuple(len(values) for values in levels)
+    probability = np.full(shape, np.nan)
+    intercept = np.full(len(AD_TYPES), np.nan)
+    partial_logit = np.full(shape, np.nan)
+    contributions = np.full(shape + (len(CELL_FEATURES),), np.nan)
+    region_offsets = np.full((len(AD_TYPES), len(regions) + 1), np.nan)
+    base_rate = np.zeros(len(AD_TYPES))
+    factors = np.empty(shape, dtype=object)
+    recommendations = np.empty(shape[:1] + shape[2:], dtype=object)
+
+    for a, ad_type in enumerate(AD_TYPES):
+        model = snapshot.models.get(ad_type)
+        if model is not None:
+            # Вклады всех ячеек сразу: сетка вкладов значений каждого признака
+            grids = np.meshgrid(*(coefficient_values(model, feature, values)
+                                  for feature, values in zip(CELL_FEATURES, levels[1:])), indexing='ij')
+            contributions[a] = np.stack(grids, axis=-1)
+            # Порядок сложения как в success_model.explain, поэтому вероятности совпадают
+            partial_logit[a] = sum(np.nan_to_num(grid) for grid in grids)
+            intercept[a] = model['intercept']
+            region_offsets[a, :-1] = coefficient_values(model, 'region', regions)
+            base_rate[a] = model['base_rate']
+            # Вероятность без вклада региона (для рекомендаций); прогноз с регионом - в model_predictions
+            probability[a] = sigmoid(intercept[a] + partial_logit[a])
+        else:
+            for cell in np.ndindex(shape[1:]):
+                cell_levels = dict(zip(CELL_FEATURES, (values[i] for values, i in zip(levels[1:], cell))))
+                cell_probability, factors_log, base_rate[a] = predictor.calculate_from_statistics(
+                    statistics_ad(cell_levels), ad_type, snapshot)
+                probability[(a,) + cell] = cell_probability
+                factors[(a,) + cell] = '; '.join(factors_log)
+
+        for cell in np.ndindex(shape[2:]):
+            cell_levels = dict(zip(CELL_FEATURES, [levels[1][0]] + [values[i] for values, i in zip(levels[2:], cell)]))
+            recommendations[(a,) + cell] = '; '.join(predictor.get_recommendations(
+                statistics_ad(cell_levels), probability[(a, 0) + cell], ad_type, base_rate[a]))
+
+    return {
+        'animals': animals,
+        'regions': regions,
+        'loaded': loaded,
+        'methods': np.array(['model' if ad_type in snapshot.models else 'statistics' for ad_type in AD_TYPES],
+                            dtype=object),
+        'probability': probability,
+        'intercept': intercept,
+        'partial_logit': partial_logit,
+        'contributions': contributions,
+        'region_offsets': region_offsets,
+        'base_rate': base_rate,
+        'factors': factors,
+        'recommendations': recommendations,
+    }
+
+
+def load_table(predictor, snapshot):
+    """Таблица прогнозов снимка статистики из кэша рядом со статистикой или построенная заново"""
+    path = os.path.join(snapshot.stats_dir, TABLE_FILE)
+    key = table_key(snapshot, predictor.use_model)
+    stored = read_stored(path)
+    if stored is not None and stored.get('key') == key:
+        return stored['table']
+
+    table = compile_table(predictor, snapshot)
+    if any(table['loaded']):
+        save_stored(path, {'key': key, 'table': table})
+        print(f"🧮 Таблица прогнозов построена: {table['probability'].size} сочетаний признаков "
+              f"и {len(table['regions'])} регионов")
+    return table
+
+
+def category_codes(values, categories):
+    """Номера значений в categories; значения не из списка - последний номер"""
+    codes = pd.Categorical(values, categories=categories).codes.astype('int64')
+    codes[codes < 0] = len(categories)
+    return codes
+
+
+def encode(ads, table):
+    """Номера ячеек таблицы для объявлений (колонки как после normalize_ads)"""
+    photos = np.where(ads['has_photos'] == 'да', np.maximum(ads['photo_count'], 1), 0)
+    words = np.where(ads['has_description'] == 'да', np.maximum(ads['desc_length'], 1), 0)
+    return (
+        category_codes(ads['ad_type'], AD_TYPES),
+        category_codes(ads['animal_type'], table['animals']),
+        category_codes(group_label(photos, PHOTO_BINS, PHOTO_GROUPS), PHOTO_GROUPS),
+        category_codes(group_label(words, DESCRIPTION_BINS, DESCRIPTION_GROUPS), DESCRIPTION_GROUPS),
+        (ads['has_contacts'] == 'да').to_numpy().astype('int64'),
+        category_codes(ads['region'], table['regions']),
+    )
+
+
+def fill_placeholders(templates, ads):
+    """Подставляет название животного, регион и длину описания в тексты факторов"""
+    values = pd.DataFrame({'template': templates, 'animal_type': ads['animal_type'].to_numpy(),
+                           'region': ads['region'].to_numpy(),
+                           'desc_length': ads['desc_length'].astype(str).to_numpy()})
+    # Разных сочетаний мало: тексты строятся для уникальных и раскладываются по строкам
+    codes, unique = pd.factorize(pd.MultiIndex.from_frame(values))
+    texts = np.array([template.replace(ANIMAL_PLACEHOLDER, animal).replace(REGION_PLACEHOLDER, region)
+                      .replace(LENGTH_PLACEHOLDER, length) for template, animal, region, length in unique],
+                     dtype=object)
+    return texts[codes]
+
+
+def model_predictions(table, index, ads):
+    """
+    Вероятность и тексты факторов прогноза моделью для объявлений (index -
+    номера ячеек и регионов, см. encode): вклад региона прибавляется к
+    логиту ячейки, влияние каждого признака - изменение вероятности без его
+    вклада, как в success_model.explain
+    """
+    cell, region = index[:5], index[5]
+    offset = table['region_offsets'][index[0], region]
+    logit = table['intercept'][index[0]] + (table['partial_logit'][cell] + np.nan_to_num(offset))
+    probability = sigmoid(logit)
+    values = np.column_stack([table['contributions'][cell], offset])
+    impacts = probability[:, None] - sigmoid(logit[:, None] - values)
+
+    # Тексты строятся для разных сочетаний ячейки и названий животного и региона и раскладываются по строкам
+    animal_names, region_names = ads['animal_type'].to_numpy(), ads['region'].to_numpy()
+    codes, _ = pd.factorize(pd.MultiIndex.from_arrays(list(cell) + [region, animal_names, region_names]))
+    _, first = np.unique(codes, return_index=True)
+    texts = np.empty(len(first), dtype=object)
+    for k, row in enumerate(first):
+        row_levels = [animal_names[row], PHOTO_GROUPS[index[2][row]], DESCRIPTION_GROUPS[index[3][row]],
+                      FLAG_VALUES[index[4][row]], region_names[row]]
+        texts[k] = '; '.join(
+            factor_text(factor_label(feature, level), None if np.isnan(impact) else float(impact))
+            for feature, level, impact in zip(CELL_FEATURES + ['region'], row_levels, impacts[row]))
+    return probability, texts[codes]
+
+
+def gather(table, ads, version):
+    """
+    Прогноз для таблицы объявлений выборкой из ячеек. Возвращает таблицу с
+    колонками probability, base_rate, method, statistics_version (version -
+    версия снимка, по которому построена таблица), factors и recommendations.
+    """
+    index = encode(ads, table)
+    cell = index[:5]
+    probability = table['probability'][cell]
+    factors = np.empty(len(ads), dtype=object)
+
+    by_model = table['methods'][index[0]] == 'model'
+    if by_model.any():
+        rows = np.flatnonzero(by_model)
+        probability[rows], factors[rows] = model_predictions(table, tuple(codes[rows] for codes in index),
+                                                             ads.iloc[rows])
+    if not by_model.all():
+        rows = np.flatnonzero(~by_model)
+        factors[rows] = fill_placeholders(table['factors'][tuple(codes[rows] for codes in cell)], ads.iloc[rows])
+
+    return pd.DataFrame({
+        'probability': probability,
+        'base_rate': table['base_rate'][index[0]],
+        'method': table['methods'][index[0]],
+        'statistics_version': version,
+        'factors': factors,
+        'recommendations': table['recommendations'][index[:1] + index[2:5]],
+    }, index=ads.index)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельная отрисовка диаграмм.
+
+Шаг не рисует диаграммы сам, а передает описание диаграммы: функцию
+отрисовки уровня модуля и данные для нее (агрегаты, а не исходные
+датафреймы). Описание вместе с текущими настройками оформления matplotlib
+сериализуется сразу при передаче, поэтому шаг может дальше менять свои
+данные. Диаграммы рисуются в пуле процессов с неинтерактивным бэкендом
+Agg, пока шаг продолжает вычисления; в конце шага печатается время и
+ошибки по каждой диаграмме.
+
+    with chart_batch('step_1_1'):
+        submit_chart(plot_regions_pie, region_stats, 'lost', label='lost')
+
+Без пула (configure(0), по умолчанию при прямом вызове шага) диаграммы
+рисуются сразу в процессе шага.
+
+Диаграммы сохраняются через save_figure с учетом профиля вывода:
+publication - PNG 300 dpi с обрезкой полей (как раньше), preview - PNG
+низкого разрешения без пересчета границ, vector - SVG, который не зависит
+от разрешения и рисуется один раз.
+"""
+import os
+import pickle
+import time
+import traceback
+import warnings
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from . import config
+from .phases import phase
+
+# Настройки matplotlib, которые не относятся к оформлению и не передаются в процессы отрисовки
+NON_STYLE_PARAMS = {'backend', 'backend_fallback', 'interactive'}
+
+# Профили вывода: формат файла, разрешение (None - как задано в диаграмме) и обрезка полей
+PROFILES = {
+    'publication': {'format': 'png', 'dpi': None, 'tight': True},
+    'preview': {'format': 'png', 'dpi': 72, 'tight': False},
+    'vector': {'format': 'svg', 'dpi': None, 'tight': False},
+}
+DEFAULT_PROFILE = 'publication'
+
+_workers = 0
+_profile = DEFAULT_PROFILE
+_executor = None
+_active_batch = None
+_captured = None
+
+
+# ----------------------------- Пул процессов -----------------------------
+def configure(workers):
+    """Задает число процессов отрисовки (0 или None - рисовать в процессе шага)"""
+    global _workers
+    workers = workers or 0
+    if workers != _workers:
+        shutdown()
+    _workers = workers
+
+
+def shutdown():
+    """
+    Останавливает пул процессов отрисовки; следующая диаграмма создаст новый.
+    Пул нужно останавливать явно до выхода из процесса-исполнителя шага:
+    multiprocessing дожидается дочерних процессов раньше, чем срабатывает
+    автоматическая остановка пула, и процесс зависает.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def get_executor():
+    """Пул процессов отрисовки; создается при первой диаграмме"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=_workers, initializer=init_worker)
+    return _executor
+
+
+def init_worker():
+    """Инициализация процесса отрисовки: графики сохраняются только в файлы"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+# ----------------------------- Профили вывода -----------------------------
+def set_profile(name):
+    """Задает профиль вывода для всех диаграмм (см. PROFILES)"""
+    global _profile
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный профиль вывода: {name}. Допустимые: {', '.join(PROFILES)}")
+    _profile = name
+
+
+def save_figure(path, dpi=300, bbox_inches='tight'):
+    """
+    Сохраняет текущую диаграмму по активному профилю вывода.
+    dpi и bbox_inches - параметры диаграммы для профиля publication.
+    Возвращает путь к файлу (для профиля vector расширение меняется на .svg).
+    """
+    from matplotlib import pyplot as plt
+
+    profile = PROFILES[_profile]
+    path = f"{os.path.splitext(path)[0]}.{profile['format']}"
+    plt.savefig(path, format=profile['format'], dpi=profile['dpi'] or dpi,
+                bbox_inches=bbox_inches if profile['tight'] else None)
+    return path
+
+
+# ----------------------------- Отрисовка -----------------------------
+def style_snapshot():
+    """Текущее оформление matplotlib (rcParams, в т.ч. стиль и палитра seaborn) и фильтры предупреждений"""
+    import matplotlib
+    rc = {key: value for key, value in matplotlib.rcParams.items() if key not in NON_STYLE_PARAMS}
+    return rc, list(warnings.filters)
+
+
+def render_chart(payload, profile=None):
+    """
+    Рисует диаграмму по сериализованному описанию и возвращает время в секундах.
+    profile - профиль вывода вместо сохраненного в описании.
+    """
+    import matplotlib
+    from matplotlib import pyplot as plt
+
+    func, args, kwargs, (rc, filters), workdir, paths, payload_profile = pickle.loads(payload)
+    if os.getcwd() != workdir:
+        os.chdir(workdir)
+    config.configure(**paths)
+    set_profile(profile or payload_profile)
+
+    started = time.perf_counter()
+    try:
+        with phase('render'), warnings.catch_warnings(), matplotlib.rc_context(rc):
+            warnings.filters[:] = filters
+            func(*args, **kwargs)
+    finally:
+        plt.close('all')
+    return time.perf_counter() - started
+
+
+def chart_payload(func, args, kwargs):
+    """Описание диаграммы: функция, данные, оформление, рабочая папка, пути конвейера и профиль вывода"""
+    return pickle.dumps((func, args, kwargs, style_snapshot(), os.getcwd(), config.settings(), _profile),
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def chart_label(func, label=None):
+    """Подпись диаграммы в отчете: имя функции отрисовки и уточнение (например, тип датасета)"""
+    return f"{func.__name__} ({label})" if label else func.__name__
+
+
+# ----------------------------- Пакет диаграмм шага -----------------------------
+class ChartBatch:
+    """Диаграммы одного шага: передаются в пул и ожидаются при выходе из блока with"""
+
+    def __init__(self, name):
+        self.name = name
+        self.charts = []  # (подпись, Future)
+        self.previous = None
+
+    def submit(self, func, *args, label=None, **kwargs):
+        """Передает диаграмму на отрисовку и возвращает Future со временем отрисовки"""
+        label = chart_label(func, label)
+        payload = chart_payload(func, args, kwargs)
+
+        if _workers > 0:
+            future = get_executor().submit(render_chart, payload)
+        else:
+            future = Future()
+            try:
+                future.set_result(render_chart(payload))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.charts.append((label, future))
+        return future
+
+    def wait(self):
+        """Дожидается всех диаграмм, печатает время и ошибки по каждой; возвращает подписи с ошибками"""
+        labels = {future: label for label, future in self.charts}
+        total = len(labels)
+        failed = []
+
+        # Ожидание пула относится к этапу render
+        with phase('render'):
+            for done, future in enumerate(as_completed(labels), 1):
+                label = labels[future]
+                try:
+                    duration = future.result()
+                except Exception as e:
+                    print(f"❌ [{done}/{total}] {label}: ошибка отрисовки")
+                    print(''.join(traceback.format_exception(e)).rstrip())
+                    failed.append(label)
+                    continue
+                print(f"🖼 [{done}/{total}] {label}: {duration:.1f} с")
+
+        return failed
+
+    def __enter__(self):
+        global _active_batch
+        self.previous, _active_batch = _active_batch, self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_batch
+        _active_batch = self.previous
+        failed = self.wait()
+        if failed and exc_type is None:
+            raise RuntimeError(f"{self.name}: не удалось построить диаграммы: {', '.join(failed)}")
+        return False
+
+
+def chart_batch(name):
+    """Пакет диаграмм шага (используется как контекстный менеджер)"""
+    return ChartBatch(name)
+
+
+@contextmanager
+def capture_charts():
+    """
+    Собирает описания диаграмм [(подпись, описание)] вместо отрисовки -
+    например, чтобы отрисовать одни и те же диаграммы в разных профилях.
+    """
+    global _captured
+    previous, _captured = _captured, []
+    try:
+        yield _captured
+    finally:
+        _captured = previous
+
+
+def submit_chart(func, *args, label=None, **kwargs):
+    """
+    Передает диаграмму в активный пакет. Вне пакета (например, при вызове
+    функций анализа напрямую) диаграмма рисуется сразу.
+    """
+    if _captured is not None:
+        _captured.append((chart_label(func, label), chart_payload(func, args, kwargs)))
+        return
+    if _active_batch is not None:
+        return _active_batch.submit(func, *args, label=label, **kwargs)
+    with phase('render'):
+        func(*args, **kwargs)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельный запуск шагов конвейера по графу зависимостей.
+
+Граф строится по описанию шагов из pipeline.STEPS: шаг B зависит от шага A,
+если один из входных файлов B попадает под шаблон выходных файлов A
+(сейчас это только step_3_2, которому нужна статистика step_3_1).
+Независимые шаги выполняются одновременно в отдельных процессах,
+интерактивные шаги - в основном процессе, когда остальные уже не пишут
+в консоль. Общие агрегаты (куб, счетчики по времени) строятся отдельными
+задачами в тех же процессах, один раз для всех шагов: шаг, которому они
+нужны, ждет их, а остальные шаги в это время уже выполняются. Партиции
+датасетов для шагов с фильтрами строятся в основном процессе до запуска
+процессов-исполнителей. После
+запуска печатается время каждого шага и критический путь.
+"""
+import fnmatch
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+from . import build_cache, config, cube, partitions, phases, rendering, time_counters
+from .pipeline import STEPS, STEPS_BY_NAME, is_interactive, run_step, step_params
+
+STATUS_LABELS = {
+    'rebuilt': 'пересчитан',
+    'reused': 'переиспользован',
+    'failed': 'ошибка',
+    'skipped': 'пропущен',
+}
+
+# Общие агрегаты, которые строятся до запуска шага (ключ в описании шага в src/pipeline.py)
+PREBUILT = {
+    'cube': (cube.ensure, 'агрегатный куб'),
+    'counters': (time_counters.ensure, 'счетчики по времени'),
+}
+
+
+# ----------------------------- Граф зависимостей -----------------------------
+def step_dependencies(steps):
+    """
+    Для каждого шага - множество шагов, чьи результаты он читает.
+    Учитываются только шаги из переданного списка: если производитель
+    не запускается, используются файлы его прошлого запуска.
+    """
+    dependencies = {step['name']: set() for step in steps}
+    for step in steps:
+        for path in step.get('inputs', []):
+            for other in steps:
+                if other is step:
+                    continue
+                if any(fnmatch.fnmatch(path, pattern) for pattern in other.get('outputs', [])):
+                    dependencies[step['name']].add(other['name'])
+    return dependencies
+
+
+def critical_path(report, dependencies):
+    """
+    Самая длинная по времени цепочка зависимых шагов - нижняя граница
+    общего времени при любом числе процессов.
+    """
+    finish, previous = {}, {}
+
+    def visit(name):
+        if name not in finish:
+            parents = sorted(dependencies[name], key=visit, reverse=True)
+            previous[name] = parents[0] if parents else None
+            finish[name] = report[name]['duration'] + (finish[parents[0]] if parents else 0.0)
+        return finish[name]
+
+    if not report:
+        return [], 0.0
+
+    last = max(report, key=visit)
+    path = []
+    while last is not None:
+        path.append(last)
+        last = previous[last]
+    return path[::-1], finish[path[0]]
+
+
+# ----------------------------- Выполнение шага -----------------------------
+def init_worker():
+    """Инициализация процесса-исполнителя: графики сохраняются только в файлы"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def execute_step(name, kwargs, workdir, paths, render_workers=0, profile=rendering.DEFAULT_PROFILE,
+                 instrument=None):
+    """
+    Выполняет шаг и возвращает время его начала (time.perf_counter, общее
+    для всех процессов) и длительность в секундах; при ошибке время начала
+    сохраняется в атрибуте step_start исключения. Все настройки передаются
+    явно: рабочая папка, параметры шага, пути конвейера (см. src/config.py),
+    число процессов отрисовки диаграмм, профиль вывода (см. src/rendering.py)
+    и настройки замера этапов (см. src/phases.py). Перед шагом сбрасываются
+    настройки matplotlib, чтобы результат не зависел от шагов, выполненных
+    ранее в том же процессе.
+    """
+    os.chdir(workdir)
+    config.configure(**paths)
+    phases.configure(**(instrument or {}))
+    rendering.configure(render_workers)
+    rendering.set_profile(profile)
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].rc_file_defaults()
+    start = time.perf_counter()
+    try:
+        return start, run_step(STEPS_BY_NAME[name], kwargs)
+    except Exception as e:
+        e.step_start = start
+        raise
+    finally:
+        rendering.shutdown()
+
+
+def run_inline(name, kwargs, render_workers=0, profile=rendering.DEFAULT_PROFILE):
+    """Выполняет шаг в основном процессе и возвращает завершенный Future"""
+    return call_inline(execute_step, name, kwargs, os.getcwd(), config.settings(), render_workers, profile,
+                       phases.settings())
+
+
+def build_prebuilt(key, datasets, filters, chunksize, workdir, paths):
+    """Строит общий агрегат PREBUILT[key] для датасетов datasets (в процессе-исполнителе или здесь же)"""
+    os.chdir(workdir)
+    config.configure(**paths)
+    PREBUILT[key][0](list(datasets), filters, chunksize)
+
+
+def call_inline(func, *args):
+    """Вызывает func в основном процессе и возвращает завершенный Future"""
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def prepare_partitions(steps, params):
+    """
+    Строит партиции для датасетов шагов с фильтрами до запуска пула, чтобы
+    процессы не создавали одни и те же файлы одновременно.
+    """
+    datasets = config.datasets()
+    for step in steps:
+        filters = step_params(step, params).get('filters')
+        if partitions.normalize_filters(filters):
+            for ad_type in step.get('datasets', []):
+                if partitions.selects(filters, ad_type):
+                    partitions.ensure_partitions(datasets[ad_type], ad_type)
+
+
+# ----------------------------- Планировщик -----------------------------
+def run_scheduled(step_names=None, params=None, force=False, workers=None, render_workers=None,
+                  profile=rendering.DEFAULT_PROFILE):
+    """
+    Выполняет шаги конвейера с учетом зависимостей.
+    workers - число процессов (по умолчанию по числу ядер); при workers=1
+    шаги выполняются по очереди в основном процессе.
+    render_workers - число процессов отрисовки диаграмм в каждом шаге
+    (по умолчанию ядра делятся между шагами, 0 - рисовать в процессе шага).
+    profile - профиль вывода диаграмм (publication, preview, vector); входит
+    в отпечаток шага, поэтому смена профиля пересчитывает шаги с диаграммами.
+    Шаги с неизменившимися входами пропускаются (см. build_cache).
+    Возвращает отчет {шаг: {'status', 'duration', 'start', 'end'}}.
+    """
+    rendering.set_profile(profile)
+    results_dir = config.results_dir()
+    if force and os.path.exists(results_dir):
+        shutil.rmtree(results_dir)
+    os.makedirs(results_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    if render_workers is None:
+        render_workers = max(1, (os.cpu_count() or 1) // workers)
+    steps = [step for step in STEPS if step_names is None or step['name'] in step_names]
+    dependencies = step_dependencies(steps)
+    manifest = build_cache.load_manifest(results_dir)
+
+    pending = {step['name']: step for step in steps}
+    running = {}
+    # Шаги, которые ждут общих агрегатов: {шаг: (kwargs, отпечаток)}
+    waiting = {}
+    # Общие агрегаты: {(ключ PREBUILT, датасеты): Future}
+    prebuilt = {}
+    report = {}
+    started_at = time.perf_counter()
+
+    def finish(name, status, start, duration=0.0):
+        report[name] = {
+            'status': status,
+            'duration': duration,
+            'start': start - started_at,
+            'end': start - started_at + duration,
+        }
+
+    def running_names():
+        return {entry[0] for entry in running.values() if entry is not None} | set(waiting)
+
+    def steps_running():
+        return any(entry is not None for entry in running.values()) or bool(waiting)
+
+    def next_ready():
+        """Первый шаг, все зависимости которого выполнены, или None"""
+        for name, step in pending.items():
+            # Интерактивный шаг ждет, пока остальные шаги не перестанут писать в консоль
+            if is_interactive(step, step_params(step, params)) and steps_running():
+                continue
+            if not any(dep in pending or dep in running_names() for dep in dependencies[name]):
+                return name
+        return None
+
+    def start(name):
+        """Пропускает шаг или запускает его в процессе-исполнителе (интерактивный - здесь же)"""
+        step = pending.pop(name)
+        now = time.perf_counter()
+
+        failed = sorted(dep for dep in dependencies[name] if report[dep]['status'] in ('failed', 'skipped'))
+        if failed:
+            print(f"⏭ {name}: пропущен, не выполнены зависимости {', '.join(failed)}")
+            finish(name, 'skipped', now)
+            return
+
+        kwargs = step_params(step, params)
+        fingerprint = build_cache.step_fingerprint(step, dict(kwargs, profile=profile), config.datasets())
+        if not force and not is_interactive(step, kwargs) and build_cache.is_up_to_date(
+                manifest, name, fingerprint, results_dir):
+            print(f"⏩ {name}: входные данные не изменились, результаты переиспользованы")
+            finish(name, 'reused', now)
+            return
+
+        build_cache.remove_outputs(manifest, name, results_dir)
+        waiting[name] = (kwargs, fingerprint)
+        for key in prebuilt_keys(step):
+            if key not in prebuilt:
+                # Общий агрегат строится один раз отдельной задачей, а не в процессе каждого шага
+                args = (key[0], key[1], kwargs.get('filters'), kwargs.get('chunksize'), os.getcwd(),
+                        config.settings())
+                if executor is None:
+                    prebuilt[key] = call_inline(build_prebuilt, *args)
+                else:
+                    prebuilt[key] = executor.submit(build_prebuilt, *args)
+                    running[prebuilt[key]] = None
+                report_prebuilt(prebuilt[key])
+        launch_waiting()
+
+    def prebuilt_keys(step):
+        return [(key, tuple(step['datasets'])) for key in PREBUILT if step.get(key)]
+
+    def report_prebuilt(future):
+        """Сообщает об ошибке построения общего агрегата (шаги тогда строят его сами)"""
+        if future.done() and future.exception() is not None:
+            key = next(key for key, value in prebuilt.items() if value is future)
+            print(f"⚠️ {PREBUILT[key[0]][1]} - не удалось построить заранее: {future.exception()}")
+
+    def launch_waiting():
+        """Запускает шаги, общие агрегаты которых уже построены"""
+        for name in list(waiting):
+            if all(prebuilt[key].done() for key in prebuilt_keys(STEPS_BY_NAME[name])):
+                launch(name, *waiting.pop(name))
+
+    def launch(name, kwargs, fingerprint):
+        """Запускает шаг в процессе-исполнителе (интерактивный - здесь же)"""
+        if is_interactive(STEPS_BY_NAME[name], kwargs):
+            future = run_inline(name, kwargs, 0, profile)
+        elif executor is None:
+            future = run_inline(name, kwargs, render_workers, profile)
+        else:
+            future = executor.submit(execute_step, name, kwargs, os.getcwd(), config.settings(),
+                                     render_workers, profile, phases.settings())
+        running[future] = (name, fingerprint, time.perf_counter())
+
+    prepare_partitions(steps, params)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker) if workers > 1 else None
+    try:
+        while pending or running:
+            name = next_ready()
+            while name is not None:
+                start(name)
+                name = next_ready()
+
+            if not running:
+                if pending:
+                    raise RuntimeError(f"Циклическая зависимость шагов: {', '.join(pending)}")
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = running.pop(future)
+                if entry is None:
+                    report_prebuilt(future)
+                    continue
+                name, fingerprint, submitted = entry
+                try:
+                    started, duration = future.result()
+                except Exception as e:
+                    print(f"❌ {name}: ошибка выполнения")
+                    print(''.join(traceback.format_exception(e)).rstrip())
+                    # Шаг, упавший до начала выполнения, отсчитывается от постановки в очередь
+                    started = getattr(e, 'step_start', submitted)
+                    finish(name, 'failed', started, time.perf_counter() - started)
+                    continue
+
+                build_cache.record_step(manifest, STEPS_BY_NAME[name], fingerprint, results_dir, duration)
+                build_cache.save_manifest(manifest, results_dir)
+                finish(name, 'rebuilt', started, duration)
+            launch_waiting()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print_report(report, dependencies, time.perf_counter() - started_at, workers)
+    if phases.settings()['report']:
+        rebuilt = [name for name, entry in report.items() if entry['status'] in ('rebuilt', 'failed')]
+        phases.print_report(phases.write_report(rebuilt))
+
+    failed = [name for name, entry in report.items() if entry['status'] == 'failed']
+    if failed:
+        raise RuntimeError(f"Шаги завершились с ошибкой: {', '.join(failed)}")
+    return report
+
+
+def print_report(report, dependencies, total, workers):
+    """Печатает время шагов, критический путь и общее время"""
+    print("\n⏱ Время выполнения шагов:")
+    for name in sorted(report, key=lambda n: (report[n]['start'], n)):
+        entry = report[name]
+        line = f"   {name:<10} {STATUS_LABELS[entry['status']]:<16}"
+        if entry['status'] in ('rebuilt', 'failed'):
+            line += f" {entry['duration']:7.1f} с   [{entry['start']:.1f} → {entry['end']:.1f}]"
+        print(line.rstrip())
+
+    path, length = critical_path(report, dependencies)
+    if length > 0:
+        print(f"🧭 Критический путь: {' → '.join(path)} ({length:.1f} с)")
+
+    rebuilt = sum(entry['status'] == 'rebuilt' for entry in report.values())
+    reused = sum(entry['status'] == 'reused' for entry in report.values())
+    print(f"\n✅ Пересчитано шагов: {rebuilt}, переиспользовано: {reused}")
+    print(f"⏱ Общее время: {total:.1f} с (процессов: {workers})")
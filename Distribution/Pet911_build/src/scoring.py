@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетный прогноз успеха объявлений по файлу (например, по всем открытым
+объявлениям новой выгрузки) без диалога и без диаграмм.
+
+Все строки оцениваются сразу (PetSearchPredictor.score_ads) выборкой из
+таблицы прогнозов по сочетаниям признаков (src/prediction_table.py), а не
+по одному объявлению. Результат - CSV с вероятностью, базовым уровнем,
+влиянием факторов и рекомендациями для каждой строки; в консоль выводится
+скорость в объявлениях в секунду.
+
+python3 -m src.scoring new_crawl_ads.csv
+python3 -m src.scoring new_crawl_ads.parquet --output scores.csv --output-dir results
+python3 -m src.scoring new_crawl_ads.csv --statistics-only
+"""
+import argparse
+
+from . import config
+from .step_3_2 import PetSearchPredictor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетный прогноз успеха объявлений по файлу')
+    parser.add_argument('ads_file', help='CSV, JSON, JSON Lines, Parquet или Feather с объявлениями')
+    parser.add_argument('--output', help='CSV для прогнозов (по умолчанию - в папке результатов главы 3)')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR,
+                        help='папка результатов со статистикой step_3_1')
+    parser.add_argument('--statistics-only', action='store_true',
+                        help='прогноз поправками по статистике, без обученной модели step_3_1')
+    args = parser.parse_args()
+
+    config.configure(results_dir=args.output_dir)
+    PetSearchPredictor(use_model=not args.statistics_only).predict_from_file(args.ads_file, args.output)
+
+
+if __name__ == "__main__":
+    main()
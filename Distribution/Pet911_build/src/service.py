@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP-сервис прогноза успеха объявления (для оценки объявления, пока
+пользователь его заполняет).
+
+Статистика и модели step_3_1 загружаются один раз (PetSearchPredictor);
+запросы обрабатываются асинхронно в одном процессе (asyncio, HTTP/1.1 с
+keep-alive), прогноз для одного объявления - микросекунды. Файлы статистики
+и моделей проверяются каждые --interval секунд (PetSearchPredictor.start_watching):
+после изменения их содержимого (например, после пересчета step_3_1) снимок
+статистики загружается заново в фоновом потоке и подменяет прежний, не
+прерывая обработку запросов. Каждый ответ с прогнозом содержит версию
+статистики (statistics_version), по которой он посчитан.
+
+Запросы (тело и ответ - JSON):
+    POST /predict        объявление: {"ad_type": "lost", "animal_type": "кошка", ...}
+                         (поля как в файле --ads, пропущенные - по умолчанию;
+                         нечисловые photo_count и desc_length - ошибка 400)
+    POST /predict/batch  {"ads": [объявление, ...]} - все объявления сразу (score_ads)
+    GET  /health         состояние, версия статистики и загруженные модели
+    GET  /metrics        число запросов по адресам и кодам ответа, задержка
+                         (p50, p90, p99, max по последним LATENCY_WINDOW запросам)
+
+python3 -m src.service --port 8911
+curl -s localhost:8911/predict -d '{"ad_type": "lost", "animal_type": "кошка", "has_photos": "да"}'
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+from . import config
+from .deps import pd
+from .step_3_2 import WATCH_INTERVAL, PetSearchPredictor, normalize_ad, normalize_ads
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8911
+DEFAULT_INTERVAL = WATCH_INTERVAL
+
+# Задержка считается по последним LATENCY_WINDOW запросам
+LATENCY_WINDOW = 10_000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH_ADS = 100_000
+
+ROUTES = {'/predict': 'POST', '/predict/batch': 'POST', '/health': 'GET', '/metrics': 'GET'}
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """Ошибка запроса с кодом ответа"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Metrics:
+    """Число запросов по адресам и кодам ответа и задержка обработки"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = {}
+        self.latency_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, path, status, elapsed):
+        by_status = self.requests.setdefault(path, {})
+        by_status[status] = by_status.get(status, 0) + 1
+        self.latency_ms.append(elapsed * 1000)
+
+    def report(self):
+        latencies = sorted(self.latency_ms)
+
+        def percentile(q):
+            return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 3) if latencies else None
+
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'requests': {path: {str(status): count for status, count in by_status.items()}
+                         for path, by_status in self.requests.items()},
+            'requests_total': sum(sum(by_status.values()) for by_status in self.requests.values()),
+            'latency_ms': {'window': len(latencies), 'p50': percentile(0.5), 'p90': percentile(0.9),
+                           'p99': percentile(0.99), 'max': round(latencies[-1], 3) if latencies else None},
+        }
+
+
+class PredictionService:
+    def __init__(self, use_model=True, interval=DEFAULT_INTERVAL):
+        self.use_model = use_model
+        self.interval = interval
+        self.metrics = Metrics()
+        self.predictor = PetSearchPredictor(use_model=use_model)
+        self.warm_up()
+
+    def warm_up(self):
+        """Пробный прогноз до приема запросов: первый вызов подгружает части pandas и NumPy"""
+        for ad_type in ('lost', 'found'):
+            if self.predictor.stats_lost if ad_type == 'lost' else self.predictor.stats_found:
+                self.predict_one({'ad_type': ad_type})
+                self.predict_batch([{'ad_type': ad_type}])
+
+    # ----------------------------- Прогноз -----------------------------
+    def predict_one(self, ad):
+        if not isinstance(ad, dict):
+            raise RequestError(400, 'Объявление должно быть JSON-объектом')
+        ad_type = str(ad.get('ad_type', '')).strip().lower()
+        if ad_type not in ('lost', 'found'):
+            raise RequestError(400, f"ad_type должен быть lost или found, получено '{ad_type}'")
+        if not (self.predictor.stats_lost if ad_type == 'lost' else self.predictor.stats_found):
+            raise RequestError(503, f"Статистика для {ad_type} не загружена: сначала выполните step_3_1")
+        try:
+            ad_data = normalize_ad(ad)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise RequestError(400, f"Неверное поле объявления: {e}")
+
+        prediction = self.predictor.predict(ad_data, ad_type)
+        return {
+            'ad_type': ad_type,
+            **ad_data,
+            **prediction,
+            'probability': round(prediction['probability'], 4),
+            'base_rate': round(prediction['base_rate'], 4),
+        }
+
+    def predict_batch(self, ads):
+        if not isinstance(ads, list) or not all(isinstance(ad, dict) for ad in ads):
+            raise RequestError(400, 'Ожидается {"ads": [объявление, ...]}')
+        if len(ads) > MAX_BATCH_ADS:
+            raise RequestError(413, f"Не больше {MAX_BATCH_ADS} объявлений в запросе")
+        if not ads:
+            return []
+        try:
+            frame = normalize_ads(pd.DataFrame(ads), strict=True)
+            scores = self.predictor.score_ads(frame)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        except RuntimeError as e:
+            raise RequestError(503, str(e))
+
+        results = frame.assign(probability=scores['probability'].round(4), base_rate=scores['base_rate'].round(4),
+                               method=scores['method'], statistics_version=scores['statistics_version'],
+                               factors=scores['factors'].str.split('; '),
+                               recommendations=scores['recommendations'].str.split('; '))
+        return json.loads(results.to_json(orient='records', force_ascii=False))
+
+    def health(self):
+        snapshot = self.predictor.snapshot
+        return {
+            'status': 'ok' if snapshot.stats_lost or snapshot.stats_found else 'no_statistics',
+            'statistics': {'lost': bool(snapshot.stats_lost), 'found': bool(snapshot.stats_found)},
+            'statistics_version': snapshot.version,
+            'loaded_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.loaded_at)),
+            'models': {ad_type: model['metrics'] for ad_type, model in snapshot.models.items()},
+            'reloads': self.predictor.reloads,
+        }
+
+    async def route(self, method, path, body):
+        if path not in ROUTES:
+            raise RequestError(404, f"Нет адреса {path}")
+        if method != ROUTES[path]:
+            raise RequestError(405, f"{path} принимает только {ROUTES[path]}")
+        if path == '/predict':
+            return self.predict_one(parse_json(body))
+        if path == '/predict/batch':
+            request = parse_json(body)
+            ads = request.get('ads') if isinstance(request, dict) else request
+            # Пакет считается в отдельном потоке, чтобы не задерживать одиночные запросы
+            return {'predictions': await asyncio.to_thread(self.predict_batch, ads)}
+        if path == '/health':
+            return self.health()
+        return {**self.metrics.report(), 'reloads': self.predictor.reloads}
+
+    # ----------------------------- HTTP -----------------------------
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                started = time.perf_counter()
+                request_line, *header_lines = head.decode('latin1').split('\r\n')
+                method, path, version = (request_line.split(' ') + ['', '', ''])[:3]
+                path = path.split('?', 1)[0]
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version.upper() != 'HTTP/1.0')
+                try:
+                    try:
+                        length = int(headers.get('content-length') or 0)
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        # Без длины тела нельзя найти начало следующего запроса
+                        keep_alive = False
+                        raise RequestError(400, f"Некорректный заголовок Content-Length: "
+                                                f"{headers.get('content-length')}")
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise RequestError(413, f"Тело запроса больше {MAX_BODY_BYTES} байт")
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = 200, await self.route(method, path, body)
+                except RequestError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin1') + data)
+                await writer.drain()
+                self.metrics.record(path if path in ROUTES else 'other', status, time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.predictor.start_watching(self.interval)
+        address = server.sockets[0].getsockname()
+        print(f"🌐 Сервис прогноза: http://{address[0]}:{address[1]} (POST /predict, /predict/batch; "
+              f"GET /health, /metrics)")
+        if ready is not None:
+            ready(address)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.predictor.stop_watching()
+
+
+def parse_json(body):
+    try:
+        return json.loads(body or b'null')
+    except ValueError as e:
+        raise RequestError(400, f"Тело запроса - не JSON: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP-сервис прогноза успеха объявления')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='адрес')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='порт')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR,
+                        help='папка результатов со статистикой step_3_1')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help='период проверки файлов статистики, с')
+    parser.add_argument('--statistics-only', action='store_true',
+                        help='прогноз поправками по статистике, без обученной модели step_3_1')
+    args = parser.parse_args()
+
+    config.configure(results_dir=args.output_dir)
+    service = PredictionService(use_model=not args.statistics_only, interval=args.interval)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("👋 Сервис остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Значимость факторов успеха: бутстреп-интервалы и перестановочные тесты
+сразу для всех пар "фактор - успех" в датасетах потерянных и найденных
+животных, с поправкой на множественные проверки.
+
+Каждая проверка - таблица по значениям фактора (число объявлений n и
+успехов s) и числовое значение x для каждого значения:
+    - разность долей успеха (x - 0/1): фото, описание, контакты, тип
+      местности, породистость, а также каждый тип животного и регион с
+      достаточным числом объявлений против остальных;
+    - корреляция Пирсона признака с успехом: количество фото, длина
+      описания, количество комментариев (как в step_2_1 и step_2_2).
+Таблицы берутся из агрегатного куба (src/cube.py; корреляции - из куба
+публикации с точными значениями) и частот комментариев step_2_1, поэтому
+объявления по одному не перебираются.
+
+Обе статистики выражаются через суммы по значениям фактора, поэтому
+выборки генерируются сразу для всех проверок пакетами по несколько тысяч:
+    - бутстреп (выборка объявлений с возвращением) - число объявлений и
+      успехов по значениям из мультиномиального распределения
+      (Generator.multinomial с отдельными вероятностями для каждой проверки);
+    - перестановка меток успеха - успехи по значениям из
+      многомерного гипергеометрического распределения, которое
+      раскладывается в цепочку гипергеометрических выборок по значениям.
+95% интервал - процентильный, p-значение двустороннее,
+(1 + число |T*| >= |T|) / (B + 1). q-значения - поправка Бенджамини -
+Хохберга по всем проверкам обоих датасетов.
+
+python3 -m src.significance
+python3 -m src.significance --resamples 20000 --output-dir results
+"""
+import argparse
+import os
+import time
+
+from . import config, cube
+from .chunked import DEFAULT_CHUNKSIZE
+from .deps import np, pd
+from .partitions import selects
+
+RESAMPLES = 10_000
+SEED = 0
+# Уровень значимости для q-значений
+ALPHA = 0.05
+# Минимальное число объявлений в каждой из сравниваемых групп
+MIN_SUPPORT = 30
+# Сколько значений (выборки × проверки × ячейки) генерируется за один пакет
+BATCH_VALUES = 4_000_000
+
+OUTPUT_SUBDIR = 'Результаты 2 главы анализа'
+OUTPUT_FILE = '2.3. Значимость факторов успеха.csv'
+
+DATASET_NAMES = {'lost': 'поиск питомца', 'found': 'поиск хозяев'}
+STATISTIC_NAMES = {'diff': 'разность долей', 'corr': 'корреляция'}
+
+# Бинарные факторы: колонка куба и подпись
+BINARY_FACTORS = {
+    'есть_фото': 'есть фото',
+    'наличие_описания': 'есть описание',
+    'есть_контакты': 'есть контакты',
+}
+# Числовые факторы куба публикации (корреляция с успехом)
+NUMERIC_FACTORS = ['количество_фото', 'Длина_описания_в_словах']
+# Факторы, значения которых сравниваются с остальными
+LEVEL_FACTORS = ['тип_животного', 'регион']
+
+
+# ----------------------------- Таблицы проверок -----------------------------
+def level_table(values, counts, successes):
+    """Число объявлений и успехов по значениям (пропуски не учитываются)"""
+    table = pd.DataFrame({'value': values, 'n': counts, 's': successes}).dropna(subset=['value'])
+    return table.groupby('value')[['n', 's']].sum()
+
+
+def make_test(ad_type, factor, comparison, kind, x, counts, successes):
+    return {'ad_type': ad_type, 'factor': factor, 'comparison': comparison, 'kind': kind,
+            'x': np.asarray(x, dtype=float), 'n': np.asarray(counts, dtype='int64'),
+            's': np.asarray(successes, dtype='int64')}
+
+
+def contrast_test(ad_type, factor, comparison, indicator, counts, successes, min_support):
+    """Разность долей успеха: группа (indicator = 1) против остальных; None при малых группах"""
+    table = level_table(np.asarray(indicator, dtype=int), counts, successes).reindex([0, 1], fill_value=0)
+    if table['n'].min() < min_support:
+        return None
+    return make_test(ad_type, factor, comparison, 'diff', [0, 1], table['n'], table['s'])
+
+
+def correlation_test(ad_type, factor, values, counts, successes):
+    table = level_table(pd.to_numeric(pd.Series(values), errors='coerce'), counts, successes)
+    table = table[table['n'] > 0]
+    if len(table) < 2:
+        return None
+    return make_test(ad_type, factor, 'корреляция с успехом', 'corr', table.index, table['n'], table['s'])
+
+
+def cube_tests(cube_frame, publication_frame, ad_type, min_support=MIN_SUPPORT):
+    """Проверки по факторам агрегатного куба и куба публикации датасета ad_type"""
+    from .step_3_1 import typed_column
+    from .step_5 import URBAN_KEYWORDS, Pet911Analyzer
+
+    counts = cube_frame['n'].to_numpy()
+    successes = cube_frame['успехи'].to_numpy()
+    tests = []
+
+    for column, label in BINARY_FACTORS.items():
+        indicator = typed_column(cube_frame[column], column)
+        tests.append(contrast_test(ad_type, column, f'{label} / нет', indicator, counts, successes, min_support))
+
+    for column in NUMERIC_FACTORS:
+        tests.append(correlation_test(ad_type, column, publication_frame[column],
+                                      publication_frame['n'].to_numpy(), publication_frame['успехи'].to_numpy()))
+
+    # Тип местности и породистость - как в step_5
+    regions = cube_frame['регион'].astype(str).str.lower()
+    urban = regions.apply(lambda x: any(city in x for city in URBAN_KEYWORDS))
+    tests.append(contrast_test(ad_type, 'тип_местности', 'город / область и село', urban,
+                               counts, successes, min_support))
+    pedigree = cube_frame['порода'].apply(Pet911Analyzer.is_pedigree) == 'Да'
+    tests.append(contrast_test(ad_type, 'порода', 'породистые / нет', pedigree, counts, successes, min_support))
+
+    # Каждое значение с достаточным числом объявлений - против остальных
+    for column in LEVEL_FACTORS:
+        values = cube_frame[column].astype(str).str.strip()
+        values = values.where(cube_frame[column].notna())
+        if column == 'тип_животного':
+            values = values.str.lower()
+        for value, size in level_table(values, counts, successes)['n'].items():
+            if size >= min_support:
+                tests.append(contrast_test(ad_type, column, f'{value} / остальные', values == value,
+                                           counts, successes, min_support))
+
+    return [test for test in tests if test is not None]
+
+
+def comments_test(ad_type, filters=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Корреляция количества комментариев с успехом по частотам step_2_1"""
+    from .step_2_1 import aggregate_comments_chunked
+
+    aggregates = aggregate_comments_chunked(config.dataset_path(ad_type), ad_type, filters, chunksize)
+    if aggregates is None or aggregates['histogram'] is None:
+        return None
+    frame = aggregates['histogram'].rename('n').reset_index()
+    return correlation_test(ad_type, 'количество_комментариев', frame['количество_комментариев'],
+                            frame['n'], frame['успех'] * frame['n'])
+
+
+def collect_tests(filters=None, chunksize=None, min_support=MIN_SUPPORT):
+    """Проверки для всех факторов обоих датасетов"""
+    tests = []
+    for ad_type in ('lost', 'found'):
+        if not selects(filters, ad_type):
+            continue
+        tests.extend(cube_tests(cube.load(ad_type, filters, chunksize),
+                                cube.load(ad_type, filters, chunksize, view='publication'), ad_type, min_support))
+        tests.append(comments_test(ad_type, filters, chunksize or DEFAULT_CHUNKSIZE))
+    return [test for test in tests if test is not None]
+
+
+# ----------------------------- Выборки -----------------------------
+def stack(tests):
+    """Таблицы проверок в матрицах (проверка × значение), дополненных нулями"""
+    width = max(len(test['x']) for test in tests)
+    x, counts, successes = (np.zeros((len(tests), width), dtype=dtype) for dtype in ('float', 'int64', 'int64'))
+    for i, test in enumerate(tests):
+        size = len(test['x'])
+        x[i, :size], counts[i, :size], successes[i, :size] = test['x'], test['n'], test['s']
+    return x, counts, successes
+
+
+def statistics(kinds, x, counts, successes):
+    """
+    Разность долей или корреляция для каждой проверки (последняя ось -
+    значения фактора, предыдущие - выборки и проверки)
+    """
+    n = counts.sum(-1).astype(float)
+    s = successes.sum(-1).astype(float)
+    sum_x = (x * counts).sum(-1)
+    sum_xs = (x * successes).sum(-1)
+    sum_xx = (x * x * counts).sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # x - 0/1: sum_x - объявлений в группе, sum_xs - успехов в ней
+        diff = sum_xs / sum_x - (s - sum_xs) / (n - sum_x)
+        corr = (n * sum_xs - sum_x * s) / np.sqrt((n * sum_xx - sum_x ** 2) * (n * s - s ** 2))
+    return np.where(kinds == 'diff', diff, corr)
+
+
+def bootstrap(rng, counts, successes, size):
+    """Число объявлений и успехов по значениям в size выборках объявлений с возвращением"""
+    totals = counts.sum(-1)
+    cells = np.concatenate([successes, counts - successes], axis=-1) / totals[:, None]
+    draws = rng.multinomial(totals, cells, size=(size, len(totals)))
+    width = counts.shape[1]
+    return draws[..., :width] + draws[..., width:], draws[..., :width]
+
+
+def permutation(rng, counts, successes, size):
+    """Успехи по значениям в size перестановках меток успеха между объявлениями"""
+    remaining = np.broadcast_to(counts.sum(-1), (size, len(counts))).copy()
+    left = np.broadcast_to(successes.sum(-1), (size, len(counts))).copy()
+    drawn = np.zeros((size,) + counts.shape, dtype='int64')
+    for k in range(counts.shape[1] - 1):
+        remaining -= counts[:, k]
+        drawn[..., k] = rng.hypergeometric(counts[:, k], remaining, left)
+        left -= drawn[..., k]
+    drawn[..., -1] = left
+    return drawn
+
+
+def resample(tests, resamples=RESAMPLES, seed=SEED):
+    """
+    Оценка, 95% бутстреп-интервал и перестановочное p-значение для проверок
+    с одинаковой статистикой (выборки генерируются пакетами сразу для всех)
+    """
+    rng = np.random.default_rng(seed)
+    kinds = np.array([test['kind'] for test in tests])
+    x, counts, successes = stack(tests)
+    observed = statistics(kinds, x, counts, successes)
+
+    batch = max(1, BATCH_VALUES // (2 * counts.size))
+    replicates = np.empty((resamples, len(tests)))
+    exceed = np.zeros(len(tests), dtype='int64')
+    for start in range(0, resamples, batch):
+        size = min(batch, resamples - start)
+        sample_counts, sample_successes = bootstrap(rng, counts, successes, size)
+        replicates[start:start + size] = statistics(kinds, x, sample_counts, sample_successes)
+        permuted = statistics(kinds, x, counts, permutation(rng, counts, successes, size))
+        # Допуск на ошибки округления для перестановок с тем же значением статистики
+        exceed += (np.abs(permuted) >= np.abs(observed) - 1e-12).sum(axis=0)
+
+    with np.errstate(invalid='ignore'):
+        ci_low, ci_high = np.nanpercentile(replicates, [2.5, 97.5], axis=0)
+    p_value = np.where(np.isnan(observed), np.nan, (1 + exceed) / (resamples + 1))
+    return observed, ci_low, ci_high, p_value
+
+
+def benjamini_hochberg(p_values):
+    """q-значения Бенджамини - Хохберга (пропуски не учитываются)"""
+    p_values = np.asarray(p_values, dtype=float)
+    q_values = np.full(len(p_values), np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    if len(valid) == 0:
+        return q_values
+    order = valid[np.argsort(p_values[valid])]
+    ranked = p_values[order] * len(valid) / np.arange(1, len(valid) + 1)
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return q_values
+
+
+def significance_table(tests, resamples=RESAMPLES, seed=SEED, alpha=ALPHA):
+    """Таблица результатов всех проверок с q-значениями по всем проверкам сразу"""
+    rows = []
+    for kind in STATISTIC_NAMES:
+        group = [test for test in tests if test['kind'] == kind]
+        if not group:
+            continue
+        observed, ci_low, ci_high, p_value = resample(group, resamples, seed)
+        for i, test in enumerate(group):
+            counts, successes = test['n'], test['s']
+            rates = successes / np.maximum(counts, 1) if kind == 'diff' else (np.nan, np.nan)
+            rows.append({
+                'датасет': DATASET_NAMES[test['ad_type']],
+                'фактор': test['factor'],
+                'сравнение': test['comparison'],
+                'статистика': STATISTIC_NAMES[kind],
+                'объявлений': int(counts.sum()),
+                'доля_успеха_в_группе': rates[1],
+                'доля_успеха_остальных': rates[0],
+                'оценка': observed[i],
+                'нижняя_граница': ci_low[i],
+                'верхняя_граница': ci_high[i],
+                'p_значение': p_value[i],
+            })
+
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+    table['q_значение'] = benjamini_hochberg(table['p_значение'])
+    table['значимо'] = table['q_значение'] < alpha
+    return table.sort_values(['q_значение', 'p_значение'], kind='stable').reset_index(drop=True)
+
+
+def analyze_significance(filters=None, chunksize=None, resamples=RESAMPLES, seed=SEED, alpha=ALPHA):
+    """Проверки по обоим датасетам, таблица результатов в папке главы 2 и краткий вывод"""
+    tests = collect_tests(filters, chunksize)
+    if not tests:
+        print("❌ Нет данных для проверки значимости")
+        return None
+
+    started = time.perf_counter()
+    table = significance_table(tests, resamples, seed, alpha)
+    elapsed = time.perf_counter() - started
+
+    os.makedirs(config.results_path(OUTPUT_SUBDIR), exist_ok=True)
+    path = config.results_path(OUTPUT_SUBDIR, OUTPUT_FILE)
+    table.to_csv(path, index=False, encoding='utf-8-sig')
+
+    print(f"🎲 {len(tests)} проверок × {resamples} бутстреп-выборок и перестановок за {elapsed:.1f} с")
+    significant = table[table['значимо']]
+    print(f"📊 Значимых связей с успехом (q < {alpha}): {len(significant)} из {len(table)}")
+    for _, row in significant.iterrows():
+        print(f"   • {row['датасет']}: {row['фактор']} ({row['сравнение']}) - {row['статистика']} "
+              f"{row['оценка']:+.3f} [{row['нижняя_граница']:+.3f}; {row['верхняя_граница']:+.3f}], "
+              f"q = {row['q_значение']:.4f}")
+    print(f"💾 Результаты сохранены: {path}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бутстреп-интервалы и перестановочные тесты для факторов успеха')
+    parser.add_argument('--resamples', type=int, default=RESAMPLES, help='число бутстреп-выборок и перестановок')
+    parser.add_argument('--seed', type=int, default=SEED, help='начальное значение генератора')
+    parser.add_argument('--alpha', type=float, default=ALPHA, help='уровень для q-значений')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR, help='папка результатов')
+    args = parser.parse_args()
+
+    config.configure(results_dir=args.output_dir)
+    analyze_significance(resamples=args.resamples, seed=args.seed, alpha=args.alpha)
+
+
+if __name__ == "__main__":
+    main()
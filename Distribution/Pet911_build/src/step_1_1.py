@@ -1,34 +1,37 @@
 from .deps import *
-
-
-
-def load_and_prepare_data(file_path, dataset_type):
-    """Загрузка и подготовка данных для lost или found датасета"""
-    df = pd.read_csv(file_path)
-
-    # Преобразование даты
-    df['дата_публикации'] = pd.to_datetime(df['дата_публикации'], format='%a, %d.%m.%Y', errors='coerce')
-
-    # Заполнение пропущенных регионов
-    df['регион'] = df['регион'].fillna('Неизвестно')
-
-    # Создание флага "найдено" в зависимости от типа датасета
-    if dataset_type == 'lost':
-        df['найдено'] = df['статус'] == 'питомец найден'
-    elif dataset_type == 'found':
-        df['найдено'] = df['статус'] == 'хозяин найден'
-
-    return df
-
-
-def analyze_regions(df, top_regions_count=5):
+from .config import dataset_path, results_path
+from .partitions import selects
+from . import cube
+from .cube import rollup
+from .rendering import chart_batch, save_figure, submit_chart
+
+# Подписи датасетов в заголовках диаграмм
+TITLE_MAP = {
+    'lost': 'поиска питомцев',
+    'found': 'поиска хозяев'
+}
+
+
+def count_regions(cube_frame):
+    """Количество заявок и найденных по регионам (свертка агрегатного куба, см. src/cube.py)"""
+    # Пропущенные регионы относятся к "Неизвестно"
+    regions = cube_frame['регион'].fillna('Неизвестно')
+    return rollup(cube_frame, regions).rename(columns={
+        'n': 'id',  # общее количество заявок
+        'успехи': 'найдено'  # количество найденных
+    })
+
+
+def analyze_regions(cube_frame, top_regions_count=5):
     """Анализ региональной статистики с группировкой по топ-N регионов"""
 
     # Группировка по регионам
-    region_stats = df.groupby('регион').agg({
-        'id': 'count',  # общее количество заявок
-        'найдено': 'sum'  # количество найденных
-    }).rename(columns={'id': 'общее_количество', 'найдено': 'найдено_количество'})
+    return summarize_regions(count_regions(cube_frame), top_regions_count)
+
+
+def summarize_regions(region_counts, top_regions_count=5):
+    """Проценты найденных и сводка топ-N регионов + "Другие" по агрегатам"""
+    region_stats = region_counts.rename(columns={'id': 'общее_количество', 'найдено': 'найдено_количество'})
 
     # Расчет процента найденных
     region_stats['процент_найденных'] = (
@@ -71,6 +74,14 @@ def create_regions_table(region_stats_full, dataset_type, top_regions_count=5, o
     # Сортировка по проценту найденных (по убыванию)
     top_regions = filtered_stats.sort_values('процент_найденных', ascending=False).head(10)
 
+    submit_chart(plot_regions_table, top_regions, dataset_type, output_prefix, label=output_prefix)
+
+    return top_regions
+
+
+def plot_regions_table(top_regions, dataset_type, output_prefix=''):
+    """Отрисовка таблицы с топ-10 регионов по проценту найденных"""
+
     # Создаем таблицу
     fig, ax = plt.subplots(figsize=(14, 8))
     ax.axis('tight')
@@ -109,12 +120,7 @@ def create_regions_table(region_stats_full, dataset_type, top_regions_count=5, o
             else:  # Данные
                 table[(i, j)].set_facecolor('#f0f0f0')
 
-    title_map = {
-        'lost': 'поиска питомцев',
-        'found': 'поиска хозяев'
-    }
-
-    dataset_title = title_map[dataset_type]
+    dataset_title = TITLE_MAP[dataset_type]
 
     plt.title(f'Топ-10 регионов по проценту успешных случаев {dataset_title}',
               fontsize=14, fontweight='bold', pad=20)
@@ -125,23 +131,22 @@ def create_regions_table(region_stats_full, dataset_type, top_regions_count=5, o
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.1.1 Топ-10 регионов по проценту успешных случаев для {output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.1.1 Топ-10 регионов по проценту успешных случаев для {output_prefix}.png'))
     plt.close()
 
-    return top_regions
-
 
 def create_visualizations(region_stats, dataset_type, top_regions_count=5, output_prefix=''):
-    """Создание визуализаций для анализа регионов"""
+    """Создание визуализаций для анализа регионов (каждая диаграмма рисуется отдельно)"""
+
+    for plot in (plot_regions_distribution, plot_regions_pie, plot_regions_success, plot_regions_comparison):
+        submit_chart(plot, region_stats, dataset_type, top_regions_count, output_prefix, label=output_prefix)
 
-    title_map = {
-        'lost': 'поиска питомцев',
-        'found': 'поиска хозяев'
-    }
 
-    dataset_title = title_map[dataset_type]
+def plot_regions_distribution(region_stats, dataset_type, top_regions_count=5, output_prefix=''):
+    """Горизонтальная гистограмма - регионы по общему количеству заявок"""
+
+    dataset_title = TITLE_MAP[dataset_type]
 
-    # 1. Горизонтальная гистограмма - регионы по общему количеству заявок
     fig, ax = plt.subplots(figsize=(12, 8))
     bars = ax.barh(region_stats.index, region_stats['общее_количество'])
     ax.set_xlabel('Количество заявок')
@@ -161,10 +166,15 @@ def create_visualizations(region_stats, dataset_type, top_regions_count=5, outpu
                     bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.1.2. Распределение количества заявок по регионам для {output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.1.2. Распределение количества заявок по регионам для {output_prefix}.png'))
     plt.close()
 
-    # 2. Круговая диаграмма - распределение заявок по регионам
+
+def plot_regions_pie(region_stats, dataset_type, top_regions_count=5, output_prefix=''):
+    """Круговая диаграмма - распределение заявок по регионам"""
+
+    dataset_title = TITLE_MAP[dataset_type]
+
     fig, ax = plt.subplots(figsize=(12, 8))
 
     # Рассчитываем проценты для круговой диаграммы
@@ -201,10 +211,15 @@ def create_visualizations(region_stats, dataset_type, top_regions_count=5, outpu
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.1.3. Распределение количества заявок по регионам для {output_prefix} (Круговая диаграмма).png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.1.3. Распределение количества заявок по регионам для {output_prefix} (Круговая диаграмма).png'))
     plt.close()
 
-    # 3. График эффективности регионов (процент найденных)
+
+def plot_regions_success(region_stats, dataset_type, top_regions_count=5, output_prefix=''):
+    """График эффективности регионов (процент найденных)"""
+
+    dataset_title = TITLE_MAP[dataset_type]
+
     fig, ax = plt.subplots(figsize=(12, 8))
 
     # Сортируем по проценту найденных для лучшего отображения
@@ -229,10 +244,15 @@ def create_visualizations(region_stats, dataset_type, top_regions_count=5, outpu
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.1.4. Процент успешных случаев поиска по регионам для {output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.1.4. Процент успешных случаев поиска по регионам для {output_prefix}.png'))
     plt.close()
 
-    # 4. Столбчатая диаграмма - сравнение абсолютных чисел
+
+def plot_regions_comparison(region_stats, dataset_type, top_regions_count=5, output_prefix=''):
+    """Столбчатая диаграмма - сравнение абсолютных чисел"""
+
+    dataset_title = TITLE_MAP[dataset_type]
+
     fig, ax = plt.subplots(figsize=(12, 8))
 
     x = np.arange(len(region_stats))
@@ -278,18 +298,24 @@ def create_visualizations(region_stats, dataset_type, top_regions_count=5, outpu
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.1.5. Сравнение общего количества заявок и успешных случаев по регионам для {output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.1.5. Сравнение общего количества заявок и успешных случаев по регионам для {output_prefix}.png'))
     plt.close()
 
 
-def analyze_dataset(file_path, dataset_type, top_regions_count=5):
-    """Полный анализ для одного датасета (без вывода в консоль)"""
+def analyze_dataset(dataset_type, top_regions_count=5, filters=None, chunksize=None):
+    """
+    Полный анализ для одного датасета (без вывода в консоль).
+    Регионы считаются по агрегатному кубу; chunksize - размер части при
+    построении куба (см. src/cube.py).
+    """
 
-    # Загрузка данных
-    df = load_and_prepare_data(file_path, dataset_type)
+    cube_frame = cube.load(dataset_type, filters, chunksize)
+    if cube_frame['n'].sum() == 0:
+        print(f"Нет данных для анализа: {dataset_path(dataset_type)}")
+        return None, None
 
     # Анализ регионов
-    region_stats_viz, region_stats_full = analyze_regions(df, top_regions_count)
+    region_stats_viz, region_stats_full = analyze_regions(cube_frame, top_regions_count)
 
     # Создание таблицы с топ-10 регионами
     top_regions = create_regions_table(region_stats_full, dataset_type, top_regions_count,
@@ -298,25 +324,33 @@ def analyze_dataset(file_path, dataset_type, top_regions_count=5):
     # Создание визуализаций
     create_visualizations(region_stats_viz, dataset_type, top_regions_count, output_prefix=f'{dataset_type}')
 
-    return df, region_stats_viz, region_stats_full
+    return region_stats_viz, region_stats_full
 
 
-def step_1_1():
-    """Основная функция анализа для обоих датасетов (без вывода в консоль)"""
+def step_1_1(filters=None, chunksize=None):
+    """
+    Основная функция анализа для обоих датасетов (без вывода в консоль).
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
+    chunksize - размер части для потоковой обработки (None - весь файл в памяти)
+    """
 
         # Настройка отображения
     plt.style.use('default')
     sns.set_palette("husl")
     
     # Создаем папку для результатов
-    os.makedirs('results/Результаты 1 главы анализа', exist_ok=True)
-
-    # Анализ для lost датасета (поиск питомцев)
-    df_lost, stats_lost_viz, stats_lost_full = analyze_dataset(
-        'data/Dataset_final_Pet911_lost.csv', 'lost', top_regions_count=5
-    )
-
-    # Анализ для found датасета (поиск хозяев)
-    df_found, stats_found_viz, stats_found_full = analyze_dataset(
-        'data/dataset_final_Pet911_found.csv', 'found', top_regions_count=5
-    )
+    os.makedirs(results_path('Результаты 1 главы анализа'), exist_ok=True)
+
+    # Диаграммы рисуются в пуле процессов, пока идут вычисления (см. src/rendering.py)
+    with chart_batch('step_1_1'):
+        # Анализ для lost датасета (поиск питомцев)
+        if selects(filters, 'lost'):
+            stats_lost_viz, stats_lost_full = analyze_dataset(
+                'lost', top_regions_count=5, filters=filters, chunksize=chunksize
+            )
+
+        # Анализ для found датасета (поиск хозяев)
+        if selects(filters, 'found'):
+            stats_found_viz, stats_found_full = analyze_dataset(
+                'found', top_regions_count=5, filters=filters, chunksize=chunksize
+            )
@@ -1,33 +1,25 @@
 from .deps import *
+from .config import dataset_path, results_path
+from .partitions import selects
+from . import cube, forecasting, time_counters
+from .forecasting import MODEL_TITLES
+from .rendering import chart_batch, save_figure, submit_chart
+from .phases import timed
+from .caches import map_cached
 
-def load_and_prepare_data(file_path, dataset_type):
-    """Загрузка и подготовка данных"""
-    df = pd.read_csv(file_path)
+# Горизонт прогноза в месяцах
+FORECAST_HORIZON = 3
 
-    # Функция для преобразования русских дат
-    def parse_russian_date(date_str):
-        try:
-            russian_to_english = {
-                'пн': 'Mon', 'вт': 'Tue', 'ср': 'Wed', 'чт': 'Thu',
-                'пт': 'Fri', 'сб': 'Sat', 'вс': 'Sun'
-            }
+# Срезы для прогноза по группам: колонка датасета -> подпись в таблице
+FORECAST_SEGMENTS = {'регион': 'регион', 'тип_животного': 'тип животного'}
 
-            parts = date_str.split(', ')
-            if len(parts) == 2:
-                day_abbr = parts[0].strip()
-                date_part = parts[1].strip()
 
-                if day_abbr in russian_to_english:
-                    english_abbr = russian_to_english[day_abbr]
-                    english_date_str = f"{english_abbr}, {date_part}"
-                    return pd.to_datetime(english_date_str, format='%a, %d.%m.%Y')
-
-            return pd.to_datetime(date_str, errors='coerce')
-        except:
-            return pd.NaT
+@timed('preprocess')
+def prepare_data(df):
+    """Разбор дат публикации для загруженных строк"""
 
     # Применяем функцию преобразования дат
-    df['дата_публикации'] = df['дата_публикации'].apply(parse_russian_date)
+    df['дата_публикации'] = map_cached(df['дата_публикации'], time_counters.parse_publication_date)
 
     # Удаляем строки с некорректными датами
     df_clean = df.dropna(subset=['дата_публикации'])
@@ -35,18 +27,30 @@ def load_and_prepare_data(file_path, dataset_type):
     return df_clean
 
 
-def prepare_monthly_data(df):
-    """Подготовка месячных данных"""
-    if df is None or len(df) == 0:
-        return None
+def count_publications(df):
+    """Количество заявок по датам публикации (по подготовленным строкам)"""
+    return df.groupby('дата_публикации').size()
 
-    # Создаем копию и устанавливаем дату как индекс
-    df_temp = df.copy()
-    df_temp.set_index('дата_публикации', inplace=True)
 
-    # Агрегируем по месяцам
-    monthly_data = df_temp.resample('M').size()
-    monthly_data = monthly_data.to_frame(name='количество_заявок')
+def prepare_monthly_data(df=None, daily_counts=None, monthly_counts=None):
+    """
+    Подготовка месячных данных: по строкам df, по готовым количествам по
+    датам или по готовым количествам по месяцам (src/time_counters.py)
+    """
+    if monthly_counts is None:
+        if daily_counts is None:
+            if df is None or len(df) == 0:
+                return None
+            daily_counts = count_publications(df)
+        if len(daily_counts) == 0:
+            return None
+
+        # Агрегируем по месяцам
+        monthly_counts = daily_counts.resample('M').sum()
+    if len(monthly_counts) == 0:
+        return None
+
+    monthly_data = monthly_counts.to_frame(name='количество_заявок')
 
     # Добавляем месяц и год для удобства
     monthly_data['год'] = monthly_data.index.year
@@ -55,27 +59,36 @@ def prepare_monthly_data(df):
     return monthly_data
 
 
-def prepare_weekly_data(df):
-    """Подготовка недельных данных"""
-    if df is None or len(df) == 0:
-        return None
+def prepare_weekly_data(df=None, daily_counts=None, weekly_counts=None):
+    """Подготовка недельных данных (по строкам df, количествам по датам или по неделям)"""
+    if weekly_counts is None:
+        if daily_counts is None:
+            if df is None or len(df) == 0:
+                return None
+            daily_counts = count_publications(df)
+        if len(daily_counts) == 0:
+            return None
 
-    df_temp = df.copy()
-    df_temp.set_index('дата_публикации', inplace=True)
+        # Агрегируем по неделям
+        weekly_counts = daily_counts.resample('W').sum()
+    if len(weekly_counts) == 0:
+        return None
 
-    # Агрегируем по неделям
-    weekly_data = df_temp.resample('W').size()
-    weekly_data = weekly_data.to_frame(name='количество_заявок')
+    weekly_data = weekly_counts.to_frame(name='количество_заявок')
 
     return weekly_data
 
 
-def prepare_daily_data(df):
+def prepare_daily_data(df=None, daily_counts=None):
     """Подготовка дневных данных по дням недели"""
-    if df is None or len(df) == 0:
+    if daily_counts is None:
+        if df is None or len(df) == 0:
+            return None
+        daily_counts = count_publications(df)
+    if len(daily_counts) == 0:
         return None
 
-    df_temp = df.copy()
+    df_temp = daily_counts.rename('количество_заявок').rename_axis('дата_публикации').reset_index()
 
     # Добавляем день недели
     df_temp['день_недели'] = df_temp['дата_публикации'].dt.dayofweek
@@ -85,13 +98,13 @@ def prepare_daily_data(df):
     })
 
     # Группируем по дням недели
-    daily_data = df_temp.groupby(['день_недели', 'название_дня']).size()
+    daily_data = df_temp.groupby(['день_недели', 'название_дня'])['количество_заявок'].sum()
     daily_data = daily_data.to_frame(name='количество_заявок').reset_index()
 
     return daily_data
 
 
-def create_daily_analysis(daily_data, dataset_type, df, output_prefix=''):
+def create_daily_analysis(daily_data, dataset_type, period, output_prefix=''):
     """Анализ данных по дням недели"""
 
     title_map = {
@@ -123,9 +136,9 @@ def create_daily_analysis(daily_data, dataset_type, df, output_prefix=''):
                  f'{value}', ha='center', va='bottom', fontweight='bold')
 
     # Добавляем пояснение
-    start_date = df['дата_публикации'].min().strftime('%d.%m.%Y')
-    end_date = df['дата_публикации'].max().strftime('%d.%m.%Y')
-    total_days = (df['дата_публикации'].max() - df['дата_публикации'].min()).days + 1
+    start_date = period[0].strftime('%d.%m.%Y')
+    end_date = period[1].strftime('%d.%m.%Y')
+    total_days = (period[1] - period[0]).days + 1
     explanation = (f"Анализ основан на данных с {start_date} по {end_date} "
                    f"({total_days} дней)\n"
                    f"Значения показывают общее количество заявок по каждому дню недели за весь период")
@@ -133,11 +146,11 @@ def create_daily_analysis(daily_data, dataset_type, df, output_prefix=''):
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.2.1. Распределение общего количества заявок по дням недели для {output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.2.1. Распределение общего количества заявок по дням недели для {output_prefix}.png'))
     plt.close()
 
 
-def create_weekly_analysis(weekly_data, dataset_type, df, output_prefix=''):
+def create_weekly_analysis(weekly_data, dataset_type, period, output_prefix=''):
     """Анализ недельных данных"""
 
     title_map = {
@@ -180,8 +193,8 @@ def create_weekly_analysis(weekly_data, dataset_type, df, output_prefix=''):
     plt.grid(True, alpha=0.3)
 
     # Добавляем пояснение
-    start_date = df['дата_публикации'].min().strftime('%d.%m.%Y')
-    end_date = df['дата_публикации'].max().strftime('%d.%m.%Y')
+    start_date = period[0].strftime('%d.%m.%Y')
+    end_date = period[1].strftime('%d.%m.%Y')
     total_weeks = len(weekly_data)
     explanation = (f"Анализ основан на данных с {start_date} по {end_date} "
                    f"({total_weeks} недель)\n"
@@ -190,12 +203,12 @@ def create_weekly_analysis(weekly_data, dataset_type, df, output_prefix=''):
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.2.2. Распределение общего количества заявок по неделям для {output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.2.2. Распределение общего количества заявок по неделям для {output_prefix}.png'))
     plt.close()
 
 
-def create_monthly_forecast(monthly_data, dataset_type, df, output_prefix=''):
-    """Прогноз на 3 месяца вперед"""
+def create_monthly_forecast(monthly_data, forecast, dataset_type, period, output_prefix=''):
+    """Прогноз на 3 месяца вперед с интервалами (forecast - результат src/forecasting.py)"""
 
     title_map = {
         'lost': 'поиска питомцев',
@@ -214,15 +227,12 @@ def create_monthly_forecast(monthly_data, dataset_type, df, output_prefix=''):
     last_date = monthly_data.index[-1]
     forecast_months = []
 
-    for i in range(1, 4):
+    for i in range(1, FORECAST_HORIZON + 1):
         next_month = last_date + pd.DateOffset(months=i)
         forecast_months.append(next_month)
 
-    # Простой прогноз: среднее значение предыдущих месяцев
-    avg_requests = monthly_data['количество_заявок'].mean()
-    # Добавляем небольшую случайную вариацию для реалистичности
-    np.random.seed(42)  # для воспроизводимости
-    forecast_values = [avg_requests * (0.9 + 0.2 * np.random.random()) for _ in range(3)]
+    forecast_values = forecast['mean'][0].tolist()
+    lower, upper = forecast['lower'][0], forecast['upper'][0]
 
     # Подготовка данных для графика прогноза
     months_names = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн',
@@ -238,6 +248,11 @@ def create_monthly_forecast(monthly_data, dataset_type, df, output_prefix=''):
     colors = ['lightblue'] * len(monthly_data) + ['lightcoral'] * len(forecast_months)
 
     bars = plt.bar(range(len(all_labels)), all_values, color=colors, alpha=0.7)
+    # Интервал прогноза
+    forecast_positions = range(len(monthly_data), len(all_labels))
+    plt.errorbar(forecast_positions, forecast_values, yerr=[np.array(forecast_values) - lower, upper - forecast_values],
+                 fmt='none', ecolor='darkred', capsize=6, alpha=0.8)
+    tops = monthly_data['количество_заявок'].tolist() + upper.tolist()
     plt.title(f'Прогноз количества заявок на 3 месяца ({dataset_title})',
               fontsize=14, fontweight='bold')
     plt.ylabel('Количество заявок')
@@ -246,52 +261,115 @@ def create_monthly_forecast(monthly_data, dataset_type, df, output_prefix=''):
 
     # Добавляем разделительную линию между фактом и прогнозом
     plt.axvline(x=len(monthly_data) - 0.5, color='red', linestyle='--', alpha=0.7)
-    plt.text(len(monthly_data) - 0.5, max(all_values) * 0.9, 'Прогноз',
+    plt.text(len(monthly_data) - 0.5, max(tops) * 0.9, 'Прогноз',
              rotation=90, ha='right', va='top', color='red', fontweight='bold')
 
-    # Добавляем значения на столбцы
+    # Добавляем значения на столбцы (над интервалом прогноза)
     for i, value in enumerate(all_values):
-        plt.text(i, value + max(all_values) * 0.01, f'{value:.0f}',
+        plt.text(i, tops[i] + max(tops) * 0.01, f'{value:.0f}',
                  ha='center', va='bottom', fontweight='bold')
 
     # Добавляем пояснение
-    start_date = df['дата_публикации'].min().strftime('%d.%m.%Y')
-    end_date = df['дата_публикации'].max().strftime('%d.%m.%Y')
+    start_date = period[0].strftime('%d.%m.%Y')
+    end_date = period[1].strftime('%d.%m.%Y')
     total_months = len(monthly_data)
     explanation = (f"Анализ основан на данных с {start_date} по {end_date} "
                    f"({total_months} месяцев)\n"
-                   f"Прогноз построен на основе среднемесячных значений с учетом случайных вариаций")
+                   f"Прогноз: модель \"{MODEL_TITLES[forecast['model'][0]]}\", "
+                   f"интервал {forecast['level']:.0%}")
     plt.figtext(0.02, 0.02, explanation, fontsize=9, style='italic',
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 1 главы анализа/1.2.3. Прогноз на основе общего количества заявок по месяцам для{output_prefix}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 1 главы анализа/1.2.3. Прогноз на основе общего количества заявок по месяцам для{output_prefix}.png'))
     plt.close()
 
 
-def analyze_dataset(file_path, dataset_type, output_prefix=''):
-    """Полный анализ временных рядов для одного датасета"""
+def segment_monthly_counts(cube_frame, months):
+    """Количество заявок по месяцам months для каждого региона и типа животного (срезы × месяцы)"""
+    frame = prepare_data(cube_frame[list(FORECAST_SEGMENTS) + ['дата_публикации', 'n']].copy())
+    frame['месяц'] = frame['дата_публикации'] + pd.offsets.MonthEnd(0)
+
+    tables = []
+    for column in FORECAST_SEGMENTS:
+        table = frame.groupby([frame[column].fillna('Неизвестно'), 'месяц'])['n'].sum().unstack(fill_value=0)
+        table = table.reindex(columns=months, fill_value=0)
+        table.index = pd.MultiIndex.from_product([[FORECAST_SEGMENTS[column]], table.index], names=['срез', 'значение'])
+        tables.append(table)
+    return pd.concat(tables)
+
+
+@timed('compute')
+def forecast_segments(dataset_type, months, filters=None, chunksize=None, output_prefix=''):
+    """
+    Прогноз заявок на FORECAST_HORIZON месяцев для каждого региона и типа
+    животного: все ряды прогнозируются одним вызовом (src/forecasting.py),
+    таблица с интервалами и ошибкой проверки сохраняется в CSV
+    """
+    counts = segment_monthly_counts(cube.load(dataset_type, filters, chunksize), months)
+    if counts.empty:
+        return None
 
-    # Загрузка данных
-    df = load_and_prepare_data(file_path, dataset_type)
+    result = forecasting.forecast(counts.to_numpy(), FORECAST_HORIZON)
+    print(f"📈 Прогноз {dataset_type}: {len(counts)} рядов за {result['elapsed']:.2f} с "
+          f"({result['series_per_second']:.0f} рядов/с)")
+
+    forecast_months = [(months[-1] + pd.offsets.MonthEnd(i)).strftime('%Y-%m') for i in range(1, FORECAST_HORIZON + 1)]
+    table = pd.DataFrame({
+        'срез': counts.index.get_level_values('срез').repeat(FORECAST_HORIZON),
+        'значение': counts.index.get_level_values('значение').repeat(FORECAST_HORIZON),
+        'заявок_за_период': counts.sum(axis=1).to_numpy().repeat(FORECAST_HORIZON),
+        'месяц': forecast_months * len(counts),
+        'прогноз': result['mean'].ravel().round(1),
+        'нижняя_граница': result['lower'].ravel().round(1),
+        'верхняя_граница': result['upper'].ravel().round(1),
+        'модель': [MODEL_TITLES[name] for name in result['model'].repeat(FORECAST_HORIZON)],
+        'ошибка_проверки': result['backtest_mae'].repeat(FORECAST_HORIZON).round(2),
+    })
+    table.to_csv(results_path(f'Результаты 1 главы анализа/1.2.4. Прогноз заявок по регионам и типам животных для{output_prefix}.csv'),
+                 index=False, encoding='utf-8-sig')
+    return table
 
-    if df is None or len(df) == 0:
-        print(f"Нет данных для анализа: {file_path}")
-        return
 
-    # Подготовка данных
-    monthly_data = prepare_monthly_data(df)
-    weekly_data = prepare_weekly_data(df)
-    daily_data = prepare_daily_data(df)
+def analyze_dataset(dataset_type, output_prefix='', filters=None, chunksize=None):
+    """
+    Полный анализ временных рядов для одного датасета.
+    Количества по дням, неделям и месяцам берутся из счетчиков, которые
+    пополняются только новыми объявлениями; chunksize - размер части при
+    чтении новых строк (см. src/time_counters.py).
+    """
 
-    # Создание визуализаций в правильном порядке
-    create_daily_analysis(daily_data, dataset_type, df, output_prefix)
-    create_weekly_analysis(weekly_data, dataset_type, df, output_prefix)
-    create_monthly_forecast(monthly_data, dataset_type, df, output_prefix)
+    time_counters.update(dataset_type, filters, chunksize)
+    daily_counts = time_counters.series('day', dataset_type, filters)
 
+    if len(daily_counts) == 0:
+        print(f"Нет данных для анализа: {dataset_path(dataset_type)}")
+        return
 
-def step_1_2():
-    """Основная функция анализа"""
+    # Подготовка данных
+    monthly_data = prepare_monthly_data(monthly_counts=time_counters.series('month', dataset_type, filters))
+    weekly_data = prepare_weekly_data(weekly_counts=time_counters.series('week', dataset_type, filters))
+    daily_data = prepare_daily_data(daily_counts=daily_counts)
+    period = (daily_counts.index.min(), daily_counts.index.max())
+
+    # Прогноз общего количества заявок и заявок по регионам и типам животных
+    forecast = forecasting.forecast(monthly_data['количество_заявок'].to_numpy(), FORECAST_HORIZON)
+    forecast_segments(dataset_type, monthly_data.index, filters, chunksize, output_prefix)
+
+    # Создание визуализаций (рисуются параллельно, см. src/rendering.py)
+    for create_chart, data in ((create_daily_analysis, daily_data),
+                               (create_weekly_analysis, weekly_data)):
+        submit_chart(create_chart, data, dataset_type, period, output_prefix, label=dataset_type)
+    submit_chart(create_monthly_forecast, monthly_data, forecast, dataset_type, period, output_prefix,
+                 label=dataset_type)
+
+
+def step_1_2(filters=None, chunksize=None):
+    """
+    Основная функция анализа.
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
+    chunksize - размер части для потоковой обработки (None - весь файл в памяти)
+    """
 
     warnings.filterwarnings('ignore')
 
@@ -300,10 +378,13 @@ def step_1_2():
     sns.set_palette("husl")
     
     # Создаем папку для результатов
-    os.makedirs('results/Результаты 1 главы анализа', exist_ok=True)
+    os.makedirs(results_path('Результаты 1 главы анализа'), exist_ok=True)
 
-    # Анализ для lost датасета (поиск питомцев)
-    analyze_dataset('data/Dataset_final_Pet911_lost.csv', 'lost', output_prefix='lost')
+    with chart_batch('step_1_2'):
+        # Анализ для lost датасета (поиск питомцев)
+        if selects(filters, 'lost'):
+            analyze_dataset('lost', output_prefix='lost', filters=filters, chunksize=chunksize)
 
-    # Анализ для found датасета (поиск хозяев)
-    analyze_dataset('data/dataset_final_Pet911_found.csv', 'found', output_prefix='found')
+        # Анализ для found датасета (поиск хозяев)
+        if selects(filters, 'found'):
+            analyze_dataset('found', output_prefix='found', filters=filters, chunksize=chunksize)
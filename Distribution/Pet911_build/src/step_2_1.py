@@ -1,18 +1,29 @@
 from .deps import *
+from .config import dataset_path, results_path
+from .partitions import read_dataset, selects
+from .chunked import DEFAULT_CHUNKSIZE, Moments, histogram_stats, iter_chunks, merge_counts, weighted_rate
+from .rendering import chart_batch, save_figure, submit_chart
+from .phases import timed
 
-def load_data(file_path):
-    """Загрузка данных"""
+ENCODINGS = ['utf-8', 'cp1251', 'latin1']
+
+# Группы по количеству комментариев
+COMMENT_BINS = [-1, 0, 2, 5, 10, 100]
+COMMENT_LABELS = ['0', '1-2', '3-5', '6-10', '10+']
+
+@timed('load')
+def load_data(file_path, dataset_type=None, filters=None):
+    """Загрузка данных (с отбором партиций, если заданы фильтры)"""
     try:
         if not os.path.exists(file_path):
             print(f"ОШИБКА: Файл {file_path} не найден!")
             return None
 
-        encodings = ['utf-8', 'cp1251', 'latin1']
         df = None
 
-        for encoding in encodings:
+        for encoding in ENCODINGS:
             try:
-                df = pd.read_csv(file_path, encoding=encoding)
+                df = read_dataset(file_path, dataset_type, filters, encoding=encoding)
                 break
             except UnicodeDecodeError:
                 continue
@@ -28,38 +39,106 @@ def load_data(file_path):
         return None
 
 
-def analyze_comments_correlation(df, dataset_type):
+def describe_dataset(dataset_type):
+    """Статус успешного объявления и подписи для диаграмм в зависимости от типа датасета"""
+    if dataset_type == 'found':
+        # Для найденных животных: успех = "хозяин найден"
+        return 'хозяин найден', "100% - все объявления о найденных животных", "поиск хозяев"
+    # Для потерянных животных: успех = "питомец найден"
+    return 'питомец найден', "100% - все объявления о потерянных животных", "поиск питомца"
+
+
+def aggregate_comments(df, dataset_type, aggregates=None):
+    """
+    Частичные агрегаты по части данных: частоты пар (успех, количество
+    комментариев) и моменты для корреляции. Агрегаты разных частей
+    объединяются, результат не зависит от разбиения файла.
+    """
+    success_status, _, _ = describe_dataset(dataset_type)
+
+    # Бинарная переменная успеха
+    df_analysis = pd.DataFrame({
+        'успех': (df['статус'] == success_status).astype(int),
+        'количество_комментариев': df['количество_комментариев'],
+    })
+
+    if aggregates is None:
+        aggregates = {'histogram': None, 'moments': Moments()}
+
+    histogram = df_analysis.groupby(['успех', 'количество_комментариев'], dropna=False).size()
+    aggregates['histogram'] = merge_counts(aggregates['histogram'], histogram)
+    aggregates['moments'].update(df_analysis['количество_комментариев'], df_analysis['успех'])
+    return aggregates
+
+
+def aggregate_comments_chunked(file_path, dataset_type, filters=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Агрегаты по комментариям с чтением файла частями по chunksize строк"""
+    for encoding in ENCODINGS:
+        try:
+            aggregates = None
+            for chunk in iter_chunks(file_path, dataset_type, filters, chunksize, encoding=encoding,
+                                     usecols=['статус', 'количество_комментариев']):
+                aggregates = aggregate_comments(chunk, dataset_type, aggregates)
+            return aggregates
+        except UnicodeDecodeError:
+            continue
+
+    print("ОШИБКА: Не удалось загрузить файл")
+    return None
+
+
+def comments_group_stats(frame):
+    """Среднее, медиана, стандартное отклонение и количество комментариев по группам успеха"""
+    rows = {}
+    for success, group in frame.groupby('успех'):
+        values = group.dropna(subset=['количество_комментариев'])
+        rows[success] = histogram_stats(values.groupby('количество_комментариев')['n'].sum())
+
+    success_stats = pd.DataFrame.from_dict(rows, orient='index')[['mean', 'median', 'std', 'count']]
+    success_stats.index.name = 'успех'
+    return success_stats
+
+
+def analyze_comments_correlation(aggregates, dataset_type):
     """Анализ корреляции между комментариями и успешностью поиска"""
 
-    df_analysis = df.copy()
+    _, success_description, display_name = describe_dataset(dataset_type)
+    frame = aggregates['histogram'].rename('n').reset_index()
 
-    # Создаем бинарную переменную успеха в зависимости от типа датасета
-    df_analysis['успех'] = 0
+    # Базовая статистика
+    success_stats = comments_group_stats(frame)
 
-    if dataset_type == 'found':
-        # Для найденных животных: успех = "хозяин найден"
-        df_analysis.loc[df_analysis['статус'] == 'хозяин найден', 'успех'] = 1
-        success_description = "100% - все объявления о найденных животных"
-        display_name = "поиск хозяев"
+    # Корреляционный анализ
+    correlation = aggregates['moments'].corr()
+
+    # T-тест для проверки значимости различий (пропуски считаются нулем комментариев)
+    frame_filled = frame.fillna({'количество_комментариев': 0})
+    filled_stats = comments_group_stats(frame_filled)
+    if {0, 1} <= set(filled_stats.index) and filled_stats['count'].min() > 1:
+        success_row, fail_row = filled_stats.loc[1], filled_stats.loc[0]
+        _, p_value = stats.ttest_ind_from_stats(
+            success_row['mean'], success_row['std'], success_row['count'],
+            fail_row['mean'], fail_row['std'], fail_row['count']
+        )
     else:
-        # Для потерянных животных: успех = "питомец найден"
-        df_analysis.loc[df_analysis['статус'] == 'питомец найден', 'успех'] = 1
-        success_description = "100% - все объявления о потерянных животных"
-        display_name = "поиск питомца"
+        p_value = np.nan
 
-    # Базовая статистика
-    success_stats = df_analysis.groupby('успех')['количество_комментариев'].agg(['mean', 'median', 'std', 'count'])
+    # Доля успешных по группам комментариев
+    success_rate_by_group = success_rate_by_comments(frame)
 
-    # Корреляционный анализ
-    correlation = df_analysis['количество_комментариев'].corr(df_analysis['успех'])
+    return success_rate_by_group, correlation, p_value, success_stats, success_description, display_name
 
-    # T-тест для проверки значимости различий
-    success_comments = df_analysis[df_analysis['успех'] == 1]['количество_комментариев'].fillna(0)
-    fail_comments = df_analysis[df_analysis['успех'] == 0]['количество_комментариев'].fillna(0)
 
-    t_stat, p_value = stats.ttest_ind(success_comments, fail_comments, nan_policy='omit')
+def success_rate_by_comments(frame):
+    """Доля успешных поисков (%) по группам комментариев"""
+    frame = frame.assign(
+        группа_комментариев=pd.cut(frame['количество_комментариев'], bins=COMMENT_BINS, labels=COMMENT_LABELS),
+        успехи=frame['успех'] * frame['n'],
+    )
+    grouped = frame.groupby('группа_комментариев', observed=False)[['успехи', 'n']].sum()
 
-    return df_analysis, correlation, p_value, success_stats, success_description, display_name
+    success_rate_by_group = weighted_rate(grouped['успехи'], grouped['n']) * 100
+    return success_rate_by_group.fillna(0)
 
 
 def create_mean_comments_chart(success_stats, display_name):
@@ -84,21 +163,13 @@ def create_mean_comments_chart(success_stats, display_name):
                  f'{value:.1f}', ha='center', va='bottom', fontsize=12, fontweight='bold')
 
     plt.tight_layout()
-    plt.savefig(f'results/Результаты 2 главы анализа/2.1.1. Среднее количество комментариев для {display_name}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 2 главы анализа/2.1.1. Среднее количество комментариев для {display_name}.png'))
     plt.close()
 
 
-def create_success_rate_by_comments_chart(df_analysis, display_name, success_description):
+def create_success_rate_by_comments_chart(success_rate_by_group, display_name, success_description):
     """Создание диаграммы доли успешных по группам комментариев"""
 
-    # Создаем группы комментариев
-    df_analysis['группа_комментариев'] = pd.cut(df_analysis['количество_комментариев'],
-                                                bins=[-1, 0, 2, 5, 10, 100],
-                                                labels=['0', '1-2', '3-5', '6-10', '10+'])
-
-    success_rate_by_group = df_analysis.groupby('группа_комментариев')['успех'].mean() * 100
-    success_rate_by_group = success_rate_by_group.fillna(0)
-
     plt.figure(figsize=(12, 7))
 
     bars = plt.bar(range(len(success_rate_by_group)), success_rate_by_group.values,
@@ -122,40 +193,50 @@ def create_success_rate_by_comments_chart(df_analysis, display_name, success_des
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout(rect=[0, 0.08, 1, 0.95])
-    plt.savefig(f'results/Результаты 2 главы анализа/2.1.2. Зависимость успешности поиска от количества комментариев для {display_name}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 2 главы анализа/2.1.2. Зависимость успешности поиска от количества комментариев для {display_name}.png'))
     plt.close()
 
-    return success_rate_by_group
-
 
-def analyze_single_dataset(file_path, dataset_type):
-    """Анализ одного датасета"""
+def analyze_single_dataset(file_path, dataset_type, filters=None, chunksize=None):
+    """Анализ одного датасета (при заданном chunksize - с чтением файла частями)"""
 
-    # Загрузка данных
-    df = load_data(file_path)
+    # Загрузка данных и подсчет агрегатов
+    if chunksize:
+        aggregates = aggregate_comments_chunked(file_path, dataset_type, filters, chunksize)
+    else:
+        df = load_data(file_path, dataset_type, filters)
+        aggregates = aggregate_comments(df, dataset_type) if df is not None and len(df) > 0 else None
 
-    if df is None:
+    if aggregates is None or aggregates['histogram'] is None:
         return
 
     # Анализ корреляции
-    df_analysis, correlation, p_value, success_stats, success_description, display_name = analyze_comments_correlation(
-        df, dataset_type)
+    success_rate_by_group, correlation, p_value, success_stats, success_description, display_name = analyze_comments_correlation(
+        aggregates, dataset_type)
 
     # Создание диаграмм
-    create_mean_comments_chart(success_stats, display_name)
-    success_rate_by_group = create_success_rate_by_comments_chart(df_analysis, display_name, success_description)
+    submit_chart(create_mean_comments_chart, success_stats, display_name, label=dataset_type)
+    submit_chart(create_success_rate_by_comments_chart, success_rate_by_group, display_name, success_description,
+                 label=dataset_type)
 
-def step_2_1():
+def step_2_1(filters=None, chunksize=None):
 
-    """Основная функция для анализа обоих датасетов"""
+    """
+    Основная функция для анализа обоих датасетов.
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
+    chunksize - размер части для потоковой обработки (None - весь файл в памяти)
+    """
 
     warnings.filterwarnings('ignore')
 
     # Создаем папку для результатов
-    os.makedirs('results/Результаты 2 главы анализа', exist_ok=True)
+    os.makedirs(results_path('Результаты 2 главы анализа'), exist_ok=True)
 
-    # Анализ датасета найденных животных (поиск хозяина)
-    analyze_single_dataset('data/dataset_final_Pet911_found.csv', 'found')
+    with chart_batch('step_2_1'):
+        # Анализ датасета найденных животных (поиск хозяина)
+        if selects(filters, 'found'):
+            analyze_single_dataset(dataset_path('found'), 'found', filters, chunksize)
 
-    # Анализ датасета потерянных животных (поиск питомца)
-    analyze_single_dataset('data/Dataset_final_Pet911_lost.csv', 'lost')
+        # Анализ датасета потерянных животных (поиск питомца)
+        if selects(filters, 'lost'):
+            analyze_single_dataset(dataset_path('lost'), 'lost', filters, chunksize)
@@ -1,64 +1,145 @@
 from .deps import *
+from .config import results_path
+from .partitions import selects
+from . import cube, interactions
+from .chunked import Moments, histogram_quantile, weighted_rate
+from .rendering import chart_batch, save_figure, submit_chart
 
-def load_data(file_path):
-    """Загрузка данных"""
-    try:
-        if not os.path.exists(file_path):
-            print(f"ОШИБКА: Файл {file_path} не найден!")
-            return None
+# Признаки, по которым строится сводная таблица частот
+FACTOR_COLUMNS = ['есть_фото_num', 'количество_фото', 'Длина_описания_в_словах', 'успех']
 
-        encodings = ['utf-8', 'cp1251', 'latin1']
-        df = None
+# Группы по количеству фото
+PHOTO_BINS = [-1, 0, 1, 3, 10, 100]
+PHOTO_LABELS = ['0 фото', '1 фото', '2-3 фото', '4-10 фото', '10+ фото']
 
-        for encoding in encodings:
-            try:
-                df = pd.read_csv(file_path, encoding=encoding)
-                break
-            except UnicodeDecodeError:
-                continue
 
-        if df is None:
-            print("ОШИБКА: Не удалось загрузить файл")
-            return None
+def describe_dataset(dataset_type):
+    """Статус успешного объявления и подписи для диаграмм в зависимости от типа датасета"""
+    if dataset_type == 'found':
+        # Для найденных животных: успех = "хозяин найден"
+        return 'хозяин найден', "100% - все объявления о найденных животных", "поиск хозяев"
+    # Для потерянных животных: успех = "питомец найден"
+    return 'питомец найден', "100% - все объявления о потерянных животных", "поиск питомца"
+
+
+def aggregate_publication_factors(cube_frame, dataset_type):
+    """
+    Агрегаты по факторам публикации из куба публикации (см. src/cube.py):
+    сводная таблица частот по фото, длине описания и успеху, а также
+    моменты для корреляций (ячейки куба взвешены числом объявлений).
+    """
+    success_status, _, _ = describe_dataset(dataset_type)
+
+    df_analysis = pd.DataFrame({
+        # Преобразуем есть_фото в числовой формат
+        'есть_фото_num': cube_frame['есть_фото'].astype(int),
+        'количество_фото': cube_frame['количество_фото'],
+        'Длина_описания_в_словах': cube_frame['Длина_описания_в_словах'],
+        # Бинарная переменная успеха
+        'успех': (cube_frame['статус'] == success_status).astype(int),
+        'n': cube_frame['n'],
+    })
+
+    aggregates = {'table': cube.rollup(df_analysis, FACTOR_COLUMNS, 'n')}
+    for name, column in (('photo', 'есть_фото_num'), ('photos_count', 'количество_фото'),
+                         ('desc_length', 'Длина_описания_в_словах')):
+        aggregates[name] = Moments().update(df_analysis[column], df_analysis['успех'], weights=df_analysis['n'])
+    return aggregates
+
+
+def success_by_group(frame, groups):
+    """Доля успехов (mean) и число объявлений (count) по группам для сводной таблицы частот"""
+    frame = frame.assign(группа=groups, успехи=frame['успех'] * frame['n'])
+    grouped = frame.groupby('группа', observed=False)[['успехи', 'n']].sum()
+    grouped.index.name = groups.name
+    return pd.DataFrame({'mean': weighted_rate(grouped['успехи'], grouped['n']), 'count': grouped['n']})
+
+
+def description_length_quartiles(frame):
+    """Квартили и максимум длины описания по сводной таблице частот"""
+    histogram = frame.groupby('Длина_описания_в_словах')['n'].sum()
+    q1, q2, q3 = (histogram_quantile(histogram, q) for q in (0.25, 0.5, 0.75))
+    return q1, q2, q3, histogram[histogram > 0].index.max()
+
+
+def analyze_publication_factors(aggregates, dataset_type):
+    """Анализ влияния фото и описания на успешность"""
 
-        return df
+    _, success_description, display_name = describe_dataset(dataset_type)
+    frame = aggregates['table'].rename('n').reset_index()
 
-    except Exception as e:
-        print(f"ОШИБКА при загрузке данных: {e}")
-        return None
+    # Анализ по наличию фото
+    photo_success = success_by_group(frame, frame['есть_фото_num'])
 
+    # Анализ корреляций
+    photo_corr = aggregates['photo'].corr()
+    photos_count_corr = aggregates['photos_count'].corr()
+    desc_length_corr = aggregates['desc_length'].corr()
 
-def analyze_publication_factors(df, dataset_type):
-    """Анализ влияния фото и описания на успешность"""
+    return frame, photo_success, photo_corr, photos_count_corr, desc_length_corr, success_description, display_name
 
-    df_analysis = df.copy()
 
-    # Создаем бинарную переменную успеха в зависимости от типа датасета
-    df_analysis['успех'] = 0
+def photos_count_success(frame):
+    """Доля успешных поисков (%) по группам количества фото"""
+    groups = pd.cut(frame['количество_фото'], bins=PHOTO_BINS, labels=PHOTO_LABELS).rename('группа_фото')
+    photos_success = success_by_group(frame, groups)['mean'] * 100
 
-    if dataset_type == 'found':
-        # Для найденных животных: успех = "хозяин найден"
-        df_analysis.loc[df_analysis['статус'] == 'хозяин найден', 'успех'] = 1
-        success_description = "100% - все объявления о найденных животных"
-        display_name = "поиск хозяев"
-    else:
-        # Для потерянных животных: успех = "питомец найден"
-        df_analysis.loc[df_analysis['статус'] == 'питомец найден', 'успех'] = 1
-        success_description = "100% - все объявления о потерянных животных"
-        display_name = "поиск питомца"
-
-    # Преобразуем есть_фото в числовой формат
-    df_analysis['есть_фото_num'] = df_analysis['есть_фото'].astype(int)
+    # Заменяем NaN на 0
+    return photos_success.fillna(0)
 
-    # Анализ по наличию фото
-    photo_success = df_analysis.groupby('есть_фото_num')['успех'].agg(['mean', 'count'])
 
-    # Анализ корреляций
-    photo_corr = df_analysis['есть_фото_num'].corr(df_analysis['успех'])
-    photos_count_corr = df_analysis['количество_фото'].corr(df_analysis['успех'])
-    desc_length_corr = df_analysis['Длина_описания_в_словах'].corr(df_analysis['успех'])
+def description_length_success(frame):
+    """Доля успешных поисков (%) по группам длины описания (по квартилям)"""
+
+    # Создаем группы на основе квартилей
+    q1, q2, q3, max_length = description_length_quartiles(frame)
+
+    bins = [-1, q1, q2, q3, max_length]
+    labels = [f'0-{int(q1)} слов', f'{int(q1) + 1}-{int(q2)} слов',
+              f'{int(q2) + 1}-{int(q3)} слов', f'{int(q3) + 1}+ слов']
+
+    groups = pd.cut(frame['Длина_описания_в_словах'], bins=bins, labels=labels).rename('группа_описания')
+    desc_success = success_by_group(frame, groups)['mean'] * 100
+
+    # Заменяем NaN на 0
+    return desc_success.fillna(0)
+
+
+def combined_factors_success(frame):
+    """Доля успешных поисков (%) и количество объявлений по комбинации фото и длины описания"""
+
+    # Создаем комбинированные группы на основе количества фото и длины описания
+    _, median_desc, _, _ = description_length_quartiles(frame)
+
+    # Определяем пороги для количества фото
+    conditions = [
+        (frame['количество_фото'] == 0) & (frame['Длина_описания_в_словах'] <= median_desc),
+        (frame['количество_фото'] == 0) & (frame['Длина_описания_в_словах'] > median_desc),
+        (frame['количество_фото'] == 1) & (frame['Длина_описания_в_словах'] <= median_desc),
+        (frame['количество_фото'] == 1) & (frame['Длина_описания_в_словах'] > median_desc),
+        (frame['количество_фото'] >= 2) & (frame['Длина_описания_в_словах'] <= median_desc),
+        (frame['количество_фото'] >= 2) & (frame['Длина_описания_в_словах'] > median_desc)
+    ]
+
+    choices = [
+        f'0 фото, ≤{int(median_desc)} слов',
+        f'0 фото, >{int(median_desc)} слов',
+        f'1 фото, ≤{int(median_desc)} слов',
+        f'1 фото, >{int(median_desc)} слов',
+        f'2+ фото, ≤{int(median_desc)} слов',
+        f'2+ фото, >{int(median_desc)} слов'
+    ]
 
-    return df_analysis, photo_success, photo_corr, photos_count_corr, desc_length_corr, success_description, display_name
+    groups = pd.Series(np.select(conditions, choices, default='Другое'), index=frame.index,
+                       name='комбинированная_группа')
+
+    combined_success = success_by_group(frame, groups)
+    combined_success = combined_success.sort_values('mean', ascending=False)
+
+    # Заменяем NaN на 0
+    combined_success['mean'] = combined_success['mean'].fillna(0) * 100
+
+    return combined_success
 
 
 def create_photo_success_chart(photo_success, display_name, success_description):
@@ -90,23 +171,13 @@ def create_photo_success_chart(photo_success, display_name, success_description)
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout(rect=[0, 0.05, 1, 0.95])
-    plt.savefig(f'results/Результаты 2 главы анализа/2.2.1. Успешность поиска в зависимости от наличия фото для {display_name}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 2 главы анализа/2.2.1. Успешность поиска в зависимости от наличия фото для {display_name}.png'))
     plt.close()
 
 
-def create_photos_count_chart(df_analysis, display_name, success_description):
+def create_photos_count_chart(photos_success, display_name, success_description):
     """Создание диаграммы успешности по количеству фото"""
 
-    # Создаем группы по количеству фото
-    df_analysis['группа_фото'] = pd.cut(df_analysis['количество_фото'],
-                                        bins=[-1, 0, 1, 3, 10, 100],
-                                        labels=['0 фото', '1 фото', '2-3 фото', '4-10 фото', '10+ фото'])
-
-    photos_success = df_analysis.groupby('группа_фото')['успех'].mean() * 100
-
-    # Заменяем NaN на 0
-    photos_success = photos_success.fillna(0)
-
     plt.figure(figsize=(12, 7))
 
     bars = plt.bar(range(len(photos_success)), photos_success.values,
@@ -128,36 +199,13 @@ def create_photos_count_chart(df_analysis, display_name, success_description):
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout(rect=[0, 0.05, 1, 0.95])
-    plt.savefig(f'results/Результаты 2 главы анализа/2.2.2. Успешность поиска в зависимости от количества фото для {display_name}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 2 главы анализа/2.2.2. Успешность поиска в зависимости от количества фото для {display_name}.png'))
     plt.close()
 
-    return photos_success
 
-
-def create_description_length_chart(df_analysis, display_name, success_description):
+def create_description_length_chart(desc_success, display_name, success_description):
     """Создание диаграммы успешности по длине описания"""
 
-    # Создаем группы по длине описания (количество слов)
-    desc_stats = df_analysis['Длина_описания_в_словах'].describe()
-
-    # Создаем группы на основе квартилей
-    q1 = desc_stats['25%']
-    q2 = desc_stats['50%']
-    q3 = desc_stats['75%']
-
-    bins = [-1, q1, q2, q3, df_analysis['Длина_описания_в_словах'].max()]
-    labels = [f'0-{int(q1)} слов', f'{int(q1) + 1}-{int(q2)} слов',
-              f'{int(q2) + 1}-{int(q3)} слов', f'{int(q3) + 1}+ слов']
-
-    df_analysis['группа_описания'] = pd.cut(df_analysis['Длина_описания_в_словах'],
-                                            bins=bins,
-                                            labels=labels)
-
-    desc_success = df_analysis.groupby('группа_описания')['успех'].mean() * 100
-
-    # Заменяем NaN на 0
-    desc_success = desc_success.fillna(0)
-
     plt.figure(figsize=(12, 7))
 
     bars = plt.bar(range(len(desc_success)), desc_success.values,
@@ -179,45 +227,13 @@ def create_description_length_chart(df_analysis, display_name, success_descripti
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout(rect=[0, 0.05, 1, 0.95])
-    plt.savefig(f'results/Результаты 2 главы анализа/2.2.3. Успешность поиска в зависимости от длины описания для {display_name}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 2 главы анализа/2.2.3. Успешность поиска в зависимости от длины описания для {display_name}.png'))
     plt.close()
 
-    return desc_success
 
-
-def create_combined_factors_chart(df_analysis, display_name, success_description):
+def create_combined_factors_chart(combined_success, display_name, success_description):
     """Создание диаграммы успешности по комбинации факторов (фото + описание)"""
 
-    # Создаем комбинированные группы на основе количества фото и длины описания
-    median_desc = df_analysis['Длина_описания_в_словах'].median()
-
-    # Определяем пороги для количества фото
-    conditions = [
-        (df_analysis['количество_фото'] == 0) & (df_analysis['Длина_описания_в_словах'] <= median_desc),
-        (df_analysis['количество_фото'] == 0) & (df_analysis['Длина_описания_в_словах'] > median_desc),
-        (df_analysis['количество_фото'] == 1) & (df_analysis['Длина_описания_в_словах'] <= median_desc),
-        (df_analysis['количество_фото'] == 1) & (df_analysis['Длина_описания_в_словах'] > median_desc),
-        (df_analysis['количество_фото'] >= 2) & (df_analysis['Длина_описания_в_словах'] <= median_desc),
-        (df_analysis['количество_фото'] >= 2) & (df_analysis['Длина_описания_в_словах'] > median_desc)
-    ]
-
-    choices = [
-        f'0 фото, ≤{int(median_desc)} слов',
-        f'0 фото, >{int(median_desc)} слов',
-        f'1 фото, ≤{int(median_desc)} слов',
-        f'1 фото, >{int(median_desc)} слов',
-        f'2+ фото, ≤{int(median_desc)} слов',
-        f'2+ фото, >{int(median_desc)} слов'
-    ]
-
-    df_analysis['комбинированная_группа'] = np.select(conditions, choices, default='Другое')
-
-    combined_success = df_analysis.groupby('комбинированная_группа')['успех'].agg(['mean', 'count'])
-    combined_success = combined_success.sort_values('mean', ascending=False)
-
-    # Заменяем NaN на 0
-    combined_success['mean'] = combined_success['mean'].fillna(0) * 100
-
     plt.figure(figsize=(14, 8))
 
     colors = ['lightcoral', 'lightcoral', 'orange', 'orange', 'lightgreen', 'lightgreen']
@@ -231,10 +247,10 @@ def create_combined_factors_chart(df_analysis, display_name, success_description
     plt.xticks(range(len(combined_success)), combined_success.index, rotation=45, ha='right')
     plt.grid(True, alpha=0.3, axis='y')
 
-    # Добавление значений и количества наблюдений
-    for i, (bar, (group, row)) in enumerate(zip(bars, combined_success.iterrows())):
+    # Добавление значений на столбцы
+    for bar, rate in zip(bars, combined_success['mean']):
         plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.5,
-                 f'{row["mean"]:.1f}%', ha='center', va='bottom', fontsize=10, fontweight='bold')
+                 f'{rate:.1f}%', ha='center', va='bottom', fontsize=10, fontweight='bold')
 
     # Добавляем поясняющую подпись (только про 100%, без упоминания цветов)
     plt.figtext(0.02, 0.02, success_description,
@@ -242,44 +258,54 @@ def create_combined_factors_chart(df_analysis, display_name, success_description
                 bbox={'facecolor': 'lightgray', 'alpha': 0.7, 'pad': 5})
 
     plt.tight_layout(rect=[0, 0.05, 1, 0.95])
-    plt.savefig(f'results/Результаты 2 главы анализа/2.2.4. Успешность поиска в зависимости от комбинированных факторов для {display_name}.png', dpi=300, bbox_inches='tight')
+    save_figure(results_path(f'Результаты 2 главы анализа/2.2.4. Успешность поиска в зависимости от комбинированных факторов для {display_name}.png'))
     plt.close()
 
-    return combined_success
-
-
-def analyze_single_dataset_publication(file_path, dataset_type):
-    """Анализ одного датасета для публикационных факторов"""
 
-    # Загрузка данных
-    df = load_data(file_path)
+def analyze_single_dataset_publication(dataset_type, filters=None, chunksize=None):
+    """
+    Анализ одного датасета для публикационных факторов по агрегатному кубу
+    (chunksize - размер части при построении куба)
+    """
 
-    if df is None:
+    cube_frame = cube.load(dataset_type, filters, chunksize, view='publication')
+    if cube_frame['n'].sum() == 0:
         return
+    aggregates = aggregate_publication_factors(cube_frame, dataset_type)
 
     # Анализ факторов публикации
-    df_analysis, photo_success, photo_corr, photos_count_corr, desc_length_corr, success_description, display_name = analyze_publication_factors(
-        df, dataset_type)
+    frame, photo_success, photo_corr, photos_count_corr, desc_length_corr, success_description, display_name = analyze_publication_factors(
+        aggregates, dataset_type)
 
     # Создание четырех диаграмм
-    create_photo_success_chart(photo_success, display_name, success_description)
-    photos_success = create_photos_count_chart(df_analysis, display_name, success_description)
-    desc_success = create_description_length_chart(df_analysis, display_name, success_description)
-    combined_success = create_combined_factors_chart(df_analysis, display_name, success_description)
-
-
-def step_2_2():
-    """Основная функция для анализа обоих датасетов"""
+    for create_chart, success in ((create_photo_success_chart, photo_success),
+                                  (create_photos_count_chart, photos_count_success(frame)),
+                                  (create_description_length_chart, description_length_success(frame)),
+                                  (create_combined_factors_chart, combined_factors_success(frame))):
+        submit_chart(create_chart, success, display_name, success_description, label=dataset_type)
+
+    # Взаимодействия факторов (регион, тип животного, фото, описание, контакты, комментарии)
+    interactions.scan_dataset(dataset_type, display_name, filters, chunksize)
+
+
+def step_2_2(filters=None, chunksize=None):
+    """
+    Основная функция для анализа обоих датасетов.
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
+    chunksize - размер части для потоковой обработки (None - весь файл в памяти)
+    """
     
     warnings.filterwarnings('ignore')
 
 
     # Создаем папку для результатов
-    os.makedirs('results/Результаты 2 главы анализа', exist_ok=True)
-
-    # Анализ датасета найденных животных (поиск хозяина)
-    analyze_single_dataset_publication('data/dataset_final_Pet911_found.csv', 'found')
+    os.makedirs(results_path('Результаты 2 главы анализа'), exist_ok=True)
 
-    # Анализ датасета потерянных животных (поиск питомца)
-    analyze_single_dataset_publication('data/Dataset_final_Pet911_lost.csv', 'lost')
+    with chart_batch('step_2_2'):
+        # Анализ датасета найденных животных (поиск хозяина)
+        if selects(filters, 'found'):
+            analyze_single_dataset_publication('found', filters, chunksize)
 
+        # Анализ датасета потерянных животных (поиск питомца)
+        if selects(filters, 'lost'):
+            analyze_single_dataset_publication('lost', filters, chunksize)
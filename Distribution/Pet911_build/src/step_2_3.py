@@ -0,0 +1,11 @@
+from .significance import analyze_significance
+
+
+def step_2_3(filters=None, chunksize=None):
+    """
+    Значимость факторов успеха: бутстреп-интервалы и перестановочные тесты
+    для обоих датасетов (см. src/significance.py).
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
+    chunksize - размер части при построении куба и подсчете комментариев
+    """
+    analyze_significance(filters, chunksize)
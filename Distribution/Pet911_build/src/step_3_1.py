@@ -1,196 +1,253 @@
 # -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+
 from .deps import *
+from .config import dataset_path, results_path
+from .partitions import dataset_files, selects
+from . import cube
+from . import factor_stats
+from . import phases
+from . import success_model
+from .rendering import chart_batch, save_figure, submit_chart
+from .phases import phase, timed
+
+# Измерения агрегатного куба (src/cube.py), нужные анализу, и их имена в шаге
+CUBE_COLUMNS = {
+    'статус': 'статус',
+    'тип_животного': 'тип_животного',
+    'есть_фото': 'есть_фото',
+    'количество_фото': 'количество_фото',
+    'наличие_описания': 'наличие_описания',
+    'Длина_описания_в_словах': 'длина_описания',
+    'есть_контакты': 'есть_контакты',
+    'регион': 'регион',
+}
+
+
+# Колонки, приводимые к нижнему регистру
+TEXT_COLUMNS = ['тип_объявления', 'регион', 'статус', 'тип_животного',
+                'пол', 'окрас', 'порода', 'место_события']
+# Бинарные признаки и их значения
+BINARY_COLUMNS = ['наличие_описания', 'есть_фото', 'есть_контакты']
+BINARY_MAPPING = {'true': 1, 'false': 0, 'да': 1, 'нет': 0, '1': 1, '0': 0}
+# Числовые признаки (нечисловые значения и пропуски - 0)
+NUMERIC_COLUMNS = ['количество_фото', 'длина_описания', 'количество_комментариев']
+
+
+def clean_values(values, column):
+    """Очищает значения колонки от кавычек и пробелов и приводит к типу признака"""
+    # Очищаем данные от лишних кавычек и пробелов
+    values = values.str.strip().str.strip('"').str.strip("'")
+    
+    if column in TEXT_COLUMNS:
+        return values.str.lower()
+    if column in BINARY_COLUMNS:
+        return values.str.lower().map(BINARY_MAPPING).fillna(0).astype(int)
+    if column in NUMERIC_COLUMNS:
+        return pd.to_numeric(values, errors='coerce').fillna(0)
+    return values
+
+
+def typed_column(column_values, column):
+    """
+    Колонка после clean_values: очищаются только разные значения колонки
+    (их намного меньше, чем строк), результат раскладывается по строкам
+    """
+    codes, uniques = pd.factorize(column_values.astype(str))
+    cleaned = clean_values(pd.Series(uniques, dtype=object), column)
+    return pd.Series(cleaned.to_numpy()[codes], index=column_values.index, dtype=cleaned.dtype)
+
+
+@timed('preprocess')
+def preprocess_frame(df, file_type):
+    """Предобработка строк датасета (всего файла или его части)"""
+    df = pd.DataFrame({col: typed_column(df[col], col) for col in df.columns}, index=df.index)
+    
+    # Создаем целевую переменную is_success
+    if 'статус' in df.columns:
+        if file_type == 'lost':
+            df['is_success'] = df['статус'].str.contains('найден', na=False)
+        else:
+            df['is_success'] = df['статус'].str.contains('хозяин найден', na=False)
+        
+        df['is_success'] = df['is_success'].astype(int)
+    
+    return df
+
+
+def preprocess_cube(cube_frame, file_type):
+    """
+    Предобработка ячеек агрегатного куба: значения измерений приводятся к
+    строкам, как при чтении CSV (пропуск - пустая строка), и проходят ту же
+    предобработку, что строки датасета; n - число объявлений в ячейке.
+    """
+    cells = cube_frame[list(CUBE_COLUMNS)].rename(columns=CUBE_COLUMNS)
+    cells = cells.astype(object).where(cells.notna(), '')
+    processed = preprocess_frame(cells, file_type)
+    processed['n'] = cube_frame['n'].to_numpy()
+    return processed
+
+
+def plot_animal_type_success(animal_success, file_type, results_dir):
+    """График 3 и 7: Доля успеха по типам животных (по посчитанным долям)"""
+    fig, ax = plt.subplots(figsize=(10, 7))
+    
+    bars = ax.bar(animal_success.index, animal_success['mean'] * 100, 
+                  color='lightgreen', alpha=0.7)
+    
+    title = f'Доля успеха "потерян" по типам животных' if file_type == 'lost' else f'Доля успеха "найден" по типам животных'
+    
+    # Автоматическое позиционирование заголовка
+    max_value = max(animal_success['mean'] * 100)
+    title_y = 1.05 if max_value > 70 else 1.02
+    ax.set_title(title, fontsize=14, fontweight='bold', y=title_y)
+    
+    ax.set_ylabel('Доля успеха, %', fontsize=12)
+    ax.set_xlabel('Тип животного', fontsize=12)
+    plt.xticks(rotation=45, ha='right')
+    ax.grid(axis='y', alpha=0.3)
+    
+    # Увеличиваем верхний лимит оси Y чтобы было место для текста
+    ax.set_ylim(0, max(animal_success['mean'] * 100) * 1.15)
+    
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + 1,
+                f'{height:.1f}%', ha='center', va='bottom', fontweight='bold',
+                fontsize=9)
+    
+    plt.tight_layout()
+    plt.subplots_adjust(top=0.9)
+    
+    filename = f"3.1.3 Доля успешных поисков по типу животного для '{file_type}'.png"
+    # ИЗМЕНИТЬ путь сохранения
+    save_figure(os.path.join(results_dir, filename))
+    plt.close()
+
 
 class PetSearchAnalyzer:
-    def __init__(self, file_path, file_type, results_dir):
+    def __init__(self, file_path, file_type, results_dir, filters=None, chunksize=None):
         self.file_type = file_type
         self.file_path = file_path
         self.results_dir = results_dir  # Добавляем папку для результатов
+        self.filters = filters  # Фильтры партиций (см. src/partitions.py)
+        self.chunksize = chunksize  # Размер части при построении агрегатного куба (см. src/cube.py)
         self.stats_results = {}
-        print(f"📁 Загрузка данных из файла: {os.path.basename(file_path)}")
-        
-        self.df = self.load_proper_csv(file_path)
-        
-        if not self.df.empty:
-            self.preprocess_data()
-        else:
-            print("❌ Не удалось загрузить данные")
+        self.aggregates = None  # Таблицы факторов (см. src/factor_stats.py)
+        self.df_processed = None  # Предобработанные ячейки куба (для обучения модели успеха)
+        self.model = None  # Модель успеха для step_3_2 (см. src/success_model.py)
+        self.cube_size = None  # (объявлений, ячеек куба)
+        self.error = None  # Сообщение об ошибке загрузки
+    
+    def prepare(self):
+        """
+        Загрузка куба, предобработка, таблицы факторов и обучение модели успеха
+        без вывода в консоль и диаграмм: анализаторы lost и found готовятся
+        одновременно (см. prepare_analyzers), а результаты выводятся по очереди
+        """
+        cube_frame = self.load_cube()
+        
+        if cube_frame is not None and cube_frame['n'].sum() > 0:
+            self.preprocess_data(cube_frame)
+            with phase('compute'):
+                self.model = success_model.train(self.df_processed, self.file_type)
+    
+    def is_loaded(self):
+        """Данные загружены и агрегаты для анализа посчитаны"""
+        return self.aggregates is not None
     
-    def load_proper_csv(self, file_path):
-        """Загружает CSV файл с правильным парсингом кавычек, пропускает первую строку"""
+    def load_cube(self):
+        """Агрегатный куб исходного файла или отобранных фильтрами партиций (см. src/cube.py)"""
         try:
-            encodings = ['utf-8', 'cp1251', 'latin1']
+            if not dataset_files(self.file_path, self.file_type, self.filters):
+                self.error = f"❌ Нет партиций, подходящих под фильтры {self.filters}"
+                return None
             
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        reader = csv.reader(f)
-                        rows = list(reader)
-                    
-                    if rows:
-                        print(f"✅ Успешно загружено с кодировкой {encoding}")
-                        break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                print("❌ Не удалось загрузить файл с доступными кодировками")
-                return pd.DataFrame()
-            
-            if len(rows) > 1:
-                data_rows = rows[1:]
-                print(f"📊 Строк данных: {len(data_rows)}")
-            else:
-                print("❌ В файле нет данных кроме заголовка")
-                return pd.DataFrame()
-            
-            column_names = [
-                'url', 'id', 'тип_объявления', 'регион', 'статус', 'тип_животного', 
-                'окрас', 'порода', 'место_события', 'дата_публикации', 'пол', 
-                'возраст', 'описание', 'длина_описания', 'наличие_описания', 
-                'есть_фото', 'количество_фото', 'количество_комментариев', 
-                'дата_события', 'есть_контакты'
-            ]
-            
-            df = pd.DataFrame(data_rows, columns=column_names[:len(data_rows[0])])
-            print(f"✅ Создано {len(df)} строк с {len(df.columns)} колонками")
-            
-            return df
+            cube_frame = cube.load(self.file_type, self.filters, self.chunksize, self.file_path)
+            self.cube_size = (int(cube_frame['n'].sum()), len(cube_frame))
+            return cube_frame
             
         except Exception as e:
-            print(f"❌ Ошибка загрузки файла: {e}")
-            return pd.DataFrame()
+            self.error = f"❌ Ошибка загрузки файла: {e}"
+            return None
         
-    def preprocess_data(self):
+    def preprocess_data(self, cube_frame):
         """Предобработка данных"""
-        print("🔧 Предобработка данных...")
-        
-        df = self.df.copy()
-        
-        # Очищаем данные от лишних кавычек и пробелов
-        for col in df.columns:
-            df[col] = df[col].astype(str).str.strip().str.strip('"').str.strip("'")
-        
-        # Приводим текстовые колонки к нижнему регистру
-        text_columns = ['тип_объявления', 'регион', 'статус', 'тип_животного', 
-                       'пол', 'окрас', 'порода', 'место_события']
-        
-        for col in text_columns:
-            if col in df.columns:
-                df[col] = df[col].str.lower()
-        
-        # Создаем целевую переменную is_success
-        if 'статус' in df.columns:
-            if self.file_type == 'lost':
-                df['is_success'] = df['статус'].str.contains('найден', na=False)
-            else:
-                df['is_success'] = df['статус'].str.contains('хозяин найден', na=False)
-            
-            df['is_success'] = df['is_success'].astype(int)
-        
-        # Обработка бинарных признаков
-        binary_mapping = {'true': 1, 'false': 0, 'да': 1, 'нет': 0, '1': 1, '0': 0}
-        binary_columns = ['наличие_описания', 'есть_фото', 'есть_контакты']
-        
-        for col in binary_columns:
-            if col in df.columns:
-                df[col] = df[col].str.lower().map(binary_mapping).fillna(0).astype(int)
-        
-        # Заполнение пропусков в числовых колонках
-        numeric_columns = ['количество_фото', 'длина_описания', 'количество_комментариев']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        self.df_processed = df
-        print(f"✅ Обработано {len(df)} объявлений")
-        print(f"✅ Успешных случаев: {df['is_success'].sum()} ({df['is_success'].mean()*100:.1f}%)")
+        self.df_processed = preprocess_cube(cube_frame, self.file_type)
+        with phase('compute'):
+            self.aggregates = factor_stats.aggregate(self.df_processed)
+        self.record_base_statistics()
+    
+    def record_base_statistics(self):
+        """Сохраняет базовую статистику по агрегатам"""
+        total = self.aggregates['total']
+        success_rate = total['successes'] / total['count'] if total['count'] else np.nan
         
         # Сохраняем базовую статистику
-        self.stats_results['base_success_rate'] = df['is_success'].mean()
-        self.stats_results['total_ads'] = len(df)
-        self.stats_results['successful_ads'] = df['is_success'].sum()
+        self.stats_results['base_success_rate'] = success_rate
+        self.stats_results['total_ads'] = total['count']
+        self.stats_results['successful_ads'] = total['successes']
+    
+    def report_loading(self):
+        """Выводит результат загрузки и предобработки (см. prepare)"""
+        print(f"📁 Загрузка данных из файла: {os.path.basename(self.file_path)}")
+        if self.error:
+            print(self.error)
+        elif self.cube_size:
+            print(f"📊 Строк данных: {self.cube_size[0]} (ячеек куба: {self.cube_size[1]})")
+        
+        if not self.is_loaded():
+            print("❌ Не удалось загрузить данные")
+            return
+        
+        print("🔧 Предобработка данных...")
+        success_rate = self.stats_results['base_success_rate']
+        print(f"✅ Обработано {self.stats_results['total_ads']} объявлений")
+        print(f"✅ Успешных случаев: {self.stats_results['successful_ads']} ({success_rate*100:.1f}%)")
+    
+    def factor_table(self, factor):
+        """Таблица фактора: count, successes, rate, ci_low, ci_high (None - фактора нет в данных)"""
+        return self.aggregates['factors'].get(factor)
     
     def plot_success_by_animal_type(self):
         """График 3 и 7: Доля успеха по типам животных"""
-        if 'тип_животного' not in self.df_processed.columns:
+        table = self.factor_table('animal_type')
+        if table is None:
             return
         
-        df = self.df_processed
-        animal_success = df.groupby('тип_животного')['is_success'].agg(['count', 'mean']).round(3)
+        animal_success = table.rename(columns={'rate': 'mean'})[['count', 'mean']].round(3)
         animal_success = animal_success[animal_success['count'] >= 3]
         animal_success = animal_success.sort_values('mean', ascending=False)
         
-        fig, ax = plt.subplots(figsize=(10, 7))
-        
-        bars = ax.bar(animal_success.index, animal_success['mean'] * 100, 
-                      color='lightgreen', alpha=0.7)
-        
-        title = f'Доля успеха "потерян" по типам животных' if self.file_type == 'lost' else f'Доля успеха "найден" по типам животных'
-        
-        # Автоматическое позиционирование заголовка
-        max_value = max(animal_success['mean'] * 100)
-        title_y = 1.05 if max_value > 70 else 1.02
-        ax.set_title(title, fontsize=14, fontweight='bold', y=title_y)
-        
-        ax.set_ylabel('Доля успеха, %', fontsize=12)
-        ax.set_xlabel('Тип животного', fontsize=12)
-        plt.xticks(rotation=45, ha='right')
-        ax.grid(axis='y', alpha=0.3)
-        
-        # Увеличиваем верхний лимит оси Y чтобы было место для текста
-        ax.set_ylim(0, max(animal_success['mean'] * 100) * 1.15)
-        
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 1,
-                    f'{height:.1f}%', ha='center', va='bottom', fontweight='bold',
-                    fontsize=9)
-        
-        plt.tight_layout()
-        plt.subplots_adjust(top=0.9)
-        
-        filename = f"3.1.3 Доля успешных поисков по типу животного для '{self.file_type}'.png"
-        # ИЗМЕНИТЬ путь сохранения
-        plt.savefig(os.path.join(self.results_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
+        submit_chart(plot_animal_type_success, animal_success, self.file_type, self.results_dir, label=self.file_type)
         
         return animal_success
     
     
     def calculate_animal_statistics(self):
         """Рассчитывает статистику по типам животных"""
-        if 'тип_животного' not in self.df_processed.columns:
+        table = self.factor_table('animal_type')
+        if table is None:
             return
         
-        df = self.df_processed
-        animal_stats = df.groupby('тип_животного').agg({
-            'is_success': ['count', 'sum', 'mean']
-        }).round(4)
-        animal_stats.columns = ['count', 'success_count', 'success_rate']
-        
-        self.stats_results['animal_success_rates'] = animal_stats['success_rate'].to_dict()
+        self.stats_results['animal_success_rates'] = table['rate'].round(4).to_dict()
         
-        return animal_stats
+        return table
     
     def calculate_photo_statistics(self):
         """Рассчитывает статистику по фото"""
         photo_stats = {}
         
-        if 'есть_фото' in self.df_processed.columns:
-            photo_presence = self.df_processed.groupby('есть_фото')['is_success'].mean()
+        photo_presence = self.factor_table('has_photo')
+        if photo_presence is not None:
             photo_stats['has_photo_impact'] = {
-                0: float(photo_presence.get(0, 0)),
-                1: float(photo_presence.get(1, 0))
+                0: float(photo_presence['rate'].get(0, 0)),
+                1: float(photo_presence['rate'].get(1, 0))
             }
         
-        if 'количество_фото' in self.df_processed.columns:
-            df = self.df_processed.copy()
-            df['фото_группа'] = pd.cut(df['количество_фото'], 
-                                      bins=[-1, 0, 1, 2, 3, 5, 100],
-                                      labels=['0', '1', '2', '3', '4-5', '6+'])
-            
-            photo_count_stats = df.groupby('фото_группа')['is_success'].mean()
-            photo_stats['photo_count_impact'] = photo_count_stats.to_dict()
+        photo_count_stats = self.factor_table('photo_count')
+        if photo_count_stats is not None:
+            photo_stats['photo_count_impact'] = photo_count_stats['rate'].to_dict()
         
         self.stats_results['photo_statistics'] = photo_stats
         return photo_stats
@@ -199,38 +256,53 @@ class PetSearchAnalyzer:
         """Рассчитывает статистику по описанию"""
         desc_stats = {}
         
-        if 'наличие_описания' in self.df_processed.columns:
-            desc_presence = self.df_processed.groupby('наличие_описания')['is_success'].mean()
+        desc_presence = self.factor_table('has_description')
+        if desc_presence is not None:
             desc_stats['has_description_impact'] = {
-                0: float(desc_presence.get(0, 0)),
-                1: float(desc_presence.get(1, 0))
+                0: float(desc_presence['rate'].get(0, 0)),
+                1: float(desc_presence['rate'].get(1, 0))
             }
         
-        if 'длина_описания' in self.df_processed.columns:
-            df = self.df_processed.copy()
-            df['описание_группа'] = pd.cut(df['длина_описания'], 
-                                          bins=[-1, 0, 10, 20, 30, 50, 100, 1000],
-                                          labels=['0', '1-10', '11-20', '21-30', '31-50', '51-100', '100+'])
-            
-            desc_length_stats = df.groupby('описание_группа')['is_success'].mean()
-            desc_stats['description_length_impact'] = desc_length_stats.to_dict()
+        desc_length_stats = self.factor_table('description_length')
+        if desc_length_stats is not None:
+            desc_stats['description_length_impact'] = desc_length_stats['rate'].to_dict()
         
         self.stats_results['description_statistics'] = desc_stats
         return desc_stats
     
     def calculate_contacts_statistics(self):
         """Рассчитывает статистику по контактам"""
-        if 'есть_контакты' not in self.df_processed.columns:
+        contacts_stats = self.factor_table('has_contacts')
+        if contacts_stats is None:
             return
         
-        contacts_stats = self.df_processed.groupby('есть_контакты')['is_success'].mean()
         self.stats_results['contacts_impact'] = {
-            0: float(contacts_stats.get(0, 0)),
-            1: float(contacts_stats.get(1, 0))
+            0: float(contacts_stats['rate'].get(0, 0)),
+            1: float(contacts_stats['rate'].get(1, 0))
         }
         
         return contacts_stats
     
+    def calculate_factor_tables(self):
+        """Число объявлений, успехов, доля успеха и 95% интервал Уилсона по значениям всех факторов"""
+        self.stats_results['factor_tables'] = factor_stats.to_json(self.aggregates['factors'])
+        return self.stats_results['factor_tables']
+    
+    @timed('save')
+    def save_success_model(self, output_dir=None):
+        """Сохраняет модель успеха для прогноза step_3_2 (обучена в prepare) в JSON"""
+        if output_dir is None:
+            output_dir = os.path.join(self.results_dir, '3.1 Stats for 3.2 Prediction')
+        os.makedirs(output_dir, exist_ok=True)
+        
+        filepath = success_model.model_path(output_dir, self.file_type)
+        success_model.save(self.model, filepath)
+        
+        print(f"🤖 Модель успеха: {success_model.describe_metrics(self.model)}")
+        print(f"💾 Модель сохранена в: {filepath}")
+        return self.model
+    
+    @timed('save')
     def save_statistics(self, output_dir=None):
         """Сохраняет статистику в файлы"""
         if output_dir is None:
@@ -243,20 +315,12 @@ class PetSearchAnalyzer:
         filename = f"pet911_{self.file_type}_statistics.json"
         filepath = os.path.join(output_dir, filename)
         
-        def convert_to_serializable(obj):
-            if isinstance(obj, (np.integer, np.floating)):
-                return float(obj)
-            elif isinstance(obj, dict):
-                return {k: convert_to_serializable(v) for k, v in obj.items()}
-            elif isinstance(obj, (list, tuple)):
-                return [convert_to_serializable(x) for x in obj]
-            else:
-                return obj
-        
-        serializable_stats = convert_to_serializable(self.stats_results)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(serializable_stats, f, ensure_ascii=False, indent=2)
+        # Статистика собрана из значений Python (см. factor_stats.to_json) и пишется без преобразований;
+        # атомарная запись: step_3_2 не прочитает наполовину записанный файл
+        tmp_path = filepath + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats_results, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, filepath)
         
         print(f"💾 Статистика сохранена в: {filepath}")
         
@@ -264,6 +328,7 @@ class PetSearchAnalyzer:
         
         return filepath
     
+    @timed('save')
     def save_detailed_stats_csv(self, output_dir):
         """Сохраняет детальную статистику в CSV"""
         filename = f"pet911_{self.file_type}_detailed_stats.csv"
@@ -313,9 +378,9 @@ class PetSearchAnalyzer:
         print(f"🚀 ПОЛНЫЙ АНАЛИЗ - {self.file_type.upper()}")
         print(f"{'='*60}")
         
-        total_ads = len(self.df_processed)
-        success_ads = self.df_processed['is_success'].sum()
-        success_rate = self.df_processed['is_success'].mean() * 100
+        total_ads = self.stats_results['total_ads']
+        success_ads = self.stats_results['successful_ads']
+        success_rate = self.stats_results['base_success_rate'] * 100
         
         print(f"📈 Общая статистика:")
         print(f"   Всего объявлений: {total_ads}")
@@ -335,10 +400,14 @@ class PetSearchAnalyzer:
         self.calculate_photo_statistics()
         self.calculate_description_statistics()
         self.calculate_contacts_statistics()
+        self.calculate_factor_tables()
         
         # Сохранение статистики
         saved_file = self.save_statistics()
         
+        # Модель успеха (статистика остается запасным вариантом прогноза)
+        self.save_success_model()
+        
         print(f"\n✅ Анализ завершен! Статистика сохранена для использования в прогнозной модели")
         
         return self.stats_results
@@ -346,12 +415,25 @@ class PetSearchAnalyzer:
 def plot_comparison_charts(lost_analyzer, found_analyzer):
     """Графики 1 и 2: Сравнительные графики для обоих файлов"""
     
+    lost_success = lost_analyzer.stats_results['base_success_rate'] * 100
+    found_success = found_analyzer.stats_results['base_success_rate'] * 100
+    counts = [lost_analyzer.stats_results['total_ads'], found_analyzer.stats_results['total_ads']]
+    
+    # Используем папку результатов из анализатора
+    submit_chart(plot_ads_comparison, counts, lost_success, found_success, lost_analyzer.results_dir)
+    
+    print(f"\n📊 СВОДНАЯ СТАТИСТИКА:")
+    print(f"   Потерянные животные: {lost_success:.1f}% успеха")
+    print(f"   Найденные животные: {found_success:.1f}% успеха")
+
+def plot_ads_comparison(counts, lost_success, found_success, results_dir):
+    """Отрисовка графиков 1 и 2 по количеству объявлений и доле успеха каждого типа"""
+    
     fig = plt.figure(figsize=(12, 5))
     
     # График 1: Диаграмма распределения типов объявлений
     plt.subplot(1, 2, 1)
     types = ['Потерян', 'Найден']
-    counts = [len(lost_analyzer.df_processed), len(found_analyzer.df_processed)]
     colors = ['lightblue', 'lightcoral']
     
     plt.pie(counts, labels=types, autopct='%1.1f%%', colors=colors)
@@ -359,9 +441,6 @@ def plot_comparison_charts(lost_analyzer, found_analyzer):
     
     # График 2: Доля успеха по типам объявлений
     plt.subplot(1, 2, 2)
-    lost_success = lost_analyzer.df_processed['is_success'].mean() * 100
-    found_success = found_analyzer.df_processed['is_success'].mean() * 100
-    
     bars = plt.bar(['Потерян', 'Найден'], [lost_success, found_success], 
                   color=['lightblue', 'lightcoral'])
     plt.title('Доля успеха по типам объявлений', fontsize=14, fontweight='bold', y=1.05)
@@ -380,17 +459,30 @@ def plot_comparison_charts(lost_analyzer, found_analyzer):
     plt.subplots_adjust(top=0.85)
     
     # Сохраняем вместо показа - ИЗМЕНИТЬ путь
-    results_dir = lost_analyzer.results_dir  # Используем папку результатов из анализатора
-    plt.savefig(os.path.join(results_dir, "3.1.1.+3.1.2. Распределение и успешность поиска по типам объявлений.png"), 
-                dpi=300, bbox_inches='tight')
+    save_figure(os.path.join(results_dir, "3.1.1.+3.1.2. Распределение и успешность поиска по типам объявлений.png"))
     plt.close()
+
+def prepare_analyzers(analyzers):
+    """
+    Готовит анализаторы (PetSearchAnalyzer.prepare) одновременно в потоках:
+    построение куба по CSV и вычисления NumPy частично отпускают GIL. При
+    замере этапов (src/phases.py) - по очереди: этапы замеряются в одном потоке.
+    """
+    analyzers = list(analyzers)
+    if phases.enabled() or len(analyzers) < 2:
+        for analyzer in analyzers:
+            analyzer.prepare()
+        return
     
-    print(f"\n📊 СВОДНАЯ СТАТИСТИКА:")
-    print(f"   Потерянные животные: {lost_success:.1f}% успеха")
-    print(f"   Найденные животные: {found_success:.1f}% успеха")
+    with ThreadPoolExecutor(max_workers=len(analyzers)) as pool:
+        list(pool.map(PetSearchAnalyzer.prepare, analyzers))
 
-def step_3_1():
-    """Основная функция программы анализа"""
+def step_3_1(filters=None, chunksize=None):
+    """
+    Основная функция программы анализа.
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
+    chunksize - размер части для потоковой обработки (None - весь файл в памяти)
+    """
 
     warnings.filterwarnings('ignore')
 
@@ -402,45 +494,42 @@ def step_3_1():
     print("=" * 60)
     
     # СОЗДАЕМ ПАПКУ ДЛЯ РЕЗУЛЬТАТОВ
-    results_dir = "results/Результаты 3 главы анализа"
+    results_dir = results_path("Результаты 3 главы анализа")
     os.makedirs(results_dir, exist_ok=True)
     print(f"📁 Создана папка для результатов: {results_dir}")
     
     # Файлы для анализа
-    lost_file = 'data/Dataset_final_Pet911_lost.csv'
-    found_file = 'data/dataset_final_Pet911_found.csv'
+    lost_file = dataset_path('lost')
+    found_file = dataset_path('found')
     
-    all_statistics = {}
+    # Анализаторы готовятся одновременно, результаты выводятся по очереди
     analyzers = {}
+    titles = {'lost': 'ПОТЕРЯННЫХ', 'found': 'НАЙДЕННЫХ'}
+    for ad_type, file_path in (('lost', lost_file), ('found', found_file)):
+        if not selects(filters, ad_type):
+            print(f"⏭ {'Потерянные' if ad_type == 'lost' else 'Найденные'} животные исключены фильтром")
+        elif os.path.exists(file_path):
+            # ПЕРЕДАЕМ ПАПКУ РЕЗУЛЬТАТОВ В КОНСТРУКТОР
+            analyzers[ad_type] = PetSearchAnalyzer(file_path, ad_type, results_dir, filters, chunksize)
+        else:
+            print(f"❌ Файл {file_path} не найден")
+    prepare_analyzers(analyzers.values())
+    
+    with chart_batch('step_3_1'):
+        all_statistics = {}
+        
+        for ad_type, analyzer in list(analyzers.items()):
+            print(f"\n{'🔍'*20} АНАЛИЗ {titles[ad_type]} ЖИВОТНЫХ {'🔍'*20}")
+            analyzer.report_loading()
+            if analyzer.is_loaded():
+                all_statistics[ad_type] = analyzer.comprehensive_analysis()
+            else:
+                del analyzers[ad_type]
     
-    # Анализ потерянных животных
-    if os.path.exists(lost_file):
-        print(f"\n{'🔍'*20} АНАЛИЗ ПОТЕРЯННЫХ ЖИВОТНЫХ {'🔍'*20}")
-        # ПЕРЕДАЕМ ПАПКУ РЕЗУЛЬТАТОВ В КОНСТРУКТОР
-        lost_analyzer = PetSearchAnalyzer(lost_file, 'lost', results_dir)
-        if not lost_analyzer.df.empty:
-            stats_lost = lost_analyzer.comprehensive_analysis()
-            all_statistics['lost'] = stats_lost
-            analyzers['lost'] = lost_analyzer
-    else:
-        print(f"❌ Файл {lost_file} не найден")
-    
-    # Анализ найденных животных
-    if os.path.exists(found_file):
-        print(f"\n{'🔍'*20} АНАЛИЗ НАЙДЕННЫХ ЖИВОТНЫХ {'🔍'*20}")
-        # ПЕРЕДАЕМ ПАПКУ РЕЗУЛЬТАТОВ В КОНСТРУКТОР
-        found_analyzer = PetSearchAnalyzer(found_file, 'found', results_dir)
-        if not found_analyzer.df.empty:
-            stats_found = found_analyzer.comprehensive_analysis()
-            all_statistics['found'] = stats_found
-            analyzers['found'] = found_analyzer
-    else:
-        print(f"❌ Файл {found_file} не найден")
-    
-    # Сравнительные графики
-    if 'lost' in analyzers and 'found' in analyzers:
-        print(f"\n{'📊'*20} СРАВНИТЕЛЬНЫЕ ГРАФИКИ {'📊'*20}")
-        plot_comparison_charts(analyzers['lost'], analyzers['found'])
+        # Сравнительные графики
+        if 'lost' in analyzers and 'found' in analyzers:
+            print(f"\n{'📊'*20} СРАВНИТЕЛЬНЫЕ ГРАФИКИ {'📊'*20}")
+            plot_comparison_charts(analyzers['lost'], analyzers['found'])
     
     print(f"\n✅ Анализ завершен! Все результаты сохранены в папке '{results_dir}/'")
     print("💡 Теперь можно запустить программу прогнозирования!")
@@ -1,45 +1,254 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import threading
+import time
+
 from .deps import *
+from .config import results_path
+from .rendering import save_figure
+from .phases import phase, timed
+from . import success_model
+from .build_cache import file_digest
+from .partitions import file_state
+from .prediction_table import AD_TYPES, STATISTICS_FILES, gather, load_table
 
-class PetSearchPredictor:
-    def __init__(self):
+# Значения полей объявления по умолчанию (как в подсказках диалога)
+AD_DEFAULTS = {
+    'animal_type': 'собака',
+    'has_photos': 'да',
+    'photo_count': 3,
+    'has_description': 'да',
+    'desc_length': 25,
+    'has_contacts': 'да',
+    'region': 'не указан',
+}
+
+# Ответы "да" в файле объявлений
+YES_VALUES = {'да', 'д', 'yes', 'y', 'true', '1'}
+
+BATCH_RESULTS_FILE = '3.2. Прогнозы по файлу объявлений.csv'
+
+# Период проверки файлов статистики при фоновом наблюдении, с
+WATCH_INTERVAL = 1.0
+# Сколько раз перечитывать статистику, если файлы меняются во время чтения
+READ_ATTEMPTS = 3
+
+
+def statistics_files(stats_dir, use_model):
+    """Файлы step_3_1, по которым строится прогноз"""
+    files = [os.path.join(stats_dir, STATISTICS_FILES[ad_type]) for ad_type in AD_TYPES]
+    if use_model:
+        files += [success_model.model_path(stats_dir, ad_type) for ad_type in AD_TYPES]
+    return files
+
+
+def statistics_version(files):
+    """Версия статистики - хэш содержимого ее файлов (отсутствующие файлы тоже учитываются)"""
+    sha = hashlib.sha256()
+    for path in files:
+        sha.update(f"{os.path.basename(path)}:{file_digest(path)}\n".encode('utf-8'))
+    return sha.hexdigest()[:12]
+
+
+class StatisticsSnapshot:
+    """
+    Статистика, модели и таблица прогнозов одной версии файлов step_3_1.
+    После загрузки снимок не меняется: прогноз берет ссылку на снимок один
+    раз и считается по нему целиком, а перезагрузка подменяет ссылку новым
+    снимком (см. PetSearchPredictor.reload_statistics).
+    """
+    def __init__(self, stats_dir, version):
+        self.stats_dir = stats_dir
+        self.version = version
         self.stats_lost = None
         self.stats_found = None
-        self.results_dir = "results/Результаты 3 главы анализа"  # Папка для сохранения графиков
+        self.models = {}  # Обученные модели успеха по типам объявлений (см. src/success_model.py)
+        self.table = None  # Прогнозы для всех сочетаний признаков (см. src/prediction_table.py)
+        self.loaded_at = time.time()
+
+
+class PetSearchPredictor:
+    def __init__(self, use_model=True):
+        self.use_model = use_model  # False - только поправки по статистике, без модели step_3_1
+        self.results_dir = results_path("Результаты 3 главы анализа")  # Папка для сохранения графиков
         os.makedirs(self.results_dir, exist_ok=True)  # Создаем папку при инициализации
+        self.stats_dir = results_path('Результаты 3 главы анализа/3.1 Stats for 3.2 Prediction')
+        self.reloads = 0
+        self.reload_lock = threading.Lock()
+        self.watcher = None
+        self.stop_event = threading.Event()
         self.load_statistics()
     
+    # Поля текущего снимка статистики
+    @property
+    def stats_lost(self):
+        return self.snapshot.stats_lost
+    
+    @property
+    def stats_found(self):
+        return self.snapshot.stats_found
+    
+    @property
+    def models(self):
+        return self.snapshot.models
+    
+    @property
+    def table(self):
+        return self.snapshot.table
+    
+    @property
+    def version(self):
+        return self.snapshot.version
+    
+    @timed('load')
     def load_statistics(self):
         """Загружает статистику из сохраненных файлов"""
         print("📊 Загрузка статистики для прогнозирования...")
+        self.snapshot = self.read_snapshot()
+        print(f"🏷 Версия статистики: {self.snapshot.version}")
+    
+    def read_snapshot(self):
+        """
+        Читает статистику и модели одной версии: если файлы изменились во
+        время чтения, они читаются заново
+        """
+        files = statistics_files(self.stats_dir, self.use_model)
+        for _ in range(READ_ATTEMPTS):
+            version = statistics_version(files)
+            snapshot = self.read_files(version)
+            if statistics_version(files) == version:
+                break
+        else:
+            raise RuntimeError("Файлы статистики меняются во время чтения")
         
-        stats_dir = 'results/Результаты 3 главы анализа/3.1 Stats for 3.2 Prediction'
+        # Прогнозы для всех сочетаний признаков (для пакетного прогноза)
+        snapshot.table = load_table(self, snapshot)
+        return snapshot
+    
+    def read_files(self, version):
+        """Снимок статистики и моделей из файлов step_3_1"""
+        snapshot = StatisticsSnapshot(self.stats_dir, version)
         
         # Загружаем статистику для потерянных
-        lost_file = os.path.join(stats_dir, 'pet911_lost_statistics.json')
+        lost_file = os.path.join(self.stats_dir, STATISTICS_FILES['lost'])
         if os.path.exists(lost_file):
             with open(lost_file, 'r', encoding='utf-8') as f:
-                self.stats_lost = json.load(f)
+                snapshot.stats_lost = json.load(f)
             print(f"✅ Статистика для потерянных загружена")
         else:
             print(f"❌ Файл статистики для потерянных не найден: {lost_file}")
         
         # Загружаем статистику для найденных
-        found_file = os.path.join(stats_dir, 'pet911_found_statistics.json')
+        found_file = os.path.join(self.stats_dir, STATISTICS_FILES['found'])
         if os.path.exists(found_file):
             with open(found_file, 'r', encoding='utf-8') as f:
-                self.stats_found = json.load(f)
+                snapshot.stats_found = json.load(f)
             print(f"✅ Статистика для найденных загружена")
         else:
             print(f"❌ Файл статистики для найденных не найден: {found_file}")
+        
+        # Загружаем модели успеха; без модели прогноз строится по статистике
+        if self.use_model:
+            for ad_type, title in (('lost', 'потерянных'), ('found', 'найденных')):
+                model = success_model.load(success_model.model_path(self.stats_dir, ad_type))
+                if model:
+                    snapshot.models[ad_type] = model
+                    print(f"✅ Модель успеха для {title} загружена: {success_model.describe_metrics(model)}")
+                else:
+                    print(f"⚠️ Модель успеха для {title} не найдена, прогноз по статистике")
+        return snapshot
+    
+    def reload_statistics(self):
+        """
+        Загружает статистику заново, если изменилась ее версия, и подменяет
+        снимок целиком; прогнозы, начатые до подмены, досчитываются по
+        прежнему снимку. Возвращает True, если снимок подменен.
+        """
+        with self.reload_lock:
+            if statistics_version(statistics_files(self.stats_dir, self.use_model)) == self.snapshot.version:
+                return False
+            try:
+                snapshot = self.read_snapshot()
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"❌ Статистика не перезагружена, используется версия {self.snapshot.version}: {e}")
+                return False
+            previous = self.snapshot.version
+            self.snapshot = snapshot
+            self.reloads += 1
+            print(f"🔄 Статистика обновлена: версия {previous} → {snapshot.version}")
+            return True
     
-    def calculate_probability(self, ad_data, ad_type):
+    def watch_statistics(self, interval):
+        """
+        Проверяет размер и mtime файлов статистики каждые interval секунд;
+        изменение засчитывается, когда файлы перестали меняться
+        """
+        files = statistics_files(self.stats_dir, self.use_model)
+        state = [file_state(path) for path in files]
+        while not self.stop_event.wait(interval):
+            current = [file_state(path) for path in files]
+            if current == state:
+                continue
+            if self.stop_event.wait(interval):
+                break
+            if [file_state(path) for path in files] != current:
+                continue
+            state = current
+            # Изменилось только время изменения - версия та же, снимок не перечитывается
+            self.reload_statistics()
+    
+    def start_watching(self, interval=WATCH_INTERVAL):
+        """Запускает фоновое наблюдение за файлами статистики (см. watch_statistics)"""
+        if self.watcher is not None:
+            return
+        self.stop_event.clear()
+        self.watcher = threading.Thread(target=self.watch_statistics, args=(interval,), daemon=True,
+                                        name='statistics-watcher')
+        self.watcher.start()
+    
+    def stop_watching(self):
+        if self.watcher is None:
+            return
+        self.stop_event.set()
+        self.watcher.join()
+        self.watcher = None
+    
+    def predict(self, ad_data, ad_type):
+        """
+        Прогноз для одного объявления по одному снимку статистики: вероятность,
+        базовый уровень, способ (model/statistics), факторы, рекомендации и
+        версия статистики
+        """
+        snapshot = self.snapshot
+        probability, factors_log, base_rate = self.calculate_probability(ad_data, ad_type, snapshot)
+        return {
+            'probability': probability,
+            'base_rate': base_rate,
+            'method': 'model' if ad_type in snapshot.models else 'statistics',
+            'factors': factors_log,
+            'recommendations': self.get_recommendations(ad_data, probability, ad_type, base_rate),
+            'statistics_version': snapshot.version,
+        }
+    
+    def calculate_probability(self, ad_data, ad_type, snapshot=None):
+        """
+        Рассчитывает вероятность успеха моделью step_3_1, а если модели нет -
+        поправками по статистике (calculate_from_statistics); snapshot - снимок
+        статистики (по умолчанию текущий)
+        """
+        snapshot = snapshot or self.snapshot
+        if ad_type in snapshot.models:
+            return success_model.explain(snapshot.models[ad_type], success_model.ad_levels(ad_data))
+        return self.calculate_from_statistics(ad_data, ad_type, snapshot)
+
+    def calculate_from_statistics(self, ad_data, ad_type, snapshot=None):
         """Рассчитывает вероятность успеха на основе реальной статистики"""
-        if ad_type == 'lost' and self.stats_lost:
-            stats = self.stats_lost
+        snapshot = snapshot or self.snapshot
+        if ad_type == 'lost' and snapshot.stats_lost:
+            stats = snapshot.stats_lost
             base_rate = stats['base_success_rate']
-        elif ad_type == 'found' and self.stats_found:
-            stats = self.stats_found
+        elif ad_type == 'found' and snapshot.stats_found:
+            stats = snapshot.stats_found
             base_rate = stats['base_success_rate']
         else:
             # Fallback если статистика не загружена
@@ -167,6 +376,10 @@ class PetSearchPredictor:
         has_contacts = input("\nУказаны контакты? (да/нет) [да]: ").strip().lower()
         ad_data['has_contacts'] = has_contacts if has_contacts else 'да'
         
+        # Регион
+        region = input("\nРегион (как в датасете, например Moskva) [не указан]: ").strip().lower()
+        ad_data['region'] = region if region else 'не указан'
+        
         return ad_data
 
     def predict_for_lost(self):
@@ -182,9 +395,11 @@ class PetSearchPredictor:
         print(f"📊 Базовый уровень успешности: {base_rate*100:.1f}%")
         
         ad_data = self.collect_ad_data('lost')
-        probability, factors_log, base_rate = self.calculate_probability(ad_data, 'lost')
+        prediction = self.predict(ad_data, 'lost')
+        probability = prediction['probability']
         
-        self.display_prediction(probability, factors_log, ad_data, 'lost', base_rate)
+        self.display_prediction(probability, prediction['factors'], ad_data, 'lost', prediction['base_rate'],
+                                prediction['statistics_version'])
         
         return probability, ad_data
 
@@ -201,17 +416,21 @@ class PetSearchPredictor:
         print(f"📊 Базовый уровень успешности: {base_rate*100:.1f}%")
         
         ad_data = self.collect_ad_data('found')
-        probability, factors_log, base_rate = self.calculate_probability(ad_data, 'found')
+        prediction = self.predict(ad_data, 'found')
+        probability = prediction['probability']
         
-        self.display_prediction(probability, factors_log, ad_data, 'found', base_rate)
+        self.display_prediction(probability, prediction['factors'], ad_data, 'found', prediction['base_rate'],
+                                prediction['statistics_version'])
         
         return probability, ad_data
 
-    def display_prediction(self, probability, factors_log, ad_data, ad_type, base_rate):
+    def display_prediction(self, probability, factors_log, ad_data, ad_type, base_rate, version=None):
         """Отображение результатов прогноза"""
         print(f"\n🎯 РЕЗУЛЬТАТ ПРОГНОЗА:")
         print(f"   Базовый уровень: {base_rate*100:.1f}%")
         print(f"   Ваша вероятность: {probability*100:.1f}%")
+        if version:
+            print(f"   Версия статистики: {version}")
         
         difference = probability - base_rate
         if difference > 0.05:
@@ -304,14 +523,143 @@ class PetSearchPredictor:
         timestamp = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
         filename = f"3.2. Прогноз_{ad_type}_{timestamp}.png"
         filepath = os.path.join(self.results_dir, filename)
-        plt.savefig(filepath, dpi=300, bbox_inches='tight')
+        filepath = save_figure(filepath)
         print(f"💾 График сохранен: {filepath}")
         
         # Показываем график
         plt.show()
 
-def step_3_2():
-    """Основная функция программы прогнозирования"""
+    def score_ads(self, ads):
+        """
+        Прогноз для таблицы объявлений (см. normalize_ads) без цикла по строкам:
+        выборка из таблицы прогнозов по сочетаниям признаков (см.
+        src/prediction_table.py) одного снимка статистики. Возвращает таблицу
+        с колонками probability, base_rate, method, statistics_version, factors
+        и recommendations в порядке строк ads.
+        """
+        snapshot = self.snapshot
+        for ad_type, loaded in zip(AD_TYPES, snapshot.table['loaded']):
+            if not loaded and (ads['ad_type'] == ad_type).any():
+                raise RuntimeError(f"Статистика для {ad_type} не загружена: сначала выполните step_3_1")
+        return gather(snapshot.table, ads, snapshot.version)
+
+    def predict_from_file(self, ads_file, output_file=None):
+        """
+        Пакетный прогноз без диалога и диаграмм: объявления читаются из CSV,
+        JSON, JSON Lines, Parquet или Feather (колонки ad_type, animal_type,
+        has_photos, photo_count, has_description, desc_length, has_contacts,
+        region; пропущенные поля заполняются значениями по умолчанию), все
+        строки оцениваются сразу (score_ads), результаты сохраняются в CSV
+        одной записью вместе с версией статистики. Возвращает путь к файлу.
+        """
+        ads = normalize_ads(load_ads(ads_file))
+        print(f"📄 Объявлений для прогноза: {len(ads)} ({ads_file})")
+
+        started = time.perf_counter()
+        with phase('compute'):
+            scores = self.score_ads(ads)
+        elapsed = time.perf_counter() - started
+        speed = f"{len(ads) / elapsed:,.0f}".replace(',', ' ') if elapsed > 0 else '∞'
+        print(f"⚡ Оценено {len(ads)} объявлений за {elapsed:.2f} с ({speed} объявлений/с)")
+
+        results = ads.assign(probability=scores['probability'].round(4), base_rate=scores['base_rate'].round(4),
+                             method=scores['method'], statistics_version=scores['statistics_version'],
+                             factors=scores['factors'], recommendations=scores['recommendations'])
+        filepath = output_file or os.path.join(self.results_dir, BATCH_RESULTS_FILE)
+        with phase('save'):
+            results.to_csv(filepath, index=False, encoding='utf-8-sig')
+        print(f"💾 Прогнозы сохранены: {filepath}")
+        return filepath
+
+
+@timed('load')
+def load_ads(ads_file):
+    """Читает таблицу объявлений из CSV, JSON (список объектов), JSON Lines, Parquet или Feather"""
+    extension = os.path.splitext(ads_file)[1].lower()
+    if extension == '.jsonl':
+        return pd.read_json(ads_file, lines=True, dtype=False)
+    if extension == '.json':
+        return pd.read_json(ads_file, dtype=False)
+    if extension == '.parquet':
+        return pd.read_parquet(ads_file)
+    if extension == '.feather':
+        return pd.read_feather(ads_file)
+    return pd.read_csv(ads_file, dtype=str, keep_default_na=False)
+
+
+def normalize_ad(ad):
+    """Приводит поля объявления из файла к виду, который дает диалог"""
+    ad_data = {}
+    for field, default in AD_DEFAULTS.items():
+        value = ad.get(field)
+        if value is None or (isinstance(value, float) and np.isnan(value)) or str(value).strip() == '':
+            value = default
+        if isinstance(default, int):
+            value = int(float(value))
+        elif field.startswith('has_'):
+            value = 'да' if str(value).strip().lower() in YES_VALUES else 'нет'
+        else:
+            value = str(value).strip().lower()
+        ad_data[field] = value
+
+    if ad_data['has_photos'] == 'нет':
+        ad_data['photo_count'] = 0
+    if ad_data['has_description'] == 'нет':
+        ad_data['desc_length'] = 0
+    return ad_data
+
+
+def normalize_ads(df, strict=False):
+    """
+    То же, что normalize_ad, для всех строк таблицы объявлений; проверяет
+    ad_type. Нечисловые количество фото и длина описания заменяются
+    значениями по умолчанию с предупреждением (номера объявлений с 1),
+    чтобы одна ошибочная строка не останавливала прогноз для всего файла.
+    strict=True - вместо замены ValueError с номером объявления (сервис
+    возвращает клиенту ошибку, а не прогноз по подставленным значениям).
+    """
+    ads = pd.DataFrame(index=df.index)
+    ad_type = df['ad_type'] if 'ad_type' in df else pd.Series('', index=df.index)
+    ads['ad_type'] = ad_type.astype(str).str.strip().str.lower()
+    invalid = ~ads['ad_type'].isin(['lost', 'found'])
+    if invalid.any():
+        number = int(np.argmax(invalid.to_numpy())) + 1
+        raise ValueError(f"Объявление {number}: ad_type должен быть lost или found, "
+                         f"получено '{ads['ad_type'].iloc[number - 1]}'")
+
+    for field, default in AD_DEFAULTS.items():
+        values = df[field] if field in df else pd.Series(None, index=df.index, dtype=object)
+        text = values.astype(str).str.strip()
+        text = text.where(values.notna() & (text != ''), str(default))
+        if isinstance(default, int):
+            numbers = pd.to_numeric(text, errors='coerce')
+            invalid = numbers.isna() | np.isinf(numbers)
+            if invalid.any() and strict:
+                number = int(np.argmax(invalid.to_numpy())) + 1
+                raise ValueError(f"Объявление {number}: {field} должно быть числом, "
+                                 f"получено '{text.iloc[number - 1]}'")
+            if invalid.any():
+                rows = ', '.join(str(number) for number in np.flatnonzero(invalid.to_numpy())[:10] + 1)
+                more = ' и др.' if invalid.sum() > 10 else ''
+                print(f"⚠️ {field}: не число в объявлениях {rows}{more} - используется {default}")
+            ads[field] = numbers.where(~invalid, default).astype(float).astype('int64')
+        elif field.startswith('has_'):
+            ads[field] = np.where(text.str.lower().isin(YES_VALUES), 'да', 'нет')
+        else:
+            ads[field] = text.str.lower()
+
+    ads.loc[ads['has_photos'] == 'нет', 'photo_count'] = 0
+    ads.loc[ads['has_description'] == 'нет', 'desc_length'] = 0
+    return ads.reset_index(drop=True)
+
+
+def step_3_2(ads_file=None):
+    """
+    Основная функция программы прогнозирования.
+    ads_file - файл объявлений для пакетного прогноза без диалога
+    (см. PetSearchPredictor.predict_from_file); без него прогноз
+    строится по ответам пользователя.
+    """
 
     warnings.filterwarnings('ignore')
 
@@ -320,6 +668,10 @@ def step_3_2():
     print("📊 Модель использует реальную статистику из анализа данных")
     
     predictor = PetSearchPredictor()
+
+    if ads_file:
+        predictor.predict_from_file(ads_file)
+        return
     
     while True:
         print("\n📋 ВЫБЕРИТЕ ТИП ПРОГНОЗА:")
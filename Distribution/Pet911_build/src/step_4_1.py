@@ -1,4 +1,9 @@
 from .deps import *
+from .config import dataset_path, results_path
+from .partitions import read_dataset
+from .rendering import chart_batch, save_figure, submit_chart
+from .phases import phase
+from .caches import lemmatize
 
 # Для текстовой обработки
 
@@ -6,7 +11,7 @@ from .deps import *
 
 def setup_directories():
     """Создает структуру папок для результатов"""
-    main_dir = "results/Результаты 4 главы анализа"
+    main_dir = results_path("Результаты 4 главы анализа")
     analysis_dir = os.path.join(main_dir, "4.1. Результаты лингвистического и TF-IDF анализа")
     
     os.makedirs(main_dir, exist_ok=True)
@@ -51,21 +56,19 @@ def preprocess_text(text, stopwords_list, morph_analyzer):
     processed_words = []
     for word in words:
         if word not in stopwords_list and len(word) > 2:
-            parsed_word = morph_analyzer.parse(word)[0]
-            lemma = parsed_word.normal_form
-            processed_words.append(lemma)
+            processed_words.append(lemmatize(word, morph_analyzer))
     
     return " ".join(processed_words)
 
-def load_and_prepare_data(lost_file, found_file):
+def load_and_prepare_data(lost_file, found_file, filters=None):
     """
     Загружает данные из двух файлов, объединяет их и создает целевую переменную is_success.
     """
     print("Загрузка данных...")
     
     # Загрузка данных
-    df_lost = pd.read_csv(lost_file)
-    df_found = pd.read_csv(found_file)
+    df_lost = read_dataset(lost_file, 'lost', filters)
+    df_found = read_dataset(found_file, 'found', filters)
     
     # Добавляем метку типа объявления
     df_lost['объявление_тип'] = 'lost'
@@ -93,9 +96,10 @@ def analyze_word_frequencies(df, stopwords_list, morph_analyzer):
     Анализирует частоты слов в успешных и неуспешных объявлениях.
     """
     print("\nПредобработка текстов...")
-    df['описание_обработанное'] = df['описание'].apply(
-        lambda x: preprocess_text(x, stopwords_list, morph_analyzer)
-    )
+    with phase('preprocess'):
+        df['описание_обработанное'] = df['описание'].apply(
+            lambda x: preprocess_text(x, stopwords_list, morph_analyzer)
+        )
     
     # Разделяем на успешные и неуспешные
     success_texts = df[df['is_success'] == True]['описание_обработанное']
@@ -201,6 +205,15 @@ def visualize_results(word_df, tfidf_df, main_dir):
     top_success_tfidf = tfidf_df.nlargest(20, 'tfidf_difference')
     top_fail_tfidf = tfidf_df.nsmallest(20, 'tfidf_difference')
     
+    submit_chart(plot_top_words, top_success_freq, top_fail_freq, top_success_tfidf, top_fail_tfidf, main_dir)
+    submit_chart(plot_top_words_comparison, top_success_freq, top_fail_freq, main_dir)
+    
+    return top_success_freq, top_fail_freq, top_success_tfidf, top_fail_tfidf
+
+def plot_top_words(top_success_freq, top_fail_freq, top_success_tfidf, top_fail_tfidf, main_dir):
+    """
+    Топ-20 слов успешных и неуспешных объявлений по разнице частот и TF-IDF.
+    """
     # Создаем фигуру с 4 субплогами
     fig, axes = plt.subplots(2, 2, figsize=(20, 16))
     
@@ -239,11 +252,13 @@ def visualize_results(word_df, tfidf_df, main_dir):
     plt.tight_layout()
     
     # Сохраняем в основную папку
-    plt.savefig(os.path.join(main_dir, '4.1.1. Комплексные результаты топ 20 слов для двух видов анализа.png'), 
-                dpi=300, bbox_inches='tight')
+    save_figure(os.path.join(main_dir, '4.1.1. Комплексные результаты топ 20 слов для двух видов анализа.png'))
     plt.close()
-    
-    # Дополнительная визуализация: сравнение топ-10 слов
+
+def plot_top_words_comparison(top_success_freq, top_fail_freq, main_dir):
+    """
+    Дополнительная визуализация: сравнение частот топ-10 слов между группами.
+    """
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 8))
     
     # Сравнение частот для топ-10 успешных слов
@@ -282,11 +297,8 @@ def visualize_results(word_df, tfidf_df, main_dir):
     plt.tight_layout()
     
     # Сохраняем в основную папку
-    plt.savefig(os.path.join(main_dir, '4.1.2. Сравнения частот для топ 10 слов успешных и неуспешных объявлений.png'), 
-                dpi=300, bbox_inches='tight')
+    save_figure(os.path.join(main_dir, '4.1.2. Сравнения частот для топ 10 слов успешных и неуспешных объявлений.png'))
     plt.close()
-    
-    return top_success_freq, top_fail_freq, top_success_tfidf, top_fail_tfidf
 
 def print_insights(success_words_freq, fail_words_freq, success_words_tfidf, fail_words_tfidf):
     """
@@ -314,9 +326,10 @@ def print_insights(success_words_freq, fail_words_freq, success_words_tfidf, fai
     for i, (_, row) in enumerate(fail_words_tfidf.head(10).iterrows(), 1):
         print(f"  {i:2d}. {row['word']:15} (разница TF-IDF: {row['tfidf_difference']:+.4f})")
 
-def step_4_1():
+def step_4_1(filters=None):
     """
     Основная функция для лингвистического анализа.
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
     """
     # Настройка отображения
     plt.rcParams['font.family'] = 'DejaVu Sans'
@@ -325,8 +338,8 @@ def step_4_1():
 
 
     # Укажите пути к вашим файлам
-    LOST_FILE = 'data/Dataset_final_Pet911_lost.csv'
-    FOUND_FILE = 'data/dataset_final_Pet911_found.csv'
+    LOST_FILE = dataset_path('lost')
+    FOUND_FILE = dataset_path('found')
     
     try:
         print("=== ЛИНГВИСТИЧЕСКИЙ АНАЛИЗ ОПИСАНИЙ ===")
@@ -339,7 +352,7 @@ def step_4_1():
         stopwords_list, morph_analyzer = setup_russian_analysis()
         
         # Загрузка данных
-        df = load_and_prepare_data(LOST_FILE, FOUND_FILE)
+        df = load_and_prepare_data(LOST_FILE, FOUND_FILE, filters)
         
         # Анализ частот слов
         word_freq_df, success_texts, fail_texts = analyze_word_frequencies(
@@ -349,24 +362,27 @@ def step_4_1():
         # Анализ TF-IDF
         tfidf_df = analyze_with_tfidf(df, success_texts, fail_texts)
         
-        # Визуализация результатов
-        success_freq, fail_freq, success_tfidf, fail_tfidf = visualize_results(
-            word_freq_df, tfidf_df, main_dir
-        )
-        
-        # Вывод инсайтов
-        print_insights(success_freq, fail_freq, success_tfidf, fail_tfidf)
-        
-        # Сохранение результатов в папку анализа
-        word_freq_df.to_csv(os.path.join(analysis_dir, 'word_frequency_analysis.csv'), 
-                           index=False, encoding='utf-8-sig')
-        tfidf_df.to_csv(os.path.join(analysis_dir, 'tfidf_analysis.csv'), 
-                       index=False, encoding='utf-8-sig')
+        # Визуализация результатов: диаграммы рисуются параллельно с выводом и сохранением CSV
+        with chart_batch('step_4_1'):
+            success_freq, fail_freq, success_tfidf, fail_tfidf = visualize_results(
+                word_freq_df, tfidf_df, main_dir
+            )
+            
+            # Вывод инсайтов
+            print_insights(success_freq, fail_freq, success_tfidf, fail_tfidf)
+            
+            # Сохранение результатов в папку анализа
+            with phase('save'):
+                word_freq_df.to_csv(os.path.join(analysis_dir, 'word_frequency_analysis.csv'), 
+                                   index=False, encoding='utf-8-sig')
+                tfidf_df.to_csv(os.path.join(analysis_dir, 'tfidf_analysis.csv'), 
+                               index=False, encoding='utf-8-sig')
         
-        print(f"Результаты сохранены в папке 'results/Результаты 4 главы анализа'")
+        print(f"Результаты сохранены в папке '{main_dir}'")
 
         
     except Exception as e:
         print(f"Произошла ошибка: {e}")
         import traceback
         traceback.print_exc()
+        raise
@@ -1,4 +1,13 @@
 from .deps import *
+from .config import dataset_path, results_path
+from .partitions import read_dataset
+from .rendering import chart_batch, save_figure, submit_chart
+from .phases import phase, timed
+from .caches import map_cached
+
+# Признаки для radar chart и тепловой карты (исключаем размер и успешность)
+RADAR_FEATURES = ['Ср_фото', 'Ср_длина_описания', 'Ср_полнота',
+                  'Ср_скорость_публикации', 'Ср_активность']
 
 
 
@@ -6,7 +15,7 @@ def create_directories():
     """
     Создает структуру папок для результатов.
     """
-    base_dir = "results/Результаты 4 главы анализа"
+    base_dir = results_path("Результаты 4 главы анализа")
     clustering_dir = os.path.join(base_dir, "4.2. Результаты кластеризации")
     
     # Создаем папки, если они не существуют
@@ -16,15 +25,15 @@ def create_directories():
     
     return base_dir, clustering_dir
 
-def load_and_prepare_data(lost_file, found_file):
+def load_and_prepare_data(lost_file, found_file, filters=None):
     """
     Загружает данные из двух файлов и объединяет их.
     """
     print("Загрузка данных...")
     
     # Загрузка данных
-    df_lost = pd.read_csv(lost_file)
-    df_found = pd.read_csv(found_file)
+    df_lost = read_dataset(lost_file, 'lost', filters)
+    df_found = read_dataset(found_file, 'found', filters)
     
     # Добавляем метку типа объявления
     df_lost['объявление_тип'] = 'lost'
@@ -45,6 +54,7 @@ def load_and_prepare_data(lost_file, found_file):
     
     return df_combined
 
+@timed('preprocess')
 def create_clustering_features(df):
     """
     Создает признаки для кластеризации на основе качества оформления заявок.
@@ -87,25 +97,15 @@ def create_clustering_features(df):
             return None
     
     # Парсим даты
-    df['дата_публикации_парс'] = df['дата_публикации'].apply(parse_date)
-    
-    # Определяем столбец с датой события в зависимости от типа объявления
-    def get_event_date(row):
-        if row['объявление_тип'] == 'lost':
-            return parse_date(row['дата пропажи'])
-        else:
-            return parse_date(row['дата находки'])
+    df['дата_публикации_парс'] = map_cached(df['дата_публикации'], parse_date)
     
-    df['дата_события_парс'] = df.apply(get_event_date, axis=1)
+    # Дата события - дата пропажи или находки в зависимости от типа объявления
+    event_dates = df['дата пропажи'].where(df['объявление_тип'] == 'lost', df['дата находки'])
+    df['дата_события_парс'] = map_cached(event_dates, parse_date)
     
-    # Вычисляем разницу в днях
-    def calculate_time_diff(row):
-        if pd.isna(row['дата_публикации_парс']) or pd.isna(row['дата_события_парс']):
-            return 0
-        diff = (row['дата_публикации_парс'] - row['дата_события_парс']).days
-        return max(0, diff)  # Отрицательные значения не имеют смысла
-    
-    df['скорость_публикации_дни'] = df.apply(calculate_time_diff, axis=1)
+    # Разница в днях (без одной из дат - 0; отрицательные значения не имеют смысла)
+    time_diff = (df['дата_публикации_парс'] - df['дата_события_парс']).dt.days
+    df['скорость_публикации_дни'] = time_diff.fillna(0).clip(lower=0).astype('int64')
     
     # 5. Активность обсуждения
     df['активность_обсуждения'] = df['количество_комментариев'].fillna(0)
@@ -142,6 +142,18 @@ def find_optimal_clusters(features_scaled, clustering_dir):
         wcss.append(kmeans.inertia_)
     
     # Визуализация выбора k
+    submit_chart(plot_optimal_clusters, list(k_range), wcss, silhouette_scores)
+    
+    # Выбираем k=4 согласно требованиям
+    optimal_k = 4
+    print(f"Выбрано количество кластеров: {optimal_k}")
+    
+    return optimal_k
+
+def plot_optimal_clusters(k_range, wcss, silhouette_scores):
+    """
+    Графики выбора количества кластеров: метод локтя и silhouette score.
+    """
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
     
     # Elbow method
@@ -161,15 +173,9 @@ def find_optimal_clusters(features_scaled, clustering_dir):
     plt.tight_layout()
     
     # Сохраняем в папку кластеризации
-    output_path = os.path.join('results/Результаты 4 главы анализа/4.2.1. Оптимальное количество кластеров.png')
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    output_path = results_path('Результаты 4 главы анализа/4.2.1. Оптимальное количество кластеров.png')
+    save_figure(output_path)
     plt.close()
-    
-    # Выбираем k=4 согласно требованиям
-    optimal_k = 4
-    print(f"Выбрано количество кластеров: {optimal_k}")
-    
-    return optimal_k
 
 def perform_clustering(features_scaled, optimal_k):
     """
@@ -195,6 +201,14 @@ def visualize_clusters_2d(features_scaled, cluster_labels, feature_names, cluste
     pca = PCA(n_components=2, random_state=42)
     features_2d = pca.fit_transform(features_scaled)
     
+    submit_chart(plot_clusters_2d, features_2d, cluster_labels, pca.explained_variance_ratio_)
+    
+    return features_2d
+
+def plot_clusters_2d(features_2d, cluster_labels, explained_var):
+    """
+    Кластеры в пространстве двух главных компонент (с центроидами).
+    """
     # Создаем красивую визуализацию
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 8))
     
@@ -207,7 +221,6 @@ def visualize_clusters_2d(features_scaled, cluster_labels, feature_names, cluste
     ax1.grid(True, alpha=0.3)
     
     # Добавляем объяснение компонент
-    explained_var = pca.explained_variance_ratio_
     ax1.text(0.02, 0.98, f'Объясненная дисперсия:\nPC1: {explained_var[0]:.1%}\nPC2: {explained_var[1]:.1%}', 
              transform=ax1.transAxes, verticalalignment='top',
              bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
@@ -235,11 +248,9 @@ def visualize_clusters_2d(features_scaled, cluster_labels, feature_names, cluste
     plt.tight_layout()
     
     # Сохраняем в папку кластеризации
-    output_path = os.path.join('results/Результаты 4 главы анализа/4.2.2. Визуализация кластеров.png')
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    output_path = results_path('Результаты 4 главы анализа/4.2.2. Визуализация кластеров.png')
+    save_figure(output_path)
     plt.close()
-    
-    return features_2d
 
 def create_cluster_profiles(df, cluster_labels, feature_names):
     """
@@ -307,21 +318,25 @@ def visualize_cluster_profiles(cluster_analysis, cluster_names, clustering_dir):
     """
     print("\nВизуализация профилей кластеров...")
     
-    # 1. Radar chart для сравнения кластеров
+    for plot in (plot_cluster_radar, plot_cluster_success, plot_cluster_heatmap):
+        submit_chart(plot, cluster_analysis, cluster_names)
+
+def plot_cluster_radar(cluster_analysis, cluster_names):
+    """
+    Radar chart для сравнения кластеров.
+    """
     fig, axes = plt.subplots(2, 2, figsize=(20, 16))
     
     # Признаки для radar chart (исключаем размер и успешность)
-    radar_features = ['Ср_фото', 'Ср_длина_описания', 'Ср_полнота', 
-                     'Ср_скорость_публикации', 'Ср_активность']
-    n_features = len(radar_features)
+    n_features = len(RADAR_FEATURES)
     
     # Углы для radar chart
     angles = np.linspace(0, 2 * np.pi, n_features, endpoint=False).tolist()
     angles += angles[:1]  # Замыкаем круг
     
     # Нормализуем данные для radar chart
-    normalized_data = cluster_analysis[radar_features].copy()
-    for feature in radar_features:
+    normalized_data = cluster_analysis[RADAR_FEATURES].copy()
+    for feature in RADAR_FEATURES:
         max_val = normalized_data[feature].max()
         if max_val > 0:
             normalized_data[feature] = normalized_data[feature] / max_val
@@ -348,11 +363,14 @@ def visualize_cluster_profiles(cluster_analysis, cluster_names, clustering_dir):
     plt.tight_layout()
     
     # Сохраняем radar chart
-    radar_path = os.path.join('results/Результаты 4 главы анализа/4.2.3. Средние значения данных анкет внутри кластеров.png')
-    plt.savefig(radar_path, dpi=300, bbox_inches='tight')
+    radar_path = results_path('Результаты 4 главы анализа/4.2.3. Средние значения данных анкет внутри кластеров.png')
+    save_figure(radar_path)
     plt.close()
-    
-    # 2. Bar plot сравнения успешности
+
+def plot_cluster_success(cluster_analysis, cluster_names):
+    """
+    Bar plot сравнения успешности кластеров.
+    """
     plt.figure(figsize=(12, 6))
     success_data = cluster_analysis[['Доля_успеха', 'Название']].sort_values('Доля_успеха')
     
@@ -372,20 +390,23 @@ def visualize_cluster_profiles(cluster_analysis, cluster_names, clustering_dir):
     plt.tight_layout()
     
     # Сохраняем bar plot
-    bar_path = os.path.join('results/Результаты 4 главы анализа/4.2.4. Успешность поиска по типам кластеров.png')
-    plt.savefig(bar_path, dpi=300, bbox_inches='tight')
+    bar_path = results_path('Результаты 4 главы анализа/4.2.4. Успешность поиска по типам кластеров.png')
+    save_figure(bar_path)
     plt.close()
-    
-    # 3. Heatmap характеристик кластеров
+
+def plot_cluster_heatmap(cluster_analysis, cluster_names):
+    """
+    Heatmap характеристик кластеров.
+    """
     plt.figure(figsize=(12, 8))
     
     # Подготовка данных для heatmap
-    heatmap_data = cluster_analysis[radar_features].copy()
+    heatmap_data = cluster_analysis[RADAR_FEATURES].copy()
     heatmap_data['Размер'] = cluster_analysis['Размер_кластера']
     heatmap_data['Успешность'] = cluster_analysis['Доля_успеха']
     
     # Нормализуем для heatmap (кроме успешности)
-    for feature in radar_features + ['Размер']:
+    for feature in RADAR_FEATURES + ['Размер']:
         max_val = heatmap_data[feature].max()
         if max_val > 0:
             heatmap_data[feature] = heatmap_data[feature] / max_val
@@ -396,8 +417,8 @@ def visualize_cluster_profiles(cluster_analysis, cluster_names, clustering_dir):
     plt.tight_layout()
     
     # Сохраняем heatmap
-    heatmap_path = os.path.join('results/Результаты 4 главы анализа/4.2.5. Тепловая карта кластеров.png')
-    plt.savefig(heatmap_path, dpi=300, bbox_inches='tight')
+    heatmap_path = results_path('Результаты 4 главы анализа/4.2.5. Тепловая карта кластеров.png')
+    save_figure(heatmap_path)
     plt.close()
 
 def print_cluster_insights(cluster_analysis, cluster_names):
@@ -434,9 +455,10 @@ def print_cluster_insights(cluster_analysis, cluster_names):
         percentage = row['Размер_кластера'] / total_ads * 100
         print(f"   • {cluster_names[cluster_id]}: {percentage:.1f}%")
 
-def step_4_2():
+def step_4_2(filters=None):
     """
     Основная функция для кластеризации.
+    filters - фильтры партиций (ad_type/year/month/region), см. src/partitions.py
     """
     # Настройка отображения
     plt.rcParams['font.family'] = 'DejaVu Sans'
@@ -445,8 +467,8 @@ def step_4_2():
     pd.set_option('display.max_columns', None)
 
     # Укажите пути к вашим файлам
-    LOST_FILE = 'data/Dataset_final_Pet911_lost.csv'
-    FOUND_FILE = 'data/dataset_final_Pet911_found.csv'
+    LOST_FILE = dataset_path('lost')
+    FOUND_FILE = dataset_path('found')
     
     try:
         print("=== КЛАСТЕРИЗАЦИЯ ПО КАЧЕСТВУ ОФОРМЛЕНИЯ АНКЕТ ===")
@@ -455,7 +477,7 @@ def step_4_2():
         base_dir, clustering_dir = create_directories()
         
         # 1. Загрузка и подготовка данных
-        df = load_and_prepare_data(LOST_FILE, FOUND_FILE)
+        df = load_and_prepare_data(LOST_FILE, FOUND_FILE, filters)
         clustering_features, df_with_features = create_clustering_features(df)
         
         # 2. Масштабирование признаков
@@ -463,39 +485,41 @@ def step_4_2():
         features_scaled = scaler.fit_transform(clustering_features)
         feature_names = clustering_features.columns.tolist()
         
-        # 3. Поиск оптимального количества кластеров
-        optimal_k = find_optimal_clusters(features_scaled, clustering_dir)
+        # Диаграммы рисуются в пуле процессов параллельно с кластеризацией (см. src/rendering.py)
+        with chart_batch('step_4_2'):
+            # 3. Поиск оптимального количества кластеров
+            optimal_k = find_optimal_clusters(features_scaled, clustering_dir)
         
-        # 4. Выполнение кластеризации
-        cluster_labels, kmeans_model = perform_clustering(features_scaled, optimal_k)
+            # 4. Выполнение кластеризации
+            cluster_labels, kmeans_model = perform_clustering(features_scaled, optimal_k)
         
-        # 5. Визуализация в 2D
-        features_2d = visualize_clusters_2d(features_scaled, cluster_labels, feature_names, clustering_dir)
+            # 5. Визуализация в 2D
+            features_2d = visualize_clusters_2d(features_scaled, cluster_labels, feature_names, clustering_dir)
         
-        # 6. Создание профилей кластеров
-        df_result, cluster_analysis, cluster_names = create_cluster_profiles(
-            df_with_features, cluster_labels, feature_names
-        )
+            # 6. Создание профилей кластеров
+            df_result, cluster_analysis, cluster_names = create_cluster_profiles(
+                df_with_features, cluster_labels, feature_names
+            )
         
-        # 7. Визуализация профилей
-        visualize_cluster_profiles(cluster_analysis, cluster_names, clustering_dir)
+            # 7. Визуализация профилей
+            visualize_cluster_profiles(cluster_analysis, cluster_names, clustering_dir)
         
-        # 8. Вывод инсайтов
-        print_cluster_insights(cluster_analysis, cluster_names)
+            # 8. Вывод инсайтов
+            print_cluster_insights(cluster_analysis, cluster_names)
         
-        # 9. Сохранение результатов в соответствующие папки
-        # CSV файлы сохраняем в папку кластеризации
-        csv_result_path = os.path.join(clustering_dir, 'объявления_с_кластерами.csv')
-        csv_analysis_path = os.path.join(clustering_dir, 'анализ_кластеров.csv')
-        
-        df_result.to_csv(csv_result_path, index=False, encoding='utf-8-sig')
-        cluster_analysis.to_csv(csv_analysis_path, encoding='utf-8-sig')
+            # 9. Сохранение результатов в соответствующие папки
+            # CSV файлы сохраняем в папку кластеризации
+            csv_result_path = os.path.join(clustering_dir, 'объявления_с_кластерами.csv')
+            csv_analysis_path = os.path.join(clustering_dir, 'анализ_кластеров.csv')
         
+            with phase('save'):
+                df_result.to_csv(csv_result_path, index=False, encoding='utf-8-sig')
+                cluster_analysis.to_csv(csv_analysis_path, encoding='utf-8-sig')
 
-        
-        print(f"\n💡 Все файлы успешно сохранены в папку: 'results/Результаты 4 главы анализа'")
+        print(f"\n💡 Все файлы успешно сохранены в папку: '{base_dir}'")
         
     except Exception as e:
         print(f"Произошла ошибка: {e}")
         import traceback
         traceback.print_exc()
+        raise
@@ -1,13 +1,22 @@
+from __future__ import annotations
+
 from .deps import *
+from .config import dataset_path, results_path
+from .partitions import read_dataset, selects
+from .chunked import iter_chunks, merge_counts, weighted_rate, histogram_boxplot_stats
+from . import cube, survival
+from .rendering import chart_batch, save_figure, submit_chart
+from .phases import timed
+from .caches import map_cached
+from colorsys import rgb_to_hls
 
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Константы по умолчанию (пути/названия столбцов)
 # ----------------------------------------------------------------------------------------------------------------------
-DEFAULT_LOST_FILE = 'data/Dataset_final_Pet911_lost.csv'
-DEFAULT_FOUND_FILE = 'data/dataset_final_Pet911_found.csv'
-DEFAULT_OUTPUT_DIR = 'results/Результаты 5 главы анализа'
+# Пути к датасетам и папке результатов по умолчанию берутся из src/config.py при запуске
+OUTPUT_SUBDIR = 'Результаты 5 главы анализа'
 
 COLUMN_NAMES_LOST = [
     'url', 'id', 'тип объявления', 'регион', 'статус', 'тип_животного',
@@ -26,51 +35,123 @@ COLUMN_NAMES_FOUND = [
 # Словарь замены русских дней недели
 DAY_MAP = {'пн': 'Mon', 'вт': 'Tue', 'ср': 'Wed', 'чт': 'Thu', 'пт': 'Fri', 'сб': 'Sat', 'вс': 'Sun'}
 
+# Статус успешного объявления для каждого типа
+SUCCESS_STATUS = {'lost': 'питомец найден', 'found': 'хозяин найден'}
+
 # Ключевые города для определения "город/область"
 URBAN_KEYWORDS = ['москва', 'санкт-петербург', 'vidnoye', 'kolomna', 'obninsk', 'moskva']
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Отрисовка графиков (функции уровня модуля, чтобы передавать их в процессы отрисовки)
+# ----------------------------------------------------------------------------------------------------------------------
+def boxplot_from_stats(box_stats: list):
+    """
+    Рисует диаграммы размаха по заранее посчитанным статистикам
+    (квартили, усы, выбросы) в оформлении sns.boxplot.
+    """
+    from matplotlib.colors import to_rgb
+
+    ax = plt.gca()
+    color = sns.utils.desaturate(sns.color_palette()[0], 0.75)
+    lum = rgb_to_hls(*to_rgb(color))[1] * .6
+    linecolor = (lum, lum, lum)
+
+    positions = list(range(len(box_stats)))
+    ax.bxp(box_stats, positions=positions, widths=0.8, capwidths=0.4,
+           patch_artist=True, manage_ticks=False,
+           boxprops={'facecolor': color, 'edgecolor': linecolor},
+           medianprops={'color': linecolor, 'solid_capstyle': 'butt'},
+           whiskerprops={'color': linecolor, 'solid_capstyle': 'butt'},
+           flierprops={'markeredgecolor': linecolor},
+           capprops={'color': linecolor})
+    ax.set_xticks(positions, [stats_row['label'] for stats_row in box_stats])
+    ax.set_xlim(-.5, len(box_stats) - .5)
+    ax.xaxis.grid(False)
+
+
+def plot_status_boxplot(box_data, value_column: str, title: str, ylabel: str, xlabel: str, path: str):
+    """Диаграмма размаха значения по статусам (см. Pet911Analyzer.status_box_data)"""
+    plt.figure(figsize=(10, 6))
+    if isinstance(box_data, pd.DataFrame):
+        sns.boxplot(data=box_data, x='статус', y=value_column)
+    else:
+        boxplot_from_stats(box_data)
+    plt.title(title)
+    plt.ylabel(ylabel)
+    plt.xlabel(xlabel)
+    plt.tight_layout()
+    save_figure(path, dpi=150, bbox_inches=None)
+    plt.close()
+
+
+def plot_success_rate(success_rate: pd.Series, title: str, ylabel: str, xlabel: str, path: str):
+    """Столбчатая диаграмма доли успешных объявлений по группам"""
+    plt.figure(figsize=(8, 6))
+    success_rate.plot(kind='bar')
+    plt.title(title)
+    plt.ylabel(ylabel)
+    plt.xlabel(xlabel)
+    plt.xticks(rotation=0)
+    plt.tight_layout()
+    save_figure(path, dpi=150, bbox_inches=None)
+    plt.close()
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Класс-аналитик
 # ----------------------------------------------------------------------------------------------------------------------
 class Pet911Analyzer:
     """
     Класс, содержащий всю логику из исходного скрипта в методах.
-    - Конструктор принимает пути к csv и директорию для результатов.
+    - Конструктор принимает пути к csv и директорию для результатов (по умолчанию - из src/config.py).
     - Вызов run() последовательно выполняет загрузку, предобработку, генерацию графиков и сохранение вывода.
     """
 
     def __init__(self,
-                 lost_file: str = DEFAULT_LOST_FILE,
-                 found_file: str = DEFAULT_FOUND_FILE,
-                 output_dir: str = DEFAULT_OUTPUT_DIR):
-        self.lost_file = lost_file
-        self.found_file = found_file
-        self.output_dir = output_dir
-
-        # Датафреймы будут храниться как атрибуты
+                 lost_file: str = None,
+                 found_file: str = None,
+                 output_dir: str = None,
+                 filters: dict = None,
+                 chunksize: int = None):
+        self.lost_file = lost_file or dataset_path('lost')
+        self.found_file = found_file or dataset_path('found')
+        self.output_dir = output_dir or results_path(OUTPUT_SUBDIR)
+        self.filters = filters
+        # Размер части для потоковой обработки (None - весь файл в памяти)
+        self.chunksize = chunksize
+
+        # Датафреймы будут храниться как атрибуты (в потоковом режиме остаются пустыми)
         self.lost_df = pd.DataFrame()
         self.found_df = pd.DataFrame()
 
+        # Объединяемые агрегаты, по которым строятся графики и вывод
+        self.lost_agg = None
+        self.found_agg = None
+
         # Подготовка стилей графиков (как в оригинале)
         plt.rcParams['font.size'] = 12
         plt.rcParams['axes.labelsize'] = 12
         plt.rcParams['axes.titlesize'] = 14
         sns.set_style("whitegrid")
+        # Палитра, которую в последовательном запуске оставляли предыдущие главы
+        sns.set_palette("husl")
 
         # Создаём папку вывода
         os.makedirs(self.output_dir, exist_ok=True)
 
     # ----------------------------- Работа с файлами и загрузка -----------------------------
-    def load_data(self, file_path: str, columns: list) -> pd.DataFrame:
+    @timed('load')
+    def load_data(self, file_path: str, columns: list, ad_type: str = None) -> pd.DataFrame:
         """
         Загружает CSV с заданными колонками. Поведение совпадает с оригиналом:
         - использует encoding='utf-8'
         - header=None и передаёт names=columns
         - удаляет первую строку, если она похоже на заголовки (проверяется по 'url')
+        - при заданных фильтрах читает только подходящие партиции
         """
         try:
-            df = pd.read_csv(file_path, names=columns, header=None, encoding='utf-8')
+            df = read_dataset(file_path, ad_type, self.filters, names=columns, header=None, encoding='utf-8')
             # Удаляем первую строку, если это заголовки (как в оригинале)
             if isinstance(df.iloc[0]['url'], str) and 'http' not in df.iloc[0]['url']:
                 df = df.drop(0).reset_index(drop=True)
@@ -79,6 +160,23 @@ class Pet911Analyzer:
             print(f"❌ Ошибка загрузки {file_path}: {e}")
             return pd.DataFrame()
 
+    def load_aggregates_chunked(self, file_path: str, columns: list, ad_type: str, event_date_column: str) -> dict:
+        """
+        Читает CSV частями по self.chunksize строк и возвращает объединенные агрегаты.
+        Первая строка каждого файла - заголовок, колонки задаются списком columns;
+        все значения читаются как строки, как при загрузке целиком с header=None.
+        """
+        try:
+            aggregates = None
+            for chunk in iter_chunks(file_path, ad_type, self.filters, self.chunksize,
+                                     names=columns, header=0, dtype=str, encoding='utf-8'):
+                chunk = self.prepare_frame(chunk, event_date_column)
+                aggregates = self.aggregate_ads(chunk, SUCCESS_STATUS[ad_type], aggregates)
+            return aggregates
+        except Exception as e:
+            print(f"❌ Ошибка загрузки {file_path}: {e}")
+            return None
+
     # ----------------------------- Вспомогательные функции для обработки -----------------------------
     @staticmethod
     def parse_russian_date(date_str: str):
@@ -123,19 +221,109 @@ class Pet911Analyzer:
         return 'Да'
 
     # ----------------------------- Подготовка данных -----------------------------
+    @timed('preprocess')
+    def prepare_frame(self, df: pd.DataFrame, event_date_column: str) -> pd.DataFrame:
+        """
+        Предобработка объявлений одного типа (всего файла или его части):
+        парсит даты, считает время_до_публикации и очищает возраст.
+        """
+        # Парсинг дат и расчёт времени до публикации
+        for col in ['дата_публикации', event_date_column]:
+            if col in df.columns:
+                df[col] = map_cached(df[col].astype(str), self.parse_russian_date)
+        df['время_до_публикации'] = (df['дата_публикации'] - df[event_date_column]).dt.days
+
+        # Очистка возраста
+        df['возраст_число'] = df['возраст'].apply(self.clean_age)
+        return df
+
+    @staticmethod
+    def aggregate_ads(df: pd.DataFrame, success_status: str, aggregates: dict = None) -> dict:
+        """
+        Частичные агрегаты по предобработанной части объявлений: количество
+        объявлений и успехов, сумма времени до публикации, частоты пар
+        (статус, время до публикации) и (статус, возраст) для диаграмм размаха
+        с порядком статусов по первому появлению. Агрегаты разных частей
+        объединяются.
+        """
+        if aggregates is None:
+            aggregates = {
+                'total': 0, 'success': 0, 'delay_sum': 0.0, 'delay_count': 0, 'age_count': 0,
+                'delay': None, 'delay_order': [], 'age': None, 'age_order': [],
+            }
+
+        success = df['статус'] == success_status
+        aggregates['total'] += len(df)
+        aggregates['success'] += success.sum()
+
+        delays = df['время_до_публикации'].dropna()
+        aggregates['delay_sum'] += delays.sum()
+        aggregates['delay_count'] += len(delays)
+
+        # Частоты значений по статусам для диаграмм размаха
+        valid_data = df[['статус', 'время_до_публикации']].dropna()
+        age_data = df[df['возраст_число'].notna()]
+        aggregates['age_count'] += len(age_data)
+        for key, data, column in [('delay', valid_data, 'время_до_публикации'), ('age', age_data, 'возраст_число')]:
+            aggregates[key] = merge_counts(aggregates[key], data.groupby(['статус', column]).size())
+            order = aggregates[f'{key}_order']
+            order.extend(status for status in data['статус'].dropna().unique() if status not in order)
+
+        return aggregates
+
+    def group_counts(self, file_path: str, ad_type: str) -> dict:
+        """
+        Число объявлений (count) и успехов (sum) по типу местности и
+        породистости - свертка агрегатного куба по региону и породе (см. src/cube.py)
+        """
+        cube_frame = cube.load(ad_type, self.filters, self.chunksize, file_path)
+
+        # Тип местности
+        terrain = cube_frame['регион'].astype(str).str.lower().apply(
+            lambda x: 'город' if any(city in x for city in URBAN_KEYWORDS) else 'область/село'
+        ).rename('тип_местности')
+
+        # Породистость
+        pedigree = cube_frame['порода'].apply(self.is_pedigree).rename('породистое')
+
+        return {key: cube.rollup(cube_frame, groups).set_axis(['count', 'sum'], axis=1)
+                for key, groups in [('terrain', terrain), ('pedigree', pedigree)]}
+
+    @staticmethod
+    def success_rate(aggregates: dict, key: str) -> pd.Series:
+        """Доля успешных объявлений по группам ('terrain' или 'pedigree')"""
+        table = aggregates[key]
+        return weighted_rate(table['sum'], table['count']).rename('статус')
+
     def prepare_data(self):
         """
-        Выполняет все шаги предобработки, идентичные оригиналу:
-        - парсит даты
-        - считает время_до_публикации
-        - очищает возраст
-        - определяет тип_местности
-        - помечает породистость
+        Выполняет все шаги предобработки, идентичные оригиналу, и считает
+        агрегаты для графиков и вывода. При заданном chunksize файлы читаются
+        частями, датафреймы целиком не создаются. Доли успеха по типу
+        местности и породистости считаются по агрегатному кубу.
         """
         # Загружаем
         print("🔍 Начало загрузки данных...")
-        self.lost_df = self.load_data(self.lost_file, COLUMN_NAMES_LOST)
-        self.found_df = self.load_data(self.found_file, COLUMN_NAMES_FOUND)
+        if self.chunksize:
+            self.lost_agg = self.load_aggregates_chunked(self.lost_file, COLUMN_NAMES_LOST, 'lost', 'дата пропажи')
+            self.found_agg = self.load_aggregates_chunked(self.found_file, COLUMN_NAMES_FOUND, 'found', 'дата находки')
+
+            if not self.lost_agg or not self.found_agg:
+                print("❌ Не удалось загрузить данные. Проверьте пути к файлам.")
+                raise FileNotFoundError("Один из входных файлов не загружен")
+
+            print(f"✅ Данные успешно загружены (частями по {self.chunksize} строк)")
+            print(f"📊 Пропавшие: {self.lost_agg['total']}, Найденные: {self.found_agg['total']}")
+        else:
+            self.load_frames()
+
+        self.lost_agg.update(self.group_counts(self.lost_file, 'lost'))
+        self.found_agg.update(self.group_counts(self.found_file, 'found'))
+
+    def load_frames(self):
+        """Загрузка и предобработка датасетов целиком"""
+        self.lost_df = self.load_data(self.lost_file, COLUMN_NAMES_LOST, 'lost')
+        self.found_df = self.load_data(self.found_file, COLUMN_NAMES_FOUND, 'found')
 
         if self.lost_df.empty or self.found_df.empty:
             print("❌ Не удалось загрузить данные. Проверьте пути к файлам.")
@@ -144,37 +332,25 @@ class Pet911Analyzer:
         print("✅ Данные успешно загружены")
         print(f"📊 Пропавшие: {len(self.lost_df)}, Найденные: {len(self.found_df)}")
 
-        # Парсинг дат и расчёт времени до публикации (lost)
-        for col in ['дата_публикации', 'дата пропажи']:
-            if col in self.lost_df.columns:
-                self.lost_df[col] = self.lost_df[col].astype(str).apply(self.parse_russian_date)
-        self.lost_df['время_до_публикации'] = (
-            self.lost_df['дата_публикации'] - self.lost_df['дата пропажи']
-        ).dt.days
-
-        # Парсинг дат и расчёт времени до публикации (found)
-        for col in ['дата_публикации', 'дата находки']:
-            if col in self.found_df.columns:
-                self.found_df[col] = self.found_df[col].astype(str).apply(self.parse_russian_date)
-        self.found_df['время_до_публикации'] = (
-            self.found_df['дата_публикации'] - self.found_df['дата находки']
-        ).dt.days
+        self.lost_df = self.prepare_frame(self.lost_df, 'дата пропажи')
+        self.found_df = self.prepare_frame(self.found_df, 'дата находки')
 
-        # Очистка возраста
-        self.lost_df['возраст_число'] = self.lost_df['возраст'].apply(self.clean_age)
-        self.found_df['возраст_число'] = self.found_df['возраст'].apply(self.clean_age)
+        self.lost_agg = self.aggregate_ads(self.lost_df, SUCCESS_STATUS['lost'])
+        self.found_agg = self.aggregate_ads(self.found_df, SUCCESS_STATUS['found'])
 
-        # Тип местности
-        self.lost_df['тип_местности'] = self.lost_df['регион'].astype(str).str.lower().apply(
-            lambda x: 'город' if any(city in x for city in URBAN_KEYWORDS) else 'область/село'
-        )
-        self.found_df['тип_местности'] = self.found_df['регион'].astype(str).str.lower().apply(
-            lambda x: 'город' if any(city in x for city in URBAN_KEYWORDS) else 'область/село'
-        )
+    # ----------------------------- Диаграммы размаха -----------------------------
+    def status_box_data(self, df: pd.DataFrame, aggregates: dict, key: str, value_column: str):
+        """
+        Данные для диаграммы размаха значения по статусам: строки (статус, значение)
+        из df или статистики по частотам из агрегатов в потоковом режиме.
+        """
+        if not self.chunksize:
+            return df[['статус', value_column]].dropna()
 
-        # Породистость
-        self.lost_df['породистое'] = self.lost_df['порода'].apply(self.is_pedigree)
-        self.found_df['породистое'] = self.found_df['порода'].apply(self.is_pedigree)
+        return [
+            histogram_boxplot_stats(aggregates[key].xs(status, level=0), status)
+            for status in aggregates[f'{key}_order']
+        ]
 
     # ----------------------------- Генерация графиков -----------------------------
     def generate_plots(self):
@@ -184,98 +360,66 @@ class Pet911Analyzer:
         """
         print("\n📌 Генерация графиков по пропаже...")
 
-        success_mask_lost = self.lost_df['статус'] == 'питомец найден'
-
         # 1. Время до публикации (lost)
-        valid_data = self.lost_df[['статус', 'время_до_публикации']].dropna()
-        if len(valid_data) > 0 and valid_data['статус'].nunique() > 1:
-            plt.figure(figsize=(10, 6))
-            sns.boxplot(data=valid_data, x='статус', y='время_до_публикации')
-            plt.title("Влияние скорости публикации на успех (При пропаже)")
-            plt.ylabel("Время до публикации, дни")
-            plt.xlabel("Статус объявления")
-            plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir, '5.1. Влияние скорости публикации на успех (При пропаже).png'), dpi=150)
-            plt.close()
+        if len(self.lost_agg['delay_order']) > 1:
+            submit_chart(plot_status_boxplot,
+                         self.status_box_data(self.lost_df, self.lost_agg, 'delay', 'время_до_публикации'),
+                         'время_до_публикации',
+                         "Влияние скорости публикации на успех (При пропаже)",
+                         "Время до публикации, дни", "Статус объявления",
+                         os.path.join(self.output_dir, '5.1. Влияние скорости публикации на успех (При пропаже).png'),
+                         label='lost')
 
         # 2. Возраст (lost)
-        age_data = self.lost_df[self.lost_df['возраст_число'].notna()]
-        if len(age_data) > 0:
-            plt.figure(figsize=(10, 6))
-            sns.boxplot(data=age_data, x='статус', y='возраст_число')
-            plt.title("Возраст (При пропаже)")
-            plt.ylabel("Возраст, лет")
-            plt.xlabel("Статус")
-            plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir, '5.2. Возраст (При пропаже).png'), dpi=150)
-            plt.close()
+        if self.lost_agg['age_count'] > 0:
+            submit_chart(plot_status_boxplot,
+                         self.status_box_data(self.lost_df, self.lost_agg, 'age', 'возраст_число'),
+                         'возраст_число',
+                         "Возраст (При пропаже)",
+                         "Возраст, лет", "Статус",
+                         os.path.join(self.output_dir, '5.2. Возраст (При пропаже).png'),
+                         label='lost')
 
         # 3. Местность (lost)
-        plt.figure(figsize=(8, 6))
-        terrain_success = self.lost_df.groupby('тип_местности')['статус'].apply(lambda x: (x == 'питомец найден').mean())
-        terrain_success.plot(kind='bar')
-        plt.title("Успешность по типу местности (При пропаже)")
-        plt.ylabel("Доля найденных")
-        plt.xlabel("Тип местности")
-        plt.xticks(rotation=0)
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.output_dir, '5.3. Успешность по типу местности (При пропаже).png'), dpi=150)
-        plt.close()
+        submit_chart(plot_success_rate, self.success_rate(self.lost_agg, 'terrain'),
+                     "Успешность по типу местности (При пропаже)",
+                     "Доля найденных", "Тип местности",
+                     os.path.join(self.output_dir, '5.3. Успешность по типу местности (При пропаже).png'),
+                     label='lost')
 
         # 4. Породистость (lost)
-        plt.figure(figsize=(8, 6))
-        breed_success = self.lost_df.groupby('породистое')['статус'].apply(lambda x: (x == 'питомец найден').mean())
-        breed_success.plot(kind='bar')
-        plt.title("Влияние породистости на успех (При пропаже)")
-        plt.ylabel("Доля найденных")
-        plt.xlabel("Породистое животное")
-        plt.xticks(rotation=0)
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.output_dir, '5.4. Влияние породистости на успех (При пропаже).png'), dpi=150)
-        plt.close()
+        submit_chart(plot_success_rate, self.success_rate(self.lost_agg, 'pedigree'),
+                     "Влияние породистости на успех (При пропаже)",
+                     "Доля найденных", "Породистое животное",
+                     os.path.join(self.output_dir, '5.4. Влияние породистости на успех (При пропаже).png'),
+                     label='lost')
 
         # ------------------ По находке ------------------
         print("\n📌 Генерация графиков по находке...")
 
-        # return_mask для вывода
-        # в оригинале использовалось: return_mask = found_df['статус'] == 'хозяин найден'
-        return_mask = self.found_df['статус'] == 'хозяин найден'
-
         # 1. Время до публикации (found)
-        valid_data = self.found_df[['статус', 'время_до_публикации']].dropna()
-        if len(valid_data) > 0 and valid_data['статус'].nunique() > 1:
-            plt.figure(figsize=(10, 6))
-            sns.boxplot(data=valid_data, x='статус', y='время_до_публикации')
-            plt.title("Влияние скорости публикации на успех (При находке)")
-            plt.ylabel("Время до публикации, дни")
-            plt.xlabel("Статус")
-            plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir, '5.5. Влияние скорости публикации на успех (При находке).png'), dpi=150)
-            plt.close()
+        if len(self.found_agg['delay_order']) > 1:
+            submit_chart(plot_status_boxplot,
+                         self.status_box_data(self.found_df, self.found_agg, 'delay', 'время_до_публикации'),
+                         'время_до_публикации',
+                         "Влияние скорости публикации на успех (При находке)",
+                         "Время до публикации, дни", "Статус",
+                         os.path.join(self.output_dir, '5.5. Влияние скорости публикации на успех (При находке).png'),
+                         label='found')
 
         # 2. Местность (found)
-        plt.figure(figsize=(8, 6))
-        place_success = self.found_df.groupby('тип_местности')['статус'].apply(lambda x: (x == 'хозяин найден').mean())
-        place_success.plot(kind='bar')
-        plt.title("Успешность по типу местности (При находке)")
-        plt.ylabel("Доля возвратов")
-        plt.xlabel("Тип местности")
-        plt.xticks(rotation=0)
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.output_dir, '5.6. Успешность по типу местности (При находке).png'), dpi=150)
-        plt.close()
+        submit_chart(plot_success_rate, self.success_rate(self.found_agg, 'terrain'),
+                     "Успешность по типу местности (При находке)",
+                     "Доля возвратов", "Тип местности",
+                     os.path.join(self.output_dir, '5.6. Успешность по типу местности (При находке).png'),
+                     label='found')
 
         # 3. Породистость (found)
-        plt.figure(figsize=(8, 6))
-        breed_return = self.found_df.groupby('породистое')['статус'].apply(lambda x: (x == 'хозяин найден').mean())
-        breed_return.plot(kind='bar')
-        plt.title("Влияние породистости на успех (При находке)")
-        plt.ylabel("Доля возвратов")
-        plt.xlabel("Породистое животное")
-        plt.xticks(rotation=0)
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.output_dir, '5.7. Влияние породистости на успех (При находке).png'), dpi=150)
-        plt.close()
+        submit_chart(plot_success_rate, self.success_rate(self.found_agg, 'pedigree'),
+                     "Влияние породистости на успех (При находке)",
+                     "Доля возвратов", "Породистое животное",
+                     os.path.join(self.output_dir, '5.7. Влияние породистости на успех (При находке).png'),
+                     label='found')
 
     # ----------------------------- Сводный вывод (текст) -----------------------------
     def generate_summary(self) -> list:
@@ -284,26 +428,25 @@ class Pet911Analyzer:
         """
         print("\n📌 Сравнительный анализ...")
 
-        success_mask_lost = self.lost_df['статус'] == 'питомец найден'
-        return_mask = self.found_df['статус'] == 'хозяин найден'
+        lost, found = self.lost_agg, self.found_agg
 
-        mean_delay_lost = self.lost_df['время_до_публикации'].mean()
-        mean_delay_found = self.found_df['время_до_публикации'].mean()
+        mean_delay_lost = lost['delay_sum'] / lost['delay_count'] if lost['delay_count'] else np.nan
+        mean_delay_found = found['delay_sum'] / found['delay_count'] if found['delay_count'] else np.nan
 
-        breed_eff_lost = self.lost_df.groupby('породистое')['статус'].apply(lambda x: (x == 'питомец найден').mean())
-        breed_eff_found = self.found_df.groupby('породистое')['статус'].apply(lambda x: (x == 'хозяин найден').mean())
+        breed_eff_lost = self.success_rate(lost, 'pedigree')
+        breed_eff_found = self.success_rate(found, 'pedigree')
 
         output_lines = []
         output_lines.append("📌 5.1. АНАЛИЗ ОБЪЯВЛЕНИЙ О ПРОПАЖЕ ЖИВОТНОГО")
-        output_lines.append(f" • Всего объявлений: {len(self.lost_df)}")
-        output_lines.append(f" • Найдено: {success_mask_lost.sum()}")
-        output_lines.append(f" • В поиске: {len(self.lost_df) - success_mask_lost.sum()}")
+        output_lines.append(f" • Всего объявлений: {lost['total']}")
+        output_lines.append(f" • Найдено: {lost['success']}")
+        output_lines.append(f" • В поиске: {lost['total'] - lost['success']}")
         output_lines.append(f" • Среднее время до публикации: {mean_delay_lost:.1f} дней")
 
         output_lines.append("\n📌 5.2. АНАЛИЗ ОБЪЯВЛЕНИЙ О НАХОДКЕ ЖИВОТНОГО")
-        output_lines.append(f" • Всего объявлений: {len(self.found_df)}")
-        output_lines.append(f" • Хозяин найден: {return_mask.sum()}")
-        output_lines.append(f" • Ищут хозяина: {len(self.found_df) - return_mask.sum()}")
+        output_lines.append(f" • Всего объявлений: {found['total']}")
+        output_lines.append(f" • Хозяин найден: {found['success']}")
+        output_lines.append(f" • Ищут хозяина: {found['total'] - found['success']}")
         output_lines.append(f" • Среднее время до публикации: {mean_delay_found:.1f} дней")
 
         output_lines.append("\n📌 5.3. СРАВНЕНИЕ: ПРОПАЖА vs НАХОДКА")
@@ -330,6 +473,7 @@ class Pet911Analyzer:
 
         return output_lines
 
+    @timed('save')
     def save_summary(self, output_lines: list):
         """
         Сохраняет output_lines в файл 'Вывод 5 главы.txt' в output_dir и печатает строки — поведение как в оригинале.
@@ -346,28 +490,47 @@ class Pet911Analyzer:
     def run(self):
         """
         Основной метод для последовательного выполнения всех шагов:
-        prepare_data -> generate_plots -> generate_summary -> save_summary
+        prepare_data -> generate_plots -> generate_summary -> save_summary -> analyze_survival
         """
         self.prepare_data()
-        self.generate_plots()
-        summary = self.generate_summary()
-        self.save_summary(summary)
+        # Графики рисуются в пуле процессов, пока считается сводный вывод (см. src/rendering.py)
+        with chart_batch('step_5'):
+            self.generate_plots()
+            summary = self.generate_summary()
+            self.save_summary(summary)
+        self.analyze_survival()
+
+    def analyze_survival(self):
+        """Кривые Каплана - Мейера и лог-ранговые тесты по стратам (см. src/survival.py)"""
+        survival.analyze_survival({'lost': self.lost_file, 'found': self.found_file}, self.output_dir,
+                                  self.filters, self.chunksize)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Скрипт-обёртка для запуска файла напрямую
 # ----------------------------------------------------------------------------------------------------------------------
-def step_5_proxy(lost_file: str = DEFAULT_LOST_FILE, found_file: str = DEFAULT_FOUND_FILE, output_dir: str = DEFAULT_OUTPUT_DIR):
-    analyzer = Pet911Analyzer(lost_file=lost_file, found_file=found_file, output_dir=output_dir)
+def step_5_proxy(lost_file: str = None, found_file: str = None, output_dir: str = None,
+                 filters: dict = None, chunksize: int = None):
+    analyzer = Pet911Analyzer(lost_file=lost_file, found_file=found_file, output_dir=output_dir, filters=filters,
+                              chunksize=chunksize)
     analyzer.run()
 
-def step_5():
+def step_5(filters: dict = None, chunksize: int = None):
+    """
+    filters - фильтры партиций (year/month/region), см. src/partitions.py.
+    Глава сравнивает пропажи и находки, поэтому оба типа объявлений обязательны.
+    chunksize - размер части для потоковой обработки (None - весь файл в памяти)
+    """
 
     warnings.filterwarnings("ignore")
 
-    lf = DEFAULT_LOST_FILE
-    ff = DEFAULT_FOUND_FILE
-    od = DEFAULT_OUTPUT_DIR
+    if not (selects(filters, 'lost') and selects(filters, 'found')):
+        print("⏭ Глава 5 пропущена: фильтр исключает один из типов объявлений")
+        return
+
+    lf = dataset_path('lost')
+    ff = dataset_path('found')
+    od = results_path(OUTPUT_SUBDIR)
 
-    step_5_proxy(lost_file=lf, found_file=ff, output_dir=od)
+    step_5_proxy(lost_file=lf, found_file=ff, output_dir=od, filters=filters, chunksize=chunksize)
   
\ No newline at end of file
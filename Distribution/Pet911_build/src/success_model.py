@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Модель успеха объявления для прогноза step_3_2: логистическая регрессия с
+L2-регуляризацией по признакам, которые известны при публикации
+объявления, - тип животного, количество фото, длина описания, контакты и
+регион. Все признаки категориальные (количество фото и длина описания - по
+тем же интервалам, что в статистике step_3_1), поэтому модель - это
+свободный член и вклад каждого значения признака в логит:
+
+    P(успех) = 1 / (1 + exp(-(intercept + сумма вкладов значений)))
+
+В отличие от поправок по статистике (доля успеха по значению минус
+базовый уровень) вклады оцениваются совместно, и связанные признаки не
+учитываются дважды.
+
+Модель обучается в step_3_1 по ячейкам агрегатного куба (число объявлений
+и успехов по сочетаниям признаков), без строк датасета. Часть объявлений
+каждой ячейки (TEST_SHARE) откладывается случайно для проверки: по ним
+считаются AUC, Brier и калибровка (доля успеха по интервалам прогноза).
+Модель хранится в JSON рядом со статистикой (pet911_<тип>_model.json).
+"""
+import json
+import os
+from bisect import bisect_left
+
+from .deps import np, pd
+
+MODEL_VERSION = 1
+
+# Признаки модели: имя в модели -> подпись в факторах прогноза
+FEATURES = {
+    'animal_type': 'Тип животного',
+    'photo_group': 'Фото',
+    'description_group': 'Описание',
+    'has_contacts': 'Контакты',
+    'region': 'Регион',
+}
+
+# Интервалы количества фото и длины описания (как в статистике step_3_1)
+PHOTO_BINS = [-1, 0, 1, 2, 3, 5, 100]
+PHOTO_GROUPS = ['0', '1', '2', '3', '4-5', '6+']
+DESCRIPTION_BINS = [-1, 0, 10, 20, 30, 50, 100, 1000]
+DESCRIPTION_GROUPS = ['0', '1-10', '11-20', '21-30', '31-50', '51-100', '100+']
+
+# Регионы с меньшим числом объявлений в модель не входят
+MIN_REGION_ADS = 10
+L2 = 1.0
+TEST_SHARE = 0.2
+SEED = 42
+MAX_ITERATIONS = 50
+CALIBRATION_BINS = 10
+
+
+def model_path(stats_dir, ad_type):
+    return os.path.join(stats_dir, f'pet911_{ad_type}_model.json')
+
+
+def group_label(values, bins, labels):
+    """
+    Интервалы значений (количества фото или длины описания), как pd.cut;
+    значения больше последней границы попадают в последний интервал
+    """
+    index = np.searchsorted(bins, np.asarray(values, dtype=float), side='left') - 1
+    return np.asarray(labels, dtype=object)[np.clip(index, 0, len(labels) - 1)]
+
+
+def group_of(value, bins, labels):
+    """Интервал одного значения (см. group_label)"""
+    return labels[min(max(bisect_left(bins, value) - 1, 0), len(labels) - 1)]
+
+
+# ----------------------------- Признаки -----------------------------
+def cell_features(df):
+    """
+    Признаки модели для предобработанных ячеек куба step_3_1 (колонки
+    тип_животного, количество_фото, длина_описания, есть_фото,
+    наличие_описания, есть_контакты, регион)
+    """
+    photos = np.where(df['есть_фото'] == 1, np.maximum(df['количество_фото'], 1), 0)
+    words = np.where(df['наличие_описания'] == 1, np.maximum(df['длина_описания'], 1), 0)
+    return pd.DataFrame({
+        'animal_type': df['тип_животного'].to_numpy(),
+        'photo_group': group_label(photos, PHOTO_BINS, PHOTO_GROUPS),
+        'description_group': group_label(words, DESCRIPTION_BINS, DESCRIPTION_GROUPS),
+        'has_contacts': np.where(df['есть_контакты'] == 1, 'да', 'нет'),
+        'region': df['регион'].to_numpy(),
+    }, index=df.index)
+
+
+def ad_levels(ad_data):
+    """Значения признаков модели для объявления (поля как в диалоге step_3_2)"""
+    has_photos = ad_data.get('has_photos', 'нет') != 'нет'
+    has_description = ad_data.get('has_description', 'нет') != 'нет'
+    photos = max(int(ad_data.get('photo_count', 1)), 1) if has_photos else 0
+    words = max(int(ad_data.get('desc_length', 1)), 1) if has_description else 0
+    return {
+        'animal_type': str(ad_data.get('animal_type', 'другое')).lower(),
+        'photo_group': group_of(photos, PHOTO_BINS, PHOTO_GROUPS),
+        'description_group': group_of(words, DESCRIPTION_BINS, DESCRIPTION_GROUPS),
+        'has_contacts': 'нет' if ad_data.get('has_contacts', 'нет') == 'нет' else 'да',
+        'region': str(ad_data.get('region', '')).lower(),
+    }
+
+
+def design_matrix(features, columns):
+    """Матрица признаков (значение признака -> 0/1) для столбцов columns"""
+    matrix = np.zeros((len(features), len(columns)))
+    for feature in FEATURES:
+        positions = {value: i for i, (name, value) in enumerate(columns) if name == feature}
+        index = features[feature].map(positions).to_numpy(dtype=float)
+        rows = np.flatnonzero(~np.isnan(index))
+        matrix[rows, index[rows].astype(int)] = 1
+    return matrix
+
+
+# ----------------------------- Обучение -----------------------------
+def sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+
+def fit_logistic(X, successes, trials, l2=L2):
+    """
+    Логистическая регрессия по биномиальным данным (успехи из trials в каждой
+    строке X) методом Ньютона; свободный член не регуляризуется
+    """
+    X = np.column_stack([np.ones(len(X)), X])
+    beta = np.zeros(X.shape[1])
+    rate = successes.sum() / trials.sum()
+    beta[0] = np.log(rate / (1 - rate)) if 0 < rate < 1 else 0.0
+    penalty = np.full(X.shape[1], l2)
+    penalty[0] = 0
+    for _ in range(MAX_ITERATIONS):
+        p = sigmoid(X @ beta)
+        gradient = X.T @ (successes - trials * p) - penalty * beta
+        hessian = (X * (trials * p * (1 - p))[:, None]).T @ X + np.diag(penalty) + 1e-9 * np.eye(X.shape[1])
+        step = np.linalg.solve(hessian, gradient)
+        beta += step
+        if np.max(np.abs(step)) < 1e-8:
+            break
+    return beta[0], beta[1:]
+
+
+def split_cells(successes, trials, share=TEST_SHARE, seed=SEED):
+    """
+    Случайно откладывает долю share объявлений каждой ячейки: число
+    отложенных объявлений и успехов среди них (как при выборке строк без
+    возвращения). Возвращает успехи и объявления обучающей и отложенной частей.
+    """
+    rng = np.random.default_rng(seed)
+    test_trials = rng.binomial(trials, share)
+    test_successes = rng.hypergeometric(successes, trials - successes, test_trials)
+    return successes - test_successes, trials - test_trials, test_successes, test_trials
+
+
+def weighted_auc(scores, positives, negatives):
+    """AUC по ячейкам: вероятность, что у успешного объявления прогноз выше (равные - наполовину)"""
+    frame = pd.DataFrame({'score': scores, 'pos': positives, 'neg': negatives}).groupby('score').sum()
+    total = frame['pos'].sum() * frame['neg'].sum()
+    if total == 0:
+        return float('nan')
+    below = frame['neg'].cumsum() - frame['neg']
+    return float((frame['pos'] * (below + frame['neg'] / 2)).sum() / total)
+
+
+def calibration(p, successes, trials, bins=CALIBRATION_BINS):
+    """Средний прогноз и фактическая доля успеха по интервалам прогноза"""
+    frame = pd.DataFrame({'group': np.minimum((p * bins).astype(int), bins - 1), 'weighted_p': p * trials,
+                          'successes': successes, 'ads': trials})
+    frame = frame[frame['ads'] > 0].groupby('group').sum()
+    return [{
+        'interval': f'{group / bins:.0%}-{(group + 1) / bins:.0%}',
+        'ads': int(row['ads']),
+        'predicted': round(float(row['weighted_p'] / row['ads']), 4),
+        'observed': round(float(row['successes'] / row['ads']), 4),
+    } for group, row in frame.iterrows()]
+
+
+def train(cells, ad_type):
+    """
+    Обучает модель по предобработанным ячейкам куба step_3_1 (колонки
+    признаков, is_success и n) и проверяет ее на отложенных объявлениях.
+    Возвращает модель в виде словаря для JSON.
+    """
+    features = cell_features(cells)
+    grouped = features.assign(successes=cells['is_success'] * cells['n'], trials=cells['n']) \
+        .groupby(list(FEATURES), dropna=False)[['successes', 'trials']].sum().reset_index()
+    grouped = grouped[grouped['trials'] > 0]
+    train_s, train_n, test_s, test_n = split_cells(grouped['successes'].to_numpy().astype(int),
+                                                   grouped['trials'].to_numpy().astype(int))
+
+    # Значения признаков, которые встречаются в обучающей части (регионы - не реже MIN_REGION_ADS)
+    columns = []
+    for feature in FEATURES:
+        counts = pd.Series(train_n, index=grouped[feature].to_numpy()).groupby(level=0).sum()
+        minimum = MIN_REGION_ADS if feature == 'region' else 1
+        columns += [(feature, value) for value in sorted(counts[counts >= minimum].index) if value != '']
+
+    X = design_matrix(grouped, columns)
+    intercept, weights = fit_logistic(X, train_s, train_n)
+    test_p = sigmoid(intercept + X @ weights)
+    coefficients = {feature: {} for feature in FEATURES}
+    for (feature, value), weight in zip(columns, weights):
+        coefficients[feature][value] = round(float(weight), 6) + 0.0
+
+    tested = test_n.sum()
+    auc = weighted_auc(test_p, test_s, test_n - test_s)
+    return {
+        'version': MODEL_VERSION,
+        'ad_type': ad_type,
+        'kind': 'logistic',
+        'l2': L2,
+        'base_rate': float(grouped['successes'].sum() / grouped['trials'].sum()),
+        'intercept': round(float(intercept), 6),
+        'coefficients': coefficients,
+        'metrics': {
+            'train_ads': int(train_n.sum()),
+            'test_ads': int(tested),
+            'auc': round(auc, 4) if not np.isnan(auc) else None,
+            'brier': round(float(((test_s * (1 - test_p) ** 2 + (test_n - test_s) * test_p ** 2).sum()) / tested), 4)
+            if tested else None,
+            'calibration': calibration(test_p, test_s, test_n),
+        },
+    }
+
+
+def save(model, path):
+    """Атомарно сохраняет модель (step_3_2 может перечитывать ее во время записи)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """Модель из JSON (None - файла нет или он другой версии)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        model = json.load(f)
+    return model if model.get('version') == MODEL_VERSION else None
+
+
+# ----------------------------- Прогноз -----------------------------
+def explain(model, levels):
+    """
+    Вероятность успеха по значениям признаков (см. ad_levels) и вклад каждого
+    признака: насколько изменится вероятность, если убрать его вклад из логита.
+    Возвращает вероятность, описания факторов и базовый уровень.
+    """
+    contributions = {feature: model['coefficients'][feature].get(levels[feature]) for feature in FEATURES}
+    logit = model['intercept'] + sum(value for value in contributions.values() if value is not None)
+    probability = float(sigmoid(logit))
+
+    factors_log = []
+    for feature in FEATURES:
+        value = contributions[feature]
+        factors_log.append(factor_text(factor_label(feature, levels[feature]),
+                                       None if value is None else probability - float(sigmoid(logit - value))))
+    return probability, factors_log, model['base_rate']
+
+
+def factor_label(feature, level):
+    """Подпись значения признака в факторах прогноза"""
+    title = FEATURES[feature]
+    if feature == 'photo_group':
+        return f"{title} ({level} шт.)" if level != '0' else 'Отсутствие фото'
+    if feature == 'description_group':
+        return f"{title} ({level} слов)" if level != '0' else 'Отсутствие описания'
+    if feature == 'has_contacts':
+        return 'Наличие контактов' if level == 'да' else 'Отсутствие контактов'
+    return f"{title} ({level})"
+
+
+def factor_text(label, impact):
+    """Фактор прогноза: подпись и изменение вероятности (None - значения нет в модели)"""
+    if impact is None:
+        return f"{label}: нет в модели"
+    return f"{label}: {impact:+.1%}"
+
+
+def describe_metrics(model):
+    """Качество модели на отложенных объявлениях в одну строку"""
+    metrics = model['metrics']
+    if not metrics['test_ads'] or metrics['auc'] is None:
+        return f"нет оценки качества ({metrics['test_ads']} отложенных объявлений)"
+    calibration_error = sum(abs(row['predicted'] - row['observed']) * row['ads'] for row in metrics['calibration'])
+    calibration_error /= metrics['test_ads']
+    return (f"AUC {metrics['auc']:.3f}, Brier {metrics['brier']:.3f}, ошибка калибровки "
+            f"{calibration_error:.1%} на {metrics['test_ads']} отложенных объявлениях")
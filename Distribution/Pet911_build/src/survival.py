@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Анализ выживаемости для главы 5: кривые Каплана - Мейера и лог-ранговые
+тесты по регионам, типам животных, качеству объявления и их сочетаниям.
+
+Два интервала времени (в днях):
+    - публикация - от даты пропажи/находки до публикации объявления
+      (время_до_публикации step_5; объявления с отрицательной разницей
+      дат не учитываются), событие - публикация;
+    - решение - от публикации до даты выгрузки (по умолчанию - последняя
+      дата публикации в датасетах), событие - успешный статус, объявления
+      "в поиске" цензурируются на дату выгрузки. Даты решения в выгрузке
+      нет, поэтому для успешных объявлений это верхняя оценка времени.
+Качество объявления - сколько из трех полей заполнено: фото, описание,
+контакты.
+
+Файлы читаются частями (только нужные колонки), строки сводятся к
+ячейкам (страты, даты, успех) с числом объявлений. Для каждой
+стратификации времена сортируются один раз (np.unique), число событий и
+выбывших по (страта, время) считается одним np.bincount в матрицу
+страта × время, а число под риском, оценка выживаемости (cumprod) и
+дисперсия Гринвуда - накопленными суммами по оси времени сразу для всех
+страт. Лог-ранговый тест сравнивает страты не меньше чем из MIN_SUPPORT
+объявлений; матрица ковариаций - диагональ минус матрица ранга "число
+моментов событий", поэтому при тысячах страт система решается по формуле
+Вудбери, а не обращением матрицы страта × страта.
+"""
+import os
+import time
+
+from . import config
+from .chunked import DEFAULT_CHUNKSIZE
+from .cube import SUCCESS_STATUSES, read_cells, region_animal_labels
+from .caches import map_cached
+from .deps import np, pd, stats
+from .phases import phase
+
+EVENT_DATE_COLUMNS = {'lost': 'дата пропажи', 'found': 'дата находки'}
+DATASET_NAMES = {'lost': 'При пропаже', 'found': 'При находке'}
+QUALITY_COLUMNS = ['есть_фото', 'наличие_описания', 'есть_контакты']
+READ_COLUMNS = ['регион', 'тип_животного', 'статус', 'дата_публикации'] + QUALITY_COLUMNS
+
+STRATA = ['регион', 'тип_животного', 'качество_объявления']
+# Стратификации: одна колонка или сочетание колонок
+STRATIFICATIONS = [['регион'], ['тип_животного'], ['качество_объявления'], STRATA]
+
+# Минимальное число объявлений в страте для лог-рангового теста
+MIN_SUPPORT = 30
+Z_95 = 1.959963984540054
+
+CURVES_FILE = '5.8. Кривые выживания (Каплан - Мейер).csv'
+STRATA_FILE = '5.9. Медианы и события по стратам.csv'
+TESTS_FILE = '5.10. Лог-ранговые тесты.csv'
+
+
+# ----------------------------- Ячейки -----------------------------
+def parse_days(values):
+    """Дни от 1970-01-01 для дат вида 'пн, 01.01.2020' (NaN - дата не разобрана)"""
+    from .step_5 import Pet911Analyzer
+
+    dates = pd.to_datetime(map_cached(values, Pet911Analyzer.parse_russian_date))
+    return (dates - pd.Timestamp(0)).dt.days
+
+
+def survival_cells(df, ad_type):
+    """Страты, дни события и публикации и успех для части строк с числом объявлений n"""
+    from .step_3_1 import typed_column
+
+    quality = sum(typed_column(df[column], column) for column in QUALITY_COLUMNS)
+    return pd.DataFrame({
+        **region_animal_labels(df),
+        'качество_объявления': quality.astype(str) + ' из 3',
+        'день_события': parse_days(df[EVENT_DATE_COLUMNS[ad_type]]),
+        'день_публикации': parse_days(df['дата_публикации']),
+        'успех': (df['статус'] == SUCCESS_STATUSES[ad_type]).astype('int64'),
+        'n': 1,
+    }, index=df.index)
+
+
+def dataset_cells(file_path, ad_type, filters=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Ячейки датасета (исходного файла или отобранных фильтрами партиций), прочитанного частями"""
+    return read_cells(file_path, ad_type, filters, chunksize, READ_COLUMNS + [EVENT_DATE_COLUMNS[ad_type]],
+                      survival_cells, dtype=str)
+
+
+def durations(cells, span, export_day):
+    """Длительность, признак события и число объявлений для интервала span ('публикация' или 'решение')"""
+    if span == 'публикация':
+        duration = cells['день_публикации'] - cells['день_события']
+        valid = duration.notna() & (duration >= 0)
+        event = pd.Series(1, index=cells.index)
+    else:
+        duration = export_day - cells['день_публикации']
+        valid = duration.notna() & (duration >= 0)
+        event = cells['успех']
+    cells = cells[valid]
+    return cells, duration[valid].to_numpy(dtype='int64'), event[valid].to_numpy(), cells['n'].to_numpy()
+
+
+# ----------------------------- Оценки -----------------------------
+def kaplan_meier(codes, size, duration, event, weights):
+    """
+    Матрицы страта × время (времена - отсортированные уникальные длительности):
+    события, выбывшие (события и цензурирование), под риском, выживаемость
+    и 95% интервал Гринвуда
+    """
+    times, time_index = np.unique(duration, return_inverse=True)
+    keys = codes * len(times) + time_index
+    shape = (size, len(times))
+    events = np.bincount(keys, weights=weights * event, minlength=size * len(times)).reshape(shape)
+    removed = np.bincount(keys, weights=weights, minlength=size * len(times)).reshape(shape)
+    at_risk = removed[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hazard = np.where(at_risk > 0, events / at_risk, 0)
+        greenwood = np.where(at_risk > events, events / (at_risk * (at_risk - events)), 0)
+    survival = np.cumprod(1 - hazard, axis=1)
+    std = survival * np.sqrt(np.cumsum(greenwood, axis=1))
+    return {
+        'times': times, 'events': events, 'removed': removed, 'at_risk': at_risk, 'survival': survival,
+        'ci_low': np.clip(survival - Z_95 * std, 0, 1), 'ci_high': np.clip(survival + Z_95 * std, 0, 1),
+    }
+
+
+def median_times(curves):
+    """Медиана длительности по стратам: первое время, где выживаемость не больше 0.5 (NaN - не достигнута)"""
+    reached = curves['survival'] <= 0.5
+    first = reached.argmax(axis=1)
+    return np.where(reached.any(axis=1), curves['times'][first], np.nan)
+
+
+def logrank(events, at_risk):
+    """
+    Лог-ранговый тест для страт (строки матриц страта × время): наблюдаемые
+    и ожидаемые события по стратам, хи-квадрат, степени свободы, p-значение
+    """
+    total_at_risk = at_risk.sum(axis=0)
+    total_events = events.sum(axis=0)
+    observed = events.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = (at_risk * np.where(total_at_risk > 0, total_events / total_at_risk, 0)).sum(axis=1)
+
+    # Ковариации: V = diag(p · w) - P diag(w) P^T по моментам с ненулевым весом w
+    moments = (total_at_risk > 1) & (total_events > 0) & (total_events < total_at_risk)
+    n, d = total_at_risk[moments], total_events[moments]
+    w = d * (n - d) / (n - 1)
+    p = at_risk[:, moments] / n
+    diagonal = p @ w
+    # Страты без объявлений под риском в моменты событий не меняют статистику; последняя - зависимая
+    strata = np.flatnonzero(diagonal > 0)[:-1]
+    if len(strata) == 0:
+        return observed, expected, np.nan, 0, np.nan
+
+    difference = (observed - expected)[strata]
+    u, diagonal = p[strata], diagonal[strata]
+    try:
+        if len(strata) <= len(w):
+            variance = np.diag(diagonal) - (u * w) @ u.T
+            chi2 = difference @ np.linalg.solve(variance, difference)
+        else:
+            # Формула Вудбери: система размера "число моментов", а не "число страт"
+            y = difference / diagonal
+            inner = np.diag(1 / w) - (u.T / diagonal) @ u
+            projected = u.T @ y
+            chi2 = difference @ y + projected @ np.linalg.solve(inner, projected)
+    except np.linalg.LinAlgError:
+        variance = np.diag(diagonal) - (u * w) @ u.T
+        chi2 = difference @ np.linalg.lstsq(variance, difference, rcond=None)[0]
+    return observed, expected, chi2, len(strata), stats.chi2.sf(chi2, len(strata))
+
+
+# ----------------------------- Таблицы -----------------------------
+def stratify(cells, columns):
+    """Номера страт и их подписи для сочетания колонок columns"""
+    labels = cells[columns[0]].astype(str)
+    for column in columns[1:]:
+        labels = labels + '; ' + cells[column].astype(str)
+    codes, uniques = pd.factorize(labels, sort=True)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def analyze_span(cells, ad_type, span, export_day, min_support=MIN_SUPPORT):
+    """Кривые, сводка по стратам и тесты для одного датасета и интервала времени"""
+    cells, duration, event, weights = durations(cells, span, export_day)
+    curves_parts, strata_parts, tests = [], [], []
+    if len(cells) == 0:
+        return curves_parts, strata_parts, tests
+
+    for columns in STRATIFICATIONS:
+        name = ' × '.join(columns)
+        codes, labels = stratify(cells, columns)
+        curves = kaplan_meier(codes, len(labels), duration, event, weights)
+
+        tested = curves['removed'].sum(axis=1) >= min_support
+        observed, expected, chi2, df, p_value = logrank(curves['events'][tested], curves['at_risk'][tested])
+
+        strata_parts.append(pd.DataFrame({
+            'стратификация': name, 'страта': labels,
+            'объявлений': curves['removed'].sum(axis=1).astype('int64'),
+            'событий': curves['events'].sum(axis=1).astype('int64'),
+            'медиана_дней': median_times(curves),
+            'в_тесте': tested,
+        }).assign(наблюдаемых=np.nan, ожидаемых=np.nan))
+        strata_parts[-1].loc[tested, 'наблюдаемых'] = observed
+        strata_parts[-1].loc[tested, 'ожидаемых'] = expected
+
+        tests.append({'стратификация': name, 'страт': len(labels), 'страт_в_тесте': int(tested.sum()),
+                      'объявлений_в_тесте': int(curves['removed'][tested].sum()),
+                      'событий_в_тесте': int(curves['events'][tested].sum()),
+                      'хи_квадрат': chi2, 'степеней_свободы': df, 'p_значение': p_value})
+
+        # Кривые - только в моменты, когда в страте были события или цензурирование
+        stratum, moment = np.nonzero(curves['removed'])
+        curves_parts.append(pd.DataFrame({
+            'стратификация': name, 'страта': labels[stratum], 'день': curves['times'][moment],
+            'под_риском': curves['at_risk'][stratum, moment].astype('int64'),
+            'событий': curves['events'][stratum, moment].astype('int64'),
+            'цензурировано': (curves['removed'] - curves['events'])[stratum, moment].astype('int64'),
+            'выживаемость': curves['survival'][stratum, moment],
+            'нижняя_граница': curves['ci_low'][stratum, moment],
+            'верхняя_граница': curves['ci_high'][stratum, moment],
+        }))
+
+    label = {'датасет': DATASET_NAMES[ad_type], 'время': span}
+    return ([part.assign(**label) for part in curves_parts], [part.assign(**label) for part in strata_parts],
+            [{**label, **test} for test in tests])
+
+
+def analyze_survival(files, output_dir, filters=None, chunksize=None, export_date=None, min_support=MIN_SUPPORT):
+    """
+    Кривые выживания, сводка по стратам и лог-ранговые тесты для датасетов
+    files ({тип объявления: путь}); таблицы записываются в output_dir
+    """
+    started = time.perf_counter()
+    cells = {ad_type: dataset_cells(path, ad_type, filters, chunksize or DEFAULT_CHUNKSIZE)
+             for ad_type, path in files.items()}
+    cells = {ad_type: frame for ad_type, frame in cells.items() if frame is not None and len(frame)}
+    if not cells:
+        print("❌ Нет данных для анализа выживаемости")
+        return None
+
+    if export_date is None:
+        export_day = max(frame['день_публикации'].max() for frame in cells.values())
+    else:
+        export_day = (pd.Timestamp(export_date) - pd.Timestamp(0)).days
+
+    curves, strata, tests = [], [], []
+    with phase('compute'):
+        for ad_type, frame in cells.items():
+            for span in ('публикация', 'решение'):
+                span_curves, span_strata, span_tests = analyze_span(frame, ad_type, span, export_day, min_support)
+                curves.extend(span_curves)
+                strata.extend(span_strata)
+                tests.extend(span_tests)
+
+    if not tests:
+        print("❌ Нет объявлений с датами для анализа выживаемости")
+        return None
+
+    front = ['датасет', 'время']
+    tables = {
+        CURVES_FILE: pd.concat(curves, ignore_index=True),
+        STRATA_FILE: pd.concat(strata, ignore_index=True),
+        TESTS_FILE: pd.DataFrame(tests),
+    }
+    with phase('save'):
+        for file_name, table in tables.items():
+            table = table[front + [column for column in table.columns if column not in front]]
+            table.to_csv(os.path.join(output_dir, file_name), index=False, encoding='utf-8-sig')
+
+    export = (pd.Timestamp(0) + pd.Timedelta(days=int(export_day))).strftime('%d.%m.%Y')
+    print(f"⏳ Анализ выживаемости (дата выгрузки {export}): {len(tables[STRATA_FILE])} страт, "
+          f"{len(tables[CURVES_FILE])} точек кривых за {time.perf_counter() - started:.1f} с")
+    for test in tests:
+        if test['степеней_свободы']:
+            print(f"   • {test['датасет']}, {test['время']}, {test['стратификация']}: "
+                  f"χ² = {test['хи_квадрат']:.1f} ({test['степеней_свободы']} ст. св.), p = {test['p_значение']:.4f}")
+    return tables
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Кривые Каплана - Мейера и лог-ранговые тесты')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR, help='папка результатов')
+    parser.add_argument('--export-date', help='дата выгрузки ГГГГ-ММ-ДД (по умолчанию - последняя публикация)')
+    args = parser.parse_args()
+
+    config.configure(results_dir=args.output_dir)
+    os.makedirs(config.results_path('Результаты 5 главы анализа'), exist_ok=True)
+    analyze_survival(config.datasets(), config.results_path('Результаты 5 главы анализа'),
+                     export_date=args.export_date)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Синтетические датасеты Pet911 любого размера с той же схемой колонок.
+
+Каждая синтетическая строка строится по случайной строке исходного
+датасета: категориальные поля (регион, статус, тип животного, окрас,
+порода, место, пол, возраст) и числовые признаки (фото, комментарии,
+контакты) копируются целиком, поэтому связи между признаками и
+успешностью поиска сохраняются. Заново создаются:
+    - id и url (уникальные, вне диапазона реальных объявлений);
+    - даты в формате "пт, 26.09.2025": дата публикации равномерно в
+      пределах исходного периода, дата события сдвинута на ту же задержку,
+      что в исходной строке;
+    - текст описания той же длины в словах: слова выбираются с частотами
+      словаря исходных описаний.
+
+Файл пишется частями, поэтому размер ограничен только диском:
+
+python3 -m src.synthetic --scale 100 --output-dir data/synthetic/x100
+"""
+import os
+
+from .config import DEFAULT_DATASETS
+from .deps import np, pd
+
+# Колонка даты события в датасетах пропаж и находок
+EVENT_DATE_COLUMNS = {
+    'lost': 'дата пропажи',
+    'found': 'дата находки',
+}
+
+# Префикс id объявления и первый номер синтетических объявлений
+ID_PREFIXES = {
+    'lost': 'rl',
+    'found': 'rf',
+}
+FIRST_SYNTHETIC_ID = 10_000_000
+
+WEEKDAYS = np.array(['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс'])
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def parse_dates(values):
+    """Даты вида "пт, 26.09.2025" -> datetime64 (NaT для пустых и нераспознанных)"""
+    return pd.to_datetime(values.str[-10:], format='%d.%m.%Y', errors='coerce')
+
+
+def format_dates(dates):
+    """datetime64 -> строки вида "пт, 26.09.2025" (пустая строка для NaT)"""
+    dates = pd.DatetimeIndex(dates)
+    weekdays = WEEKDAYS[np.nan_to_num(np.asarray(dates.weekday, dtype=float)).astype(int)]
+    text = pd.Series(weekdays, dtype=object) + ', ' + pd.Series(dates.strftime('%d.%m.%Y'), dtype=object)
+    return text.where(~dates.isna(), '').to_numpy()
+
+
+class SyntheticSource:
+    """Исходный датасет и распределения, по которым строятся синтетические строки"""
+
+    def __init__(self, source_file, ad_type):
+        self.ad_type = ad_type
+        # Все поля читаются как строки, чтобы форматы значений не менялись
+        self.df = pd.read_csv(source_file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        self.columns = list(self.df.columns)
+
+        published = parse_dates(self.df['дата_публикации'])
+        event = parse_dates(self.df[EVENT_DATE_COLUMNS[ad_type]])
+        self.first_day = published.min()
+        self.days = max((published.max() - self.first_day).days, 0) + 1
+        # Задержка публикации в днях; NaN - дата события неизвестна
+        self.delays = (published - event).dt.days.to_numpy(dtype=float)
+
+        self.url_bases = self.df['url'].str.rsplit('/', n=1).str[0].to_numpy()
+        self.lengths = pd.to_numeric(self.df['Длина_описания_в_словах'], errors='coerce').fillna(0).astype(int).to_numpy()
+
+        words = self.df['описание'].str.split().explode().dropna()
+        counts = words.value_counts()
+        self.vocabulary = counts.index.to_numpy(dtype=object)
+        self.word_probabilities = (counts / counts.sum()).to_numpy()
+
+    def descriptions(self, lengths, rng):
+        """Тексты заданной длины в словах (пустая строка для нулевой длины)"""
+        total = int(lengths.sum())
+        if total == 0 or len(self.vocabulary) == 0:
+            return np.full(len(lengths), '', dtype=object)
+
+        words = self.vocabulary[rng.choice(len(self.vocabulary), size=total, p=self.word_probabilities)]
+        texts = np.empty(len(lengths), dtype=object)
+        for index, row_words in enumerate(np.split(words, np.cumsum(lengths)[:-1])):
+            text = ' '.join(row_words)
+            texts[index] = text[:1].upper() + text[1:]
+        return texts
+
+    def chunk(self, start_id, rows, rng):
+        """Часть синтетического датасета: rows строк с id начиная с start_id"""
+        base = rng.integers(0, len(self.df), size=rows)
+        chunk = self.df.iloc[base].reset_index(drop=True)
+
+        ids = np.char.add(ID_PREFIXES[self.ad_type], np.arange(start_id, start_id + rows).astype(str))
+        chunk['id'] = ids
+        chunk['url'] = np.char.add(np.char.add(self.url_bases[base].astype(str), '/'), ids)
+
+        published = self.first_day + pd.to_timedelta(rng.integers(0, self.days, size=rows), unit='D')
+        delays = pd.to_timedelta(self.delays[base], unit='D')
+        chunk['дата_публикации'] = format_dates(published)
+        chunk[EVENT_DATE_COLUMNS[self.ad_type]] = format_dates(published - delays)
+
+        lengths = self.lengths[base]
+        chunk['описание'] = self.descriptions(lengths, rng)
+        chunk['Длина_описания_в_словах'] = lengths.astype(str)
+        chunk['наличие_описания'] = np.where(lengths > 0, 'True', 'False')
+        return chunk[self.columns]
+
+
+def generate_dataset(source, rows, output_file, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Записывает синтетический датасет из rows строк по SyntheticSource и возвращает путь к файлу"""
+    rng = np.random.default_rng(seed)
+
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+        for start in range(0, rows, chunk_rows):
+            size = min(chunk_rows, rows - start)
+            chunk = source.chunk(FIRST_SYNTHETIC_ID + start, size, rng)
+            chunk.to_csv(f, index=False, header=start == 0)
+        if rows == 0:
+            pd.DataFrame(columns=source.columns).to_csv(f, index=False)
+    return output_file
+
+
+def generate(output_dir, scale=1.0, seed=0, sources=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Создает синтетические датасеты lost и found в output_dir: в scale раз
+    больше исходных, с теми же именами файлов. Возвращает {тип: путь}.
+    """
+    sources = sources or DEFAULT_DATASETS
+    paths = {}
+    for offset, (ad_type, source_file) in enumerate(sorted(sources.items())):
+        source = SyntheticSource(source_file, ad_type)
+        rows = int(round(len(source.df) * scale))
+        output_file = os.path.join(output_dir, os.path.basename(source_file))
+        print(f"🧪 {ad_type}: {rows} строк -> {output_file}")
+        paths[ad_type] = generate_dataset(source, rows, output_file, seed + offset, chunk_rows)
+    return paths
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Генерация синтетических датасетов Pet911')
+    parser.add_argument('--output-dir', required=True, help='папка для синтетических датасетов')
+    parser.add_argument('--scale', type=float, default=1.0, help='размер относительно исходных датасетов')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.output_dir, args.scale, args.seed)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Счетчики объявлений по времени публикации: количество объявлений по дням,
+неделям и месяцам с разбивкой по типу объявления, статусу и региону.
+
+Счетчики хранятся в SQLite (results/.counters/time_counters.sqlite) отдельно
+для каждого файла датасета или партиции и пополняются инкрементально, как
+агрегатный куб (src/cube.py): из новых файлов партиций и из строк,
+дописанных в конец CSV, читаются только новые строки, поэтому ежедневное
+обновление стоит пропорционально новым данным. Объявление учитывается
+один раз по id: повторно загруженное объявление (например, со сменившимся
+статусом) заменяет прежнее, а не добавляется к счетчикам, даже если оно
+пришло в другом файле того же хранилища (новая выгрузка в партициях):
+вклад объявления вычитается из счетчиков файла, где оно было учтено.
+Хранилище - исходный CSV или корень партиций, поэтому партиции, построенные
+из CSV, не забирают объявления у самого CSV. Объявления без id не
+учитываются.
+
+Ряды для step_1_2 берутся из счетчиков без пересчета всей истории:
+
+    update('lost')
+    series('week', 'lost')  # по неделям, метка - воскресенье (как resample('W'))
+
+python3 -m src.time_counters
+"""
+import os
+import sqlite3
+import time
+import warnings
+
+from . import config
+from .caches import map_cached
+from .cube import ENCODINGS, DEFAULT_CHUNK_ROWS, appended_rows, candidate_encodings, source_change, source_state
+from .deps import pd
+from .partitions import dataset_files, normalize_filters, selects
+from .phases import phase
+
+COUNTERS_DIR = '.counters'
+DB_NAME = 'time_counters.sqlite'
+
+COLUMNS = ['id', 'дата_публикации', 'статус', 'регион']
+GRAINS = ['day', 'week', 'month']
+
+# Заполнение пропущенных недель и месяцев нулями, как при resample в step_1_2
+RESAMPLE_RULES = {'week': 'W', 'month': 'M'}
+
+# Русские сокращения дней недели в датах публикации
+RUSSIAN_TO_ENGLISH = {
+    'пн': 'Mon', 'вт': 'Tue', 'ср': 'Wed', 'чт': 'Thu',
+    'пт': 'Fri', 'сб': 'Sat', 'вс': 'Sun'
+}
+
+# Версия схемы: база с другой версией создается заново
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT, ad_type TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT, appendable INTEGER,
+    PRIMARY KEY (source, ad_type)
+);
+CREATE TABLE IF NOT EXISTS ads (
+    store TEXT, ad_type TEXT, id TEXT, source TEXT, day TEXT, status TEXT, region TEXT,
+    PRIMARY KEY (store, ad_type, id)
+);
+CREATE INDEX IF NOT EXISTS ads_source ON ads (source, ad_type);
+CREATE TABLE IF NOT EXISTS counts (
+    grain TEXT, source TEXT, ad_type TEXT, bucket TEXT, status TEXT, region TEXT, n INTEGER,
+    PRIMARY KEY (grain, source, ad_type, bucket, status, region)
+);
+"""
+
+
+def parse_publication_date(date_str):
+    """Дата публикации вида "пт, 26.09.2025" -> Timestamp (NaT, если не распознана)"""
+    try:
+        parts = date_str.split(', ')
+        if len(parts) == 2:
+            day_abbr = parts[0].strip()
+            date_part = parts[1].strip()
+
+            if day_abbr in RUSSIAN_TO_ENGLISH:
+                english_date_str = f"{RUSSIAN_TO_ENGLISH[day_abbr]}, {date_part}"
+                return pd.to_datetime(english_date_str, format='%a, %d.%m.%Y')
+
+        return pd.to_datetime(date_str, errors='coerce')
+    except (ValueError, TypeError, AttributeError):
+        # AttributeError - пустая ячейка (NaN) вместо строки
+        return pd.NaT
+
+
+# ----------------------------- Хранилище -----------------------------
+def db_path():
+    return config.results_path(COUNTERS_DIR, DB_NAME)
+
+
+def connect():
+    path = db_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS ads; DROP TABLE IF EXISTS counts;"
+                           f"PRAGMA user_version = {SCHEMA_VERSION};")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def buckets(days, grain):
+    """Метки периодов для дат: день, воскресенье недели или последний день месяца"""
+    if grain == 'week':
+        days = days + pd.to_timedelta(6 - days.dt.dayofweek, unit='D')
+    elif grain == 'month':
+        days = days + pd.offsets.MonthEnd(0)
+    return days.dt.strftime('%Y-%m-%d')
+
+
+def add_records(conn, frame, ad_type, source, store):
+    """
+    Добавляет объявления (колонки COLUMNS) к счетчикам файла source.
+    Объявление с уже учтенным в хранилище store id заменяет прежнее, в каком
+    бы файле оно ни было учтено. Возвращает число объявлений.
+    """
+    records = pd.DataFrame({
+        'id': frame['id'],
+        'day': pd.to_datetime(map_cached(frame['дата_публикации'], parse_publication_date)),
+        'status': frame['статус'].fillna(''),
+        'region': frame['регион'].fillna(''),
+    }).dropna(subset=['id']).drop_duplicates('id', keep='last')
+    if records.empty:
+        return 0
+    records['id'] = records['id'].astype(str)
+    records['day'] = records['day'].dt.strftime('%Y-%m-%d').where(records['day'].notna(), None)
+
+    # Прежние записи объявлений из этой порции вычитаются из счетчиков файлов, где они были учтены
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch (id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM batch")
+    conn.executemany("INSERT INTO batch VALUES (?)", ((ad_id,) for ad_id in records['id']))
+    previous = pd.read_sql_query(
+        "SELECT source, day, status, region FROM ads JOIN batch USING (id) WHERE store = ? AND ad_type = ?",
+        conn, params=(store, ad_type))
+
+    changes = pd.concat([records[['day', 'status', 'region']].assign(source=source, n=1), previous.assign(n=-1)],
+                        ignore_index=True).dropna(subset=['day'])
+    if not changes.empty:
+        days = pd.to_datetime(changes['day'])
+        for grain in GRAINS:
+            delta = changes.assign(bucket=buckets(days, grain)).groupby(
+                ['source', 'bucket', 'status', 'region'])['n'].sum()
+            delta = delta[delta != 0]
+            conn.executemany(
+                "INSERT INTO counts VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (grain, source, ad_type, bucket, status, region) DO UPDATE SET n = n + excluded.n",
+                ((grain, ad_source, ad_type, bucket, status, region, int(n))
+                 for (ad_source, bucket, status, region), n in delta.items()))
+        conn.execute("DELETE FROM counts WHERE n = 0")
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO ads VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((store, ad_type, ad_id, source, day, status, region)
+         for ad_id, day, status, region in records[['id', 'day', 'status', 'region']].itertuples(index=False)))
+    return len(records)
+
+
+def remove_source(conn, source, ad_type):
+    for table in ('ads', 'counts', 'sources'):
+        conn.execute(f"DELETE FROM {table} WHERE source = ? AND ad_type = ?", (source, ad_type))
+
+
+def stored_state(conn, source, ad_type):
+    row = conn.execute("SELECT size, mtime_ns, digest, appendable FROM sources WHERE source = ? AND ad_type = ?",
+                       (source, ad_type)).fetchone()
+    if row is None:
+        return None
+    return {'size': row[0], 'mtime_ns': row[1], 'digest': row[2], 'appendable': bool(row[3])}
+
+
+def ingest_csv(conn, csv_source, ad_type, source, store, encoding, chunk_rows=None):
+    """Добавляет объявления из CSV (пути или открытого двоичного файла), прочитанного частями"""
+    added = 0
+    reader = iter(pd.read_csv(csv_source, usecols=COLUMNS, dtype=str, chunksize=chunk_rows or DEFAULT_CHUNK_ROWS,
+                              encoding=encoding))
+    while True:
+        with phase('load'):
+            chunk = next(reader, None)
+        if chunk is None:
+            return added
+        added += add_records(conn, chunk, ad_type, source, store)
+
+
+def ingest_file(conn, source_file, ad_type, store, chunk_rows=None):
+    """
+    Пополняет счетчики из файла датасета или партиции хранилища store:
+    только дописанные строки или весь файл, если он новый или изменился.
+    Возвращает число прочитанных объявлений (None - файл не изменился).
+    """
+    source = os.path.abspath(source_file)
+    stored = stored_state(conn, source, ad_type)
+    change = source_change(source_file, stored)
+    if change is None:
+        return None
+
+    state = source_state(source_file)
+    for encoding in candidate_encodings(source_file):
+        try:
+            # Файл учитывается целиком в одной транзакции: при ошибке счетчики не меняются
+            with conn:
+                added = 0
+                if change == 'изменен':
+                    remove_source(conn, source, ad_type)
+                    added = ingest_csv(conn, source_file, ad_type, source, store, encoding, chunk_rows)
+                elif change == 'дописан':
+                    with appended_rows(source_file, stored['size']) as tail:
+                        added = ingest_csv(conn, tail, ad_type, source, store, encoding, chunk_rows)
+                conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                             (source, ad_type, state['size'], state['mtime_ns'], state['digest'],
+                              int(state['appendable'])))
+            return added if change != 'проверен' else None
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Не удалось прочитать {source_file} в кодировках {', '.join(ENCODINGS)}")
+
+
+# ----------------------------- Доступ для шагов -----------------------------
+def update(ad_type, filters=None, chunk_rows=None, source_file=None):
+    """
+    Пополняет счетчики датасета ad_type: исходного файла (по умолчанию из
+    src/config.py) или отобранных фильтрами партиций
+    """
+    source_file = source_file or config.dataset_path(ad_type)
+    files = dataset_files(source_file, ad_type, filters)
+    # Объявления учитываются один раз в пределах CSV или всего корня партиций
+    store = os.path.abspath(config.partitions_root() if normalize_filters(filters) else source_file)
+    started = time.perf_counter()
+    updated = added = 0
+    conn = connect()
+    try:
+        for path in files:
+            count = ingest_file(conn, path, ad_type, store, chunk_rows)
+            if count is not None:
+                updated += 1
+                added += count
+    finally:
+        conn.close()
+
+    if updated:
+        print(f"🕒 Счетчики {ad_type}: прочитано {added} объявлений (обновлено файлов: {updated} из {len(files)}) "
+              f"за {time.perf_counter() - started:.1f} с")
+
+
+def ensure(ad_types, filters=None, chunk_rows=None):
+    """Пополняет счетчики заранее, до запуска шагов в отдельных процессах"""
+    for ad_type in ad_types:
+        if selects(filters, ad_type):
+            update(ad_type, filters, chunk_rows)
+
+
+def series(grain, ad_type, filters=None, source_file=None, status=None, region=None):
+    """
+    Количество объявлений по периодам grain ('day', 'week', 'month') для
+    отобранных файлов датасета; status и region сужают выборку. Дни - только
+    дни с объявлениями, недели и месяцы - все периоды между первым и
+    последним (пустые - с нулем), как при resample.
+    """
+    files = dataset_files(source_file or config.dataset_path(ad_type), ad_type, filters)
+    # Отобранные файлы - через временную таблицу: партиций может быть больше,
+    # чем допустимо параметров в одном запросе SQLite
+    query = "SELECT bucket, SUM(n) FROM counts JOIN selected USING (source) WHERE grain = ? AND ad_type = ?"
+    params = [grain, ad_type]
+    for column, value in (('status', status), ('region', region)):
+        if value is not None:
+            query += f" AND {column} = ?"
+            params.append(value)
+    query += " GROUP BY bucket HAVING SUM(n) > 0 ORDER BY bucket"
+
+    conn = connect()
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected (source TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM selected")
+        conn.executemany("INSERT OR IGNORE INTO selected VALUES (?)", ((os.path.abspath(path),) for path in files))
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+    counts = pd.Series([n for _, n in rows], index=pd.to_datetime([bucket for bucket, _ in rows]),
+                       dtype='int64').rename_axis('дата_публикации')
+    if grain in RESAMPLE_RULES and len(counts):
+        with warnings.catch_warnings():
+            # Правило 'M' - то же, что в step_1_2 (в новых версиях pandas - 'ME')
+            warnings.simplefilter('ignore', FutureWarning)
+            counts = counts.resample(RESAMPLE_RULES[grain]).sum()
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Пополнение счетчиков объявлений по времени')
+    parser.add_argument('--output-dir', default=config.DEFAULT_RESULTS_DIR, help='папка результатов')
+    args = parser.parse_args()
+
+    config.configure(results_dir=args.output_dir)
+    ensure(config.datasets())
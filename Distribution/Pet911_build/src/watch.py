@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Режим наблюдения: конвейер перезапускается при изменении данных или кода.
+
+Процесс следит за датасетами (и CSV рядом с ними в папке data), файлом
+пакетного прогноза и исходными файлами src/*.py. После изменения
+запускается обычный конвейер (src/pipeline.py): шаги, отпечаток входов
+которых не изменился, переиспользуются, а остальные пересчитываются в
+порядке зависимостей - например, правка step_3_1 пересчитывает step_3_1,
+а затем статистику для step_3_2. Шаги выполняются в этом же процессе,
+поэтому прочитанные датасеты остаются в памяти между запусками
+(partitions.enable_frame_cache), а измененные модули шагов
+перезагружаются. При изменении общих модулей процесс перезапускается
+целиком.
+
+python3 main.py --watch
+python3 main.py --watch --only step_4_1 step_4_2 --profile preview
+"""
+import glob
+import importlib
+import os
+import sys
+import time
+import traceback
+
+from . import caches, config, partitions
+from .build_cache import SRC_DIR
+from .pipeline import run_pipeline
+
+DEFAULT_INTERVAL = 1.0
+
+
+def watched_files(params):
+    """Файлы, изменение которых перезапускает конвейер"""
+    files = set(glob.glob(os.path.join(SRC_DIR, '*.py')))
+    for path in config.datasets().values():
+        files.add(path)
+        files.update(glob.glob(os.path.join(os.path.dirname(path) or '.', '*.csv')))
+    if params.get('filters'):
+        files.update(glob.glob(os.path.join(config.partitions_root(), '**', '*.csv'), recursive=True))
+    if params.get('ads_file'):
+        files.add(params['ads_file'])
+    return {os.path.abspath(path) for path in files}
+
+
+def snapshot(params):
+    """Состояние наблюдаемых файлов {путь: (размер, mtime)}"""
+    return {path: partitions.file_state(path) for path in watched_files(params)}
+
+
+def changed_files(before, after):
+    return sorted(path for path in before.keys() | after.keys() if before.get(path) != after.get(path))
+
+
+def wait_for_changes(state, params, interval):
+    """
+    Ждет изменения наблюдаемых файлов и возвращает (новое состояние, измененные
+    файлы). Изменение засчитывается, когда файлы перестали меняться: редакторы
+    и выгрузки пишут файл в несколько приемов.
+    """
+    while True:
+        time.sleep(interval)
+        current = snapshot(params)
+        if current == state:
+            continue
+        while True:
+            time.sleep(interval)
+            settled = snapshot(params)
+            if settled == current:
+                return current, changed_files(state, current)
+            current = settled
+
+
+def is_step_module(path):
+    name = os.path.basename(path)
+    return os.path.dirname(path) == SRC_DIR and name.startswith('step_') and name.endswith('.py')
+
+
+def reload_steps(paths):
+    """
+    Перезагружает измененные модули шагов, уже импортированные в процессе.
+    Возвращает False, если модуль не загрузился (например, синтаксическая ошибка).
+    """
+    caches.clear_parsed()
+    for path in paths:
+        module = sys.modules.get(f"{__package__}.{os.path.basename(path)[:-3]}")
+        if module is None:
+            continue
+        try:
+            importlib.reload(module)
+        except Exception as e:
+            print(f"❌ {os.path.basename(path)}: модуль не загружен, ожидание исправления")
+            print(''.join(traceback.format_exception(e)).rstrip())
+            return False
+    return True
+
+
+def restart():
+    """Перезапускает процесс с теми же аргументами, кроме --force (изменился общий модуль)"""
+    print("🔄 Изменены общие модули, перезапуск процесса")
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable] + [arg for arg in sys.argv if arg != '--force'])
+
+
+def run_once(step_names, params, render_workers, profile, force=False):
+    """Запуск конвейера; ошибка шага не останавливает наблюдение"""
+    started = time.perf_counter()
+    try:
+        rebuilt, reused = run_pipeline(step_names, params, force=force, workers=1, render_workers=render_workers,
+                                       profile=profile)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    duration = time.perf_counter() - started
+    print(f"👀 Пересчитано: {', '.join(rebuilt) or 'ничего'}; переиспользовано шагов: {len(reused)} "
+          f"({duration:.1f} с)")
+
+
+def watch(step_names=None, params=None, force=False, render_workers=None, profile='publication',
+          interval=DEFAULT_INTERVAL):
+    """
+    Выполняет шаги (force=True - с очисткой результатов, только первый запуск)
+    и перезапускает их при изменении наблюдаемых файлов до Ctrl+C. Шаги
+    выполняются по очереди в этом процессе (workers=1), чтобы датасеты и
+    импортированные модули оставались в памяти.
+    """
+    params = params or {}
+    partitions.enable_frame_cache()
+
+    state = snapshot(params)
+    run_once(step_names, params, render_workers, profile, force)
+    print(f"👀 Наблюдение за изменениями данных и кода (каждые {interval:g} с), Ctrl+C - выход")
+
+    while True:
+        state, changed = wait_for_changes(state, params, interval)
+        print(f"\n✏️ Изменены файлы: {', '.join(os.path.relpath(path) for path in changed)}")
+
+        sources = [path for path in changed if os.path.dirname(path) == SRC_DIR]
+        if any(not is_step_module(path) for path in sources):
+            restart()
+        if reload_steps(sources):
+            run_once(step_names, params, render_workers, profile)